@@ -0,0 +1,87 @@
+# Benchmark of the processed events output formats: write time, file size and load time of
+# .json (indent=2), .jsonl and .siemcol, loaded as the EventBatch the UI model keeps in memory.
+# The legacy json.load of the whole indent=2 file is measured as the baseline.
+# bash : python -m benchmarks.bench_event_file_formats --events 200000 --output bench_event_file_formats.json
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from src.basic_functions.add_threat_level_by_priority import add_threat_level_by_priority
+from src.basic_functions.normalize_event_datetime import epoch_to_normalized_datetime
+from src.compact_events.event_batch import EventBatch
+from src.compact_events.event_file_formats import read_processed_events, write_processed_events
+from helpers.data_generator import EVENT_TYPES
+
+
+def generate_processed_events(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    events = []
+    for _ in range(count):
+        event = {
+            'datetime': epoch_to_normalized_datetime(rng.randrange(1_700_000_000, 1_760_000_000)) if rng.random() > 0.01 else 'Unknown Format',
+            'source_ip': '.'.join(str(rng.randrange(256)) for _ in range(4)),
+            'destination_ip': '.'.join(str(rng.randrange(256)) for _ in range(4)),
+            'port': rng.choice((22, 80, 443, 3389, 8080, rng.randrange(1, 65536))),
+            'event_type': rng.choice(EVENT_TYPES),
+        }
+        events.append(add_threat_level_by_priority(event))
+    return events
+
+
+def _timed(function, *args) -> Any:
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def _load_legacy_json(file_path: str) -> EventBatch:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return EventBatch(json.load(f))
+
+
+def run_benchmark(count: int, repeat: int = 3) -> Dict[str, Any]:
+    events = generate_processed_events(count)
+    results: Dict[str, Any] = {'events': count, 'formats': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for extension in ('json', 'jsonl', 'siemcol'):
+            file_path = os.path.join(directory, f'processed_events.{extension}')
+            _, write_seconds = _timed(write_processed_events, events, file_path)
+            load_seconds = min(_timed(read_processed_events, file_path)[1] for _ in range(repeat))
+            batch = read_processed_events(file_path)
+            assert len(batch) == count
+            results['formats'][extension] = {
+                'file_bytes': os.path.getsize(file_path),
+                'write_seconds': round(write_seconds, 4),
+                'load_seconds': round(load_seconds, 4),
+                'load_events_per_second': round(count / load_seconds) if load_seconds else None,
+            }
+        legacy_seconds = min(_timed(_load_legacy_json, os.path.join(directory, 'processed_events.json'))[1] for _ in range(repeat))
+        results['legacy_json_load_seconds'] = round(legacy_seconds, 4)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=100000, help='number of processed events (default: 100000)')
+    parser.add_argument('--repeat', type=int, default=3, help='load repetitions, the best time is kept (default: 3)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.events, args.repeat)
+    print(f"{'format':<10}{'size (MB)':>12}{'write (s)':>12}{'load (s)':>12}{'events/s':>14}")
+    for extension, result in results['formats'].items():
+        print(f"{extension:<10}{result['file_bytes'] / 1e6:>12.1f}{result['write_seconds']:>12.3f}"
+              f"{result['load_seconds']:>12.3f}{result['load_events_per_second']:>14,}")
+    print(f"legacy json.load + EventBatch: {results['legacy_json_load_seconds']:.3f} s")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+# Throughput benchmark of the processing pipeline on reproducible datasets built with the bulk mode of helpers/data_generator.py.
+# Every dataset is defined by its number of events, the seed, the mix of datetime formats and the ratio of malformed
+# lines, and is cached on disk, so two runs with the same parameters process the same bytes.
+# For every dataset it measures events/sec (best of "repeat" runs) and the peak memory allocated (tracemalloc, in a
+# separate run so the tracing does not slow down the timed runs) of:
+#   read       read_events_from_file
+#   normalize  normalize_event_datetime over the events read
+#   enrich     add_threat_level_by_priority over the normalized events
+#   enrich_batch  add_threat_level_by_priority_to_batch over an EventBatch of the normalized events
+#   combined   combine_read_file_normalize_timestamp_add_threat_level
+#   stream     stream_read_file_normalize_timestamp_add_threat_level (constant memory version)
+# The results are written to a JSON file, --compare reports the change against a previous results file.
+# bash : python -m benchmarks.bench_pipeline --sizes 10k,100k,1M --output benchmark_results.json
+# bash : python -m benchmarks.bench_pipeline --sizes 10k,100k,1M --compare benchmark_results.json
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from helpers.data_generator import DATETIME_FORMATS, generate_siem_events_file
+from src.basic_functions.add_threat_level_by_priority import add_threat_level_by_priority
+from src.basic_functions.normalize_event_datetime import normalize_event_datetime
+from src.basic_functions.read_events_from_file import read_events_from_file
+from src.compact_events.batch_enrichment import add_threat_level_by_priority_to_batch
+from src.compact_events.event_batch import EventBatch
+from src.complex_processor_functions.combined_processor_functions import (
+    combine_read_file_normalize_timestamp_add_threat_level,
+    stream_read_file_normalize_timestamp_add_threat_level
+)
+
+
+TARGETS = ('read', 'normalize', 'enrich', 'enrich_batch', 'combined', 'stream')
+
+DEFAULT_SIZES = '10k,100k,1M'
+DEFAULT_SEED = 42
+
+# The datasets end at a fixed date, so the seed is the only source of variation
+DATASET_END_DATE = datetime(2025, 1, 1)
+
+# A regression is reported when the events/sec of a measure drops more than this ratio
+DEFAULT_TOLERANCE = 0.10
+
+# Part of the dataset file names, changed when the generator draws the values in another way
+DATASET_VERSION = 2
+
+
+def parse_size(size: str) -> int:
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    size = size.strip().lower()
+    if size and size[-1] in multipliers:
+        return int(float(size[:-1]) * multipliers[size[-1]])
+    return int(size)
+
+
+# "with_zulu=2,without_timezone=1" -> {'with_zulu': 2.0, 'without_timezone': 1.0}, empty -> every format with weight 1
+def parse_datetime_mix(mix: Optional[str]) -> Dict[str, float]:
+    if not mix:
+        return {datetime_format: 1.0 for datetime_format in DATETIME_FORMATS}
+    weights = {}
+    for item in mix.split(','):
+        datetime_format, _, weight = item.partition('=')
+        datetime_format = datetime_format.strip()
+        if datetime_format not in DATETIME_FORMATS:
+            raise ValueError(f"Unknown datetime format '{datetime_format}', use one of {DATETIME_FORMATS}")
+        weights[datetime_format] = float(weight or 1)
+    return weights
+
+
+def dataset_path(data_dir: str, count: int, seed: int, datetime_mix: Dict[str, float], malformed_ratio: float) -> str:
+    mix = '-'.join(f"{datetime_format}{weight:g}" for datetime_format, weight in sorted(datetime_mix.items()))
+    return os.path.join(data_dir, f"events_v{DATASET_VERSION}_{count}_seed{seed}_{mix}_malformed{malformed_ratio:g}.txt")
+
+
+# Write the dataset file (if it does not exist yet) and return its path
+def generate_dataset(data_dir: str, count: int, seed: int = DEFAULT_SEED,
+                     datetime_mix: Optional[Dict[str, float]] = None, malformed_ratio: float = 0.0) -> str:
+    datetime_mix = datetime_mix or parse_datetime_mix(None)
+    file_path = dataset_path(data_dir, count, seed, datetime_mix, malformed_ratio)
+    if os.path.exists(file_path):
+        return file_path
+
+    os.makedirs(data_dir, exist_ok=True)
+    temporary_path = f"{file_path}.tmp"
+    generate_siem_events_file(temporary_path, count, seed=seed, datetime_weights=datetime_mix,
+                              malformed_ratio=malformed_ratio, end_date=DATASET_END_DATE)
+    os.replace(temporary_path, file_path)
+    return file_path
+
+
+# Every target returns (setup, run): setup prepares the input outside of the measure and run returns the events handled
+def _target(name: str, file_path: str) -> Tuple[Callable[[], Any], Callable[[Any], int]]:
+    if name == 'read':
+        return lambda: None, lambda _: len(read_events_from_file(file_path))
+    if name == 'normalize':
+        return lambda: read_events_from_file(file_path), lambda events: len([normalize_event_datetime(event) for event in events])
+    if name == 'enrich':
+        return (lambda: [normalize_event_datetime(event) for event in read_events_from_file(file_path)],
+                lambda events: len([add_threat_level_by_priority(event) for event in events]))
+    if name == 'enrich_batch':
+        return (lambda: EventBatch(normalize_event_datetime(event) for event in read_events_from_file(file_path)),
+                lambda batch: len(add_threat_level_by_priority_to_batch(batch)))
+    if name == 'combined':
+        return lambda: None, lambda _: len(combine_read_file_normalize_timestamp_add_threat_level(file_path, max_events=None))
+    if name == 'stream':
+        return lambda: None, lambda _: sum(1 for _ in stream_read_file_normalize_timestamp_add_threat_level(file_path))
+    raise ValueError(f"Unknown benchmark target '{name}', use one of {TARGETS}")
+
+
+def measure(name: str, file_path: str, repeat: int = 3, memory: bool = True) -> Dict[str, Any]:
+    setup, run = _target(name, file_path)
+    best_seconds = None
+    events = 0
+    for _ in range(repeat):
+        data = setup()
+        gc.collect()
+        start = time.perf_counter()
+        events = run(data)
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+        del data
+
+    result = {
+        'target': name,
+        'events': events,
+        'seconds': round(best_seconds, 6),
+        'events_per_second': round(events / best_seconds) if best_seconds else None,
+        'peak_memory_bytes': None,
+    }
+    if memory:
+        data = setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            run(data)
+            result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes: List[int], data_dir: str, seed: int = DEFAULT_SEED,
+                   datetime_mix: Optional[Dict[str, float]] = None, malformed_ratio: float = 0.0,
+                   targets: Tuple[str, ...] = TARGETS, repeat: int = 3, memory: bool = True,
+                   log: Callable[[str], None] = lambda message: None) -> Dict[str, Any]:
+    datetime_mix = datetime_mix or parse_datetime_mix(None)
+    results: Dict[str, Any] = {
+        'environment': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'parameters': {
+            'seed': seed,
+            'datetime_mix': datetime_mix,
+            'malformed_ratio': malformed_ratio,
+            'repeat': repeat,
+        },
+        'datasets': [],
+    }
+    for count in sizes:
+        start = time.perf_counter()
+        file_path = generate_dataset(data_dir, count, seed, datetime_mix, malformed_ratio)
+        log(f"dataset {count:,} events: {file_path} ({time.perf_counter() - start:.1f} s)")
+        dataset = {'events': count, 'file_bytes': os.path.getsize(file_path), 'results': []}
+        for name in targets:
+            result = measure(name, file_path, repeat, memory)
+            dataset['results'].append(result)
+            peak = result['peak_memory_bytes']
+            log(f"  {name:<10}{result['events_per_second']:>14,} events/s"
+                + (f"{peak / 1e6:>12.1f} MB peak" if peak is not None else ''))
+        results['datasets'].append(dataset)
+    return results
+
+
+# Changes of events/sec against a previous results file, keyed by (dataset events, target)
+def compare_results(current: Dict[str, Any], previous: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[Dict[str, Any]]:
+    previous_rates = {
+        (dataset['events'], result['target']): result['events_per_second']
+        for dataset in previous.get('datasets', [])
+        for result in dataset['results']
+    }
+    changes = []
+    for dataset in current['datasets']:
+        for result in dataset['results']:
+            before = previous_rates.get((dataset['events'], result['target']))
+            if not before or not result['events_per_second']:
+                continue
+            ratio = result['events_per_second'] / before
+            changes.append({
+                'events': dataset['events'],
+                'target': result['target'],
+                'previous_events_per_second': before,
+                'events_per_second': result['events_per_second'],
+                'ratio': round(ratio, 3),
+                'regression': ratio < 1 - tolerance,
+            })
+    return changes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Throughput benchmark of the SIEM event processing pipeline')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'comma separated dataset sizes, e.g. 10k,1M,10M (default: {DEFAULT_SIZES})')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help=f'dataset seed (default: {DEFAULT_SEED})')
+    parser.add_argument('--datetime-mix', help=f'weights of the datetime formats, e.g. with_zulu=3,without_timezone=1 (formats: {", ".join(DATETIME_FORMATS)})')
+    parser.add_argument('--malformed-ratio', type=float, default=0.0, help='ratio of malformed lines (default: 0)')
+    parser.add_argument('--targets', default=','.join(TARGETS), help=f'comma separated targets (default: {",".join(TARGETS)})')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per measure, the best one is kept (default: 3)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'siem_benchmark_datasets'),
+                        help='directory of the cached datasets')
+    parser.add_argument('--output', default='benchmark_results.json', help='results file (default: benchmark_results.json)')
+    parser.add_argument('--compare', help='previous results file, exits with 1 when a measure regressed')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help=f'allowed events/sec drop for --compare (default: {DEFAULT_TOLERANCE})')
+    args = parser.parse_args(argv)
+
+    targets = tuple(target.strip() for target in args.targets.split(','))
+    for target in targets:
+        if target not in TARGETS:
+            parser.error(f"unknown target '{target}', use one of {', '.join(TARGETS)}")
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+
+    results = run_benchmarks(
+        [parse_size(size) for size in args.sizes.split(',')],
+        args.data_dir,
+        seed=args.seed,
+        datetime_mix=parse_datetime_mix(args.datetime_mix),
+        malformed_ratio=args.malformed_ratio,
+        targets=targets,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        log=print
+    )
+
+    exit_code = 0
+    if previous is not None:
+        compared_parameters = ('seed', 'datetime_mix', 'malformed_ratio')
+        if any(previous.get('parameters', {}).get(key) != results['parameters'][key] for key in compared_parameters):
+            print(f"Warning: '{args.compare}' was measured with other dataset parameters, the comparison is not reliable.")
+        results['comparison'] = compare_results(results, previous, args.tolerance)
+        for change in results['comparison']:
+            marker = '  REGRESSION' if change['regression'] else ''
+            print(f"{change['events']:>12,} {change['target']:<10}{change['ratio']:>8.2f}x{marker}")
+        if any(change['regression'] for change in results['comparison']):
+            exit_code = 1
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results archived in '{args.output}'.")
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,12 @@
 # Data generator for SIEM event log file processor within the network security domain
-# Uses Faker library to generate realistic test data and demo data
+# Uses Faker library to generate realistic test data and demo data, and a bulk mode based on pre-generated pools
+# to write large load test files
 
+from datetime import datetime, timedelta
 from faker import Faker
 import random
+from socket import inet_ntoa
+from typing import Dict, Iterator, List, Optional
 
 
 
@@ -33,25 +37,43 @@ DATETIME_FORMATS = [
     'with_plus_timezone'     # 2024-09-02 09:10:00 +0000
 ]
 
-# Generate a single realistic SIEM event with random data, asigne a DateTime format, and returns this data as a dictionary
-def generate_siem_event(datetime_format: str = None) -> dict:
+# strftime layout of every datetime format, the rest of formats use DEFAULT_DATETIME_LAYOUT
+DATETIME_LAYOUTS = {
+    'with_timezone_offset': '%Y/%m/%d %H:%M:%S-0400',
+    'with_zulu': '%Y-%m-%dT%H:%M:%SZ',
+    'without_timezone': '%m-%d-%Y %H:%M:%S',
+    'with_plus_timezone': '%Y-%m-%d %H:%M:%S +0000',
+}
+DEFAULT_DATETIME_LAYOUT = '%Y-%m-%d %H:%M:%S'
+
+PORTS = [22, 80, 443, 3389, 8080, 3306, 5432]
+
+# Kinds of malformed lines injected by the bulk generator, used in turns
+MALFORMED_KINDS = ['invalid_field_count', 'invalid_priority', 'empty_fields', 'unparseable_datetime']
+
+# Lines generated and written at once by the bulk generator
+BULK_CHUNK_SIZE = 100000
+
+# Distinct IPv4 addresses drawn by the bulk generator
+IP_POOL_SIZE = 1 << 16
+
+# Days covered by the generated datetimes
+DAYS_RANGE = 30
+
+# Generate a single realistic SIEM event with random data, asigne a DateTime format, and returns this data as a dictionary.
+# The datetime is in the 30 days before "end_date" (default: now), a fixed end_date makes seeded data reproducible
+def generate_siem_event(datetime_format: str = None, end_date: datetime = None) -> dict:
     if datetime_format is None:
         datetime_format = random.choice(DATETIME_FORMATS)
     
     # Generate random datetime
-    dt = fake.date_time_between(start_date='-30d', end_date='now')
+    if end_date is None:
+        dt = fake.date_time_between(start_date=f'-{DAYS_RANGE}d', end_date='now')
+    else:
+        dt = fake.date_time_between(start_date=end_date - timedelta(days=DAYS_RANGE), end_date=end_date)
     
     # Format datetime based on specified format
-    if datetime_format == 'with_timezone_offset':
-        formatted_dt = dt.strftime('%Y/%m/%d %H:%M:%S-0400')
-    elif datetime_format == 'with_zulu':
-        formatted_dt = dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-    elif datetime_format == 'without_timezone':
-        formatted_dt = dt.strftime('%m-%d-%Y %H:%M:%S')
-    elif datetime_format == 'with_plus_timezone':
-        formatted_dt = dt.strftime('%Y-%m-%d %H:%M:%S +0000')
-    else:
-        formatted_dt = dt.strftime('%Y-%m-%d %H:%M:%S')
+    formatted_dt = dt.strftime(DATETIME_LAYOUTS.get(datetime_format, DEFAULT_DATETIME_LAYOUT))
     
     event_type = random.choice(EVENT_TYPES)
     priority = assign_priority_by_event_type(event_type)
@@ -60,7 +82,7 @@ def generate_siem_event(datetime_format: str = None) -> dict:
         'datetime': formatted_dt,
         'source_ip': fake.ipv4(),
         'destination_ip': fake.ipv4(),
-        'port': random.choice([22, 80, 443, 3389, 8080, 3306, 5432]),
+        'port': random.choice(PORTS),
         'event_type': event_type,
         'priority': priority
     }
@@ -116,3 +138,100 @@ def generate_test_data_with_edge_cases() -> str:
 # Generate demo data with varied datetime formats, returns this data as a string
 def generate_demo_data(count: int = 10) -> str:
     return generate_siem_events_csv(count=count, include_edge_cases=False)
+
+
+# Build a malformed line of the given kind from the fields of a valid line
+def generate_malformed_line(kind: str, fields: List[str]) -> str:
+    datetime_field, source_ip, destination_ip, port, event_type, priority = fields
+    if kind == 'invalid_field_count':
+        return f"{datetime_field},{source_ip}"
+    if kind == 'invalid_priority':
+        return f"{datetime_field},{source_ip},{destination_ip},{port},{event_type},notanumber"
+    if kind == 'empty_fields':
+        return f"{datetime_field},,{destination_ip},"
+    if kind == 'unparseable_datetime':
+        return f"not a date,{source_ip},{destination_ip},{port},{event_type},{priority}"
+    raise ValueError(f"Unknown malformed line kind '{kind}', use one of {MALFORMED_KINDS}")
+
+
+# Bulk mode: yield the CSV lines in chunks of "chunk_size". Instead of calling Faker for every event, the values are
+# drawn in batches (random.Random.choices) from pools generated once: the date part of every format for each day,
+# the 86400 "HH:MM:SS" times, IPv4 addresses and the "port,event_type,priority" tails. The same seed, end_date and
+# chunk_size always give the same lines. "datetime_weights" sets the mix of DATETIME_FORMATS (default: the same weight for all)
+# and "malformed_ratio" the ratio of malformed lines (MALFORMED_KINDS in turns)
+def iter_siem_event_lines_bulk(
+        count: int,
+        seed: Optional[int] = None,
+        datetime_weights: Optional[Dict[str, float]] = None,
+        malformed_ratio: float = 0.0,
+        end_date: Optional[datetime] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        ip_pool_size: int = IP_POOL_SIZE) -> Iterator[List[str]]:
+    rng = random.Random(seed)
+    end_date = (end_date or datetime.now()).replace(microsecond=0)
+    start_date = end_date - timedelta(days=DAYS_RANGE)
+    datetime_weights = datetime_weights or {datetime_format: 1 for datetime_format in DATETIME_FORMATS}
+
+    # Every layout is split in the part before the time and the part after it
+    first_day = datetime(start_date.year, start_date.month, start_date.day)
+    days = [first_day + timedelta(days=day) for day in range((end_date - first_day).days + 1)]
+    layouts = []
+    for datetime_format in datetime_weights:
+        layout = DATETIME_LAYOUTS.get(datetime_format, DEFAULT_DATETIME_LAYOUT)
+        prefix, _, suffix = layout.partition('%H:%M:%S')
+        layouts.append(([day.strftime(prefix) for day in days], suffix))
+    times = [f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}" for second in range(86400)]
+    ip_pool = [inet_ntoa(rng.getrandbits(32).to_bytes(4, 'big')) for _ in range(ip_pool_size)]
+    tails = [f"{port},{event_type},{assign_priority_by_event_type(event_type)}" for port in PORTS for event_type in EVENT_TYPES]
+
+    offset_of_first_day = int((start_date - first_day).total_seconds())
+    span = int((end_date - start_date).total_seconds()) + 1
+    malformed_carry = 0.0
+    malformed_count = 0
+    generated = 0
+    while generated < count:
+        size = min(chunk_size, count - generated)
+        seconds = [offset_of_first_day + int(value * span) for value in [rng.random() for _ in range(size)]]
+        chosen_layouts = rng.choices(layouts, weights=list(datetime_weights.values()), k=size)
+        lines = [
+            f"{day_prefixes[second // 86400]}{times[second % 86400]}{suffix},{source_ip},{destination_ip},{tail}"
+            for (day_prefixes, suffix), second, source_ip, destination_ip, tail in zip(
+                chosen_layouts, seconds, rng.choices(ip_pool, k=size), rng.choices(ip_pool, k=size),
+                rng.choices(tails, k=size))
+        ]
+
+        if malformed_ratio:
+            # The exact ratio is kept across chunks, the positions are random
+            malformed_carry += size * malformed_ratio
+            malformed_in_chunk = min(size, int(malformed_carry))
+            malformed_carry -= malformed_in_chunk
+            for position in sorted(rng.sample(range(size), malformed_in_chunk)):
+                kind = MALFORMED_KINDS[malformed_count % len(MALFORMED_KINDS)]
+                lines[position] = generate_malformed_line(kind, lines[position].split(','))
+                malformed_count += 1
+
+        generated += size
+        yield lines
+
+
+# Write a bulk generated event log file chunk by chunk, so the memory does not grow with "count".
+# The edge cases of generate_siem_events_csv are appended at the end with include_edge_cases. Returns the lines written
+def generate_siem_events_file(
+        file_path: str,
+        count: int,
+        seed: Optional[int] = None,
+        datetime_weights: Optional[Dict[str, float]] = None,
+        include_edge_cases: bool = False,
+        malformed_ratio: float = 0.0,
+        end_date: Optional[datetime] = None,
+        chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    written = 0
+    with open(file_path, mode='w', encoding='utf-8') as f:
+        for lines in iter_siem_event_lines_bulk(count, seed, datetime_weights, malformed_ratio, end_date, chunk_size):
+            f.write('\n'.join(lines) + '\n')
+            written += len(lines)
+        if include_edge_cases:
+            f.write("linea,invalida\n")
+            f.write("2024/09/01 14:23:01-0400,192.168.1.10,172.16.0.1,443,LOGIN_FAILED,notanumber\n")
+            written += 2
+    return written
@@ -1,8 +1,9 @@
 # Add threat level to the event based on priority, include on the dictionary, using an scale of 1 to 5
 
-from typing import Any, Dict 
+from typing import Any, Dict, Optional
 import logging 
-from src.basic_functions.assign_priority_by_event_type import assign_priority_by_event_type
+from src.instrumentation import pipeline_metrics
+from src.rule_engine.classification_rules import RuleSet, get_active_rule_set
 
 
 THREAT_LEVEL_MAP = {
@@ -11,24 +12,37 @@ THREAT_LEVEL_MAP = {
     (5,): "High"
 }
 
-# First, try to assign/update priority based on event_type if it exists
-def add_threat_level_by_priority(event: Dict[str, Any]) -> Dict[str, Any]:
-    event_type = event.get('event_type')
-    if event_type:
-        new_priority = assign_priority_by_event_type(event_type)
-        if new_priority > 0:
-            event['priority'] = new_priority
-            logging.info(f"[INFO]: Updated priority to {new_priority} based on event type '{event_type}'")
+# Threat level of a priority value, "Unknown" for any value out of THREAT_LEVEL_MAP
+def threat_level_for_priority(priority: Any) -> str:
+    if isinstance(priority, int):
+        for priority_range, level in THREAT_LEVEL_MAP.items():
+            if priority in priority_range:
+                return level
+    return "Unknown"
 
-    # Then proceed with threat level assignment based on (possibly updated) priority
+
+# First, update the priority with the first classification rule that matches the event (by default one rule per
+# event type of EVENT_PRIORITY_MAP, see src/rule_engine/classification_rules.py), without a match the priority is kept
+def add_threat_level_by_priority(event: Dict[str, Any], rule_set: Optional[RuleSet] = None) -> Dict[str, Any]:
+    rule_set = rule_set or get_active_rule_set()
+    rule = rule_set.match(event)
+    if rule is not None and rule.priority is not None:
+        event['priority'] = rule.priority
+        if pipeline_metrics.DEBUG_LOGGING:
+            logging.info(f"[INFO]: Updated priority to {rule.priority} by the rule '{rule.name}'")
+    # Unknown event types are counted, a rule with an event type condition only matches known ones
+    if rule is None or rule.event_types is None:
+        event_type = event.get('event_type')
+        if event_type and not rule_set.knows_event_type(event_type):
+            pipeline_metrics.PIPELINE_METRICS.count_unknown_event_type(event_type)
+            if pipeline_metrics.DEBUG_LOGGING:
+                logging.warning(f"[WARNING]: Unknown event type '{event_type}'.")
+
+    # Then proceed with threat level assignment: the one of the rule or the one of the (possibly updated) priority
     priority = event.get('priority')                           
-    threat_level = "Unknown"                                 
-    if isinstance(priority, int):                               
-        for priority_range, level in THREAT_LEVEL_MAP.items():  
-            if priority in priority_range:                    
-                threat_level = level
-                break
+    threat_level = rule.threat_level if rule is not None and rule.threat_level else threat_level_for_priority(priority)
     event['threat_level'] = threat_level                        
-    logging.info(f"[INFO]: The threat level for the event is: {threat_level}")
-    logging.debug(f"[DEBUG]: The type of priority is: {type(priority)}")   
+    if pipeline_metrics.DEBUG_LOGGING:
+        logging.info(f"[INFO]: The threat level for the event is: {threat_level}")
+        logging.debug(f"[DEBUG]: The type of priority is: {type(priority)}")   
     return event  
@@ -3,6 +3,7 @@
 
 from typing import Any, Dict
 import logging
+from src.instrumentation import pipeline_metrics
 
 # Mapping of event types to priority levels (1-5)
 EVENT_PRIORITY_MAP = {
@@ -30,9 +31,12 @@ EVENT_PRIORITY_MAP = {
 def assign_priority_by_event_type(event_type: str) -> int:
     priority = EVENT_PRIORITY_MAP.get(event_type, 0)
     
+    # Unknown event types are counted in the pipeline metrics, the per-event log lines need the debug flag
     if priority == 0:
-        logging.warning(f"[WARNING]: Unknown event type '{event_type}'. Assigned priority 0.")
-    else:
+        pipeline_metrics.PIPELINE_METRICS.count_unknown_event_type(event_type)
+        if pipeline_metrics.DEBUG_LOGGING:
+            logging.warning(f"[WARNING]: Unknown event type '{event_type}'. Assigned priority 0.")
+    elif pipeline_metrics.DEBUG_LOGGING:
         logging.debug(f"[DEBUG]: Assigned priority {priority} for event type '{event_type}'.")
         
     return priority
@@ -1,23 +1,190 @@
 # Normalize the timestamp to UTC,format it and return a list of dictionaries with the normalized timestamp
+# The event also gets the seconds since the Unix epoch of the timestamp ("datetime_epoch"), used to sort and filter by time
 
-from typing import Any, Dict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
 import logging 
 from dateutil import parser 
 import pytz
+from src.instrumentation import pipeline_metrics
 
 
+NORMALIZED_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+_UNIX_EPOCH = datetime(1970, 1, 1)
+_UNIX_EPOCH_ORDINAL = _UNIX_EPOCH.toordinal()
+
+# Timestamp layouts that get a compiled slice-based parser, the rest of shapes are parsed with dateutil
+# (the first four are the layouts of helpers/data_generator.DATETIME_FORMATS)
+FAST_DATETIME_LAYOUTS = [
+    '%Y/%m/%d %H:%M:%S%z',       # 2024/09/01 14:23:01-0400
+    '%Y-%m-%dT%H:%M:%SZ',        # 2024-09-01T14:25:37Z
+    '%m-%d-%Y %H:%M:%S',         # 09-01-2024 15:00:15
+    '%Y-%m-%d %H:%M:%S %z',      # 2024-09-02 09:10:00 +0000
+    '%Y-%m-%d %H:%M:%S',         # 2024-09-01 15:00:15 (already normalized)
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%d %H:%M:%S%z',
+    '%Y/%m/%d %H:%M:%S',
+]
+
+_FIELD_WIDTHS = {'%Y': 4, '%m': 2, '%d': 2, '%H': 2, '%M': 2, '%S': 2, '%z': 5}
+_DIGITS_TO_SIGNATURE = str.maketrans('0123456789', 'dddddddddd')
+
+# Cache of compiled parsers by format signature ("dddd-dd-dd dd:dd:dd"), None means "use dateutil"
+_parsers_by_signature: Dict[str, Optional[Callable[[str], Tuple[str, Optional[int]]]]] = {}
+# Cache of the timezone offsets already seen ("-0400" -> timedelta)
+_utc_offsets: Dict[str, timedelta] = {}
+
+
+def _utc_offset(raw_offset: str) -> timedelta:
+    offset = _utc_offsets.get(raw_offset)
+    if offset is None:
+        hours, minutes = int(raw_offset[1:3]), int(raw_offset[3:5])
+        # Out of range offsets keep the dateutil behaviour
+        if hours >= 24 or minutes >= 60:
+            raise ValueError(f"Offset out of range: {raw_offset}")
+        offset = timedelta(hours=hours, minutes=minutes)
+        if raw_offset[0] == '-':
+            offset = -offset
+        _utc_offsets[raw_offset] = offset
+    return offset
+
+
+# Seconds since the Unix epoch of a naive datetime in UTC
+def datetime_to_epoch(dt: datetime) -> int:
+    return (dt.toordinal() - _UNIX_EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+# Build the slice-based parser of a layout, it returns (normalized datetime, epoch) and raises ValueError when
+# the values are not a valid date
+def _compile_layout(layout: str) -> Callable[[str], Tuple[str, Optional[int]]]:
+    positions = {}
+    position = 0
+    index = 0
+    while index < len(layout):
+        directive = layout[index:index + 2]
+        if directive in _FIELD_WIDTHS:
+            positions[directive] = position
+            position += _FIELD_WIDTHS[directive]
+            index += 2
+        else:
+            position += 1
+            index += 1
+
+    y, mo, d = positions['%Y'], positions['%m'], positions['%d']
+    h, mi, s = positions['%H'], positions['%M'], positions['%S']
+    z = positions.get('%z')
+
+    # The slices are rearranged as "YYYY-MM-DD HH:MM:SS", fromisoformat validates them and it is much
+    # cheaper than building the datetime field by field
+    def parse_layout(raw_datetime: str) -> Tuple[str, Optional[int]]:
+        normalized = (f"{raw_datetime[y:y + 4]}-{raw_datetime[mo:mo + 2]}-{raw_datetime[d:d + 2]} "
+                      f"{raw_datetime[h:h + 2]}:{raw_datetime[mi:mi + 2]}:{raw_datetime[s:s + 2]}")
+        dt = datetime.fromisoformat(normalized)
+        if z is not None:
+            dt -= _utc_offset(raw_datetime[z:z + 5])
+            normalized = dt.isoformat(' ')
+        if dt.year < 1000:
+            # strftime does not pad the year with zeros, keep its output (without epoch, as normalized_datetime_to_epoch)
+            return dt.strftime(NORMALIZED_DATETIME_FORMAT), None
+        return normalized, datetime_to_epoch(dt)
+
+    return parse_layout
+
+
+def _layout_signatures(layout: str) -> list:
+    signature = layout
+    for directive, width in _FIELD_WIDTHS.items():
+        if directive != '%z':
+            signature = signature.replace(directive, 'd' * width)
+    if '%z' in signature:
+        return [signature.replace('%z', '+dddd'), signature.replace('%z', '-dddd')]
+    return [signature]
+
+
+# Detect the layout of a format signature once, and keep the compiled parser for the next events
+def _parser_for_signature(signature: str) -> Optional[Callable[[str], Tuple[str, Optional[int]]]]:
+    try:
+        return _parsers_by_signature[signature]
+    except KeyError:
+        pass
+    compiled_parser = None
+    for layout in FAST_DATETIME_LAYOUTS:
+        if signature in _layout_signatures(layout):
+            compiled_parser = _compile_layout(layout)
+            break
+    _parsers_by_signature[signature] = compiled_parser
+    return compiled_parser
+
+
+def _normalize_with_dateutil(raw_datetime: Any) -> str:
+    parsed_dt = parser.parse(raw_datetime)   
+    if parsed_dt.tzinfo is None:            
+        parsed_dt = parsed_dt.replace(tzinfo=pytz.utc)
+    utc_dt = parsed_dt.astimezone(pytz.utc)   
+    return utc_dt.strftime(NORMALIZED_DATETIME_FORMAT) 
+
 
 def normalize_event_datetime(event: Dict[str, Any]) -> Dict[str, Any]: 
     raw_datetime = event.get('datetime')        
     if not raw_datetime:                         
         return event
     try:                                         
-        parsed_dt = parser.parse(raw_datetime)   
-        if parsed_dt.tzinfo is None:            
-            parsed_dt = parsed_dt.replace(tzinfo=pytz.utc)
-        utc_dt = parsed_dt.astimezone(pytz.utc)   
-        event['datetime'] = utc_dt.strftime('%Y-%m-%d %H:%M:%S') 
+        fast_parser = None
+        if type(raw_datetime) is str:
+            fast_parser = _parser_for_signature(raw_datetime.translate(_DIGITS_TO_SIGNATURE))
+        if fast_parser is not None:
+            try:
+                event['datetime'], epoch = fast_parser(raw_datetime)
+                if epoch is not None:
+                    event['datetime_epoch'] = epoch
+                return event
+            except (ValueError, OverflowError):
+                # Ambiguous or invalid values (e.g. month 13), dateutil decides as before
+                pass
+        event['datetime'] = _normalize_with_dateutil(raw_datetime)
+        epoch = normalized_datetime_to_epoch(event['datetime'])
+        if epoch is not None:
+            event['datetime_epoch'] = epoch
+        pipeline_metrics.PIPELINE_METRICS.increment('dates_parsed_with_fallback')
     except (parser.ParserError, TypeError) as e:
-        logging.warning(f"[WARNING]: It was not possible to process the date '{raw_datetime}'. Error: {e}") 
+        pipeline_metrics.PIPELINE_METRICS.increment('dates_unparseable')
+        if pipeline_metrics.DEBUG_LOGGING:
+            logging.warning(f"[WARNING]: It was not possible to process the date '{raw_datetime}'. Error: {e}") 
         event['datetime'] = "Unknown Format"
     return event                               
+
+
+# Seconds since the Unix epoch of a timestamp in any of the shapes accepted by normalize_event_datetime, None when it
+# cannot be parsed (the pipeline metrics are not updated, it is used for the time filters of the queries)
+def datetime_text_to_epoch(raw_datetime: str) -> Optional[int]:
+    fast_parser = _parser_for_signature(raw_datetime.translate(_DIGITS_TO_SIGNATURE))
+    if fast_parser is not None:
+        try:
+            return fast_parser(raw_datetime)[1]
+        except (ValueError, OverflowError):
+            pass
+    try:
+        return normalized_datetime_to_epoch(_normalize_with_dateutil(raw_datetime))
+    except (ValueError, OverflowError, TypeError):
+        return None
+
+
+# Seconds since the Unix epoch of a normalized datetime ("YYYY-MM-DD HH:MM:SS" in UTC), None for "Unknown Format"
+# or any text that epoch_to_normalized_datetime would not give back exactly
+def normalized_datetime_to_epoch(normalized_datetime: Any) -> Optional[int]:
+    if (type(normalized_datetime) is not str or len(normalized_datetime) != 19 or normalized_datetime[10] != ' '
+            or normalized_datetime[4] != '-' or normalized_datetime[13] != ':'):
+        return None
+    try:
+        dt = datetime.fromisoformat(normalized_datetime)
+    except ValueError:
+        return None
+    if dt.year < 1000:
+        return None
+    return datetime_to_epoch(dt)
+
+
+# Normalized datetime ("YYYY-MM-DD HH:MM:SS" in UTC) of the seconds since the Unix epoch
+def epoch_to_normalized_datetime(epoch: int) -> str:
+    return (_UNIX_EPOCH + timedelta(seconds=epoch)).strftime(NORMALIZED_DATETIME_FORMAT)
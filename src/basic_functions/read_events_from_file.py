@@ -1,30 +1,44 @@
 # Read events from file and return a list of dictionaries
 
 import csv 
-from typing import Any, Dict, List 
+from typing import Any, Dict, Iterable, Iterator, List 
 import logging 
-
+from src.instrumentation import pipeline_metrics
 
 
 KEYS = ['datetime', 'source_ip', 'destination_ip', 'port', 'event_type', 'priority']
 
-                                      
-def read_events_from_file(file_path: str) -> List[Dict[str, Any]]:  
-    events = []                        
+
+# Validate the csv rows and yield one event dictionary per valid row, so the caller decides if they are kept in memory
+def iter_events_from_rows(rows: Iterable[List[str]]) -> Iterator[Dict[str, Any]]:
+    for row in rows:        
+        if len(row) == len(KEYS):
+            event_dict = dict(zip(KEYS, row))
+            try:               
+                event_dict['port'] = int(event_dict['port']) 
+                event_dict['priority'] = int(event_dict['priority'])
+            except ValueError:
+                pipeline_metrics.PIPELINE_METRICS.count_rejected('invalid_port_priority')
+                if pipeline_metrics.DEBUG_LOGGING:
+                    logging.warning(f"[WARNING]: It was omitted a line due to invalid data (port/priority): {row}")
+                continue
+            yield event_dict
+        elif not all(row):    
+            pipeline_metrics.PIPELINE_METRICS.count_rejected('empty_fields')
+            if pipeline_metrics.DEBUG_LOGGING:
+                logging.warning(f"[WARNING]: It was omitted a line due to empty fields: {row}") 
+        elif row:
+            pipeline_metrics.PIPELINE_METRICS.count_rejected('invalid_field_count')
+
+
+# Read the file lazily, one event at a time, keeping a constant memory footprint
+def iter_events_from_file(file_path: str) -> Iterator[Dict[str, Any]]:
     try:                            
         with open(file_path, mode='r', encoding='utf-8') as f: 
-            reader = csv.reader(f)    
-            for row in reader:        
-                if len(row) == len(KEYS):
-                    event_dict = dict(zip(KEYS, row))
-                    try:               
-                        event_dict['port'] = int(event_dict['port']) 
-                        event_dict['priority'] = int(event_dict['priority'])
-                        events.append(event_dict)
-                    except ValueError:
-                        logging.warning(f"[WARNING]: It was omitted a line due to invalid data (port/priority): {row}")
-                elif not all(row):    
-                    logging.warning(f"[WARNING]: It was omitted a line due to empty fields: {row}") 
+            yield from iter_events_from_rows(csv.reader(f))
     except FileNotFoundError:
         logging.error(f"[ERROR]: The file in the path '{file_path}' was not found.") 
-    return events   
\ No newline at end of file
+
+                                      
+def read_events_from_file(file_path: str) -> List[Dict[str, Any]]:  
+    return list(iter_events_from_file(file_path))
@@ -0,0 +1,89 @@
+# Read events from a memory-mapped file scanning the raw bytes, alternative to read_events_from_file for very large files
+
+import csv
+import io
+import logging
+import mmap
+from typing import Any, Dict, Iterator, List
+from src.basic_functions.read_events_from_file import KEYS, iter_events_from_rows
+from src.instrumentation import pipeline_metrics
+
+
+CHUNK_SIZE = 1 << 22
+
+
+# Parse a block of complete lines with the same rules as iter_events_from_rows.
+# The block is decoded at once and split on the delimiters, blocks with quotes or old Mac line endings
+# are delegated to the csv module
+def iter_events_from_bytes(data: bytes) -> Iterator[Dict[str, Any]]:
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    if '"' in text or '\r' in text:
+        yield from iter_events_from_rows(csv.reader(io.StringIO(text, newline=None)))
+        return
+
+    keys_count = len(KEYS)
+    for line in text.split('\n'):
+        fields = line.split(',')
+        if len(fields) == keys_count:
+            # Fast path for the six fields schema: datetime, source_ip, destination_ip, port, event_type, priority
+            datetime_field, source_ip, destination_ip, port, event_type, priority = fields
+            try:
+                port = int(port)
+                priority = int(priority)
+            except ValueError:
+                pipeline_metrics.PIPELINE_METRICS.count_rejected('invalid_port_priority')
+                if pipeline_metrics.DEBUG_LOGGING:
+                    logging.warning(f"[WARNING]: It was omitted a line due to invalid data (port/priority): {fields}")
+                continue
+            yield {
+                'datetime': datetime_field,
+                'source_ip': source_ip,
+                'destination_ip': destination_ip,
+                'port': port,
+                'event_type': event_type,
+                'priority': priority
+            }
+        elif line and not all(fields):
+            pipeline_metrics.PIPELINE_METRICS.count_rejected('empty_fields')
+            if pipeline_metrics.DEBUG_LOGGING:
+                logging.warning(f"[WARNING]: It was omitted a line due to empty fields: {fields}")
+        elif line:
+            pipeline_metrics.PIPELINE_METRICS.count_rejected('invalid_field_count')
+
+
+# Yield blocks of about "chunk_size" bytes of the buffer, every block ends at the end of a line
+def iter_line_aligned_chunks(buffer: Any, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    buffer_size = len(buffer)
+    start = 0
+    while start < buffer_size:
+        end = start + chunk_size
+        if end >= buffer_size:
+            end = buffer_size
+        else:
+            newline = buffer.rfind(b'\n', start, end)
+            if newline == -1:
+                newline = buffer.find(b'\n', end)
+            end = buffer_size if newline == -1 else newline + 1
+        yield buffer[start:end]
+        start = end
+
+
+def iter_events_from_file_mmap(file_path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    try:
+        with open(file_path, mode='rb') as f:
+            try:
+                mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can not be mapped
+                return
+            with mapped_file:
+                for chunk in iter_line_aligned_chunks(mapped_file, chunk_size):
+                    yield from iter_events_from_bytes(chunk)
+    except FileNotFoundError:
+        logging.error(f"[ERROR]: The file in the path '{file_path}' was not found.")
+
+
+def read_events_from_file_mmap(file_path: str) -> List[Dict[str, Any]]:
+    return list(iter_events_from_file_mmap(file_path))
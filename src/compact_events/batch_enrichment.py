@@ -0,0 +1,155 @@
+# Batch version of add_threat_level_by_priority for the columnar EventBatch, with the same classification rules.
+# When the rules only have conditions on the event type (as the default rules of EVENT_PRIORITY_MAP) the work is done
+# once per distinct event type and per priority value instead of once per event: the categorical codes are mapped with
+# bytes.translate through lookup tables of the rule of every code and of threat_level_for_priority, and the updated
+# values are merged with the previous ones through integer masks. Only the priorities kept apart from the typed column
+# (missing, not an int, out of range) are resolved one by one. Rules on ports or subnets are matched row by row.
+# The result is the same as add_threat_level_by_priority on every event
+
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from src.basic_functions.add_threat_level_by_priority import threat_level_for_priority
+from src.compact_events.event_batch import MISSING, EventBatch
+from src.instrumentation import pipeline_metrics
+from src.rule_engine.classification_rules import ClassificationRule, RuleSet, get_active_rule_set
+
+
+# Count the unknown event types of the rows in the order they first appear, as the scalar function does
+# (the metrics keep a limited number of distinct types)
+def _count_unknown_event_types(batch: EventBatch, rule_set: RuleSet, codes: bytes, code_list: List[int]) -> None:
+    event_types = batch.event_types.values
+    unknown_codes = {code for code, event_type in enumerate(event_types)
+                     if event_type is not MISSING and event_type and not rule_set.knows_event_type(event_type)}
+    if not unknown_codes:
+        return
+    if code_list is not None:
+        counts = [(code, count) for code, count in Counter(code_list).items() if code in unknown_codes]
+    else:
+        positions = sorted((codes.find(bytes((code,))), code) for code in unknown_codes)
+        counts = [(code, codes.count(bytes((code,)))) for position, code in positions if position >= 0]
+    for code, count in counts:
+        pipeline_metrics.PIPELINE_METRICS.count_unknown_event_type(event_types[code], count)
+
+
+# One byte per row: the byte of "updated" where "kept" is 0 and the byte of "previous" where it is 0xFF
+def _merge_bytes(updated: bytes, kept: bytes, previous: bytes) -> bytes:
+    if kept.count(0) == len(kept):
+        return updated
+    merged = int.from_bytes(updated, 'little') | (int.from_bytes(previous, 'little') & int.from_bytes(kept, 'little'))
+    return merged.to_bytes(len(previous), 'little')
+
+
+def _value(column: array, overflow: Dict[int, Any], row: int) -> Any:
+    value = overflow.get(row, column[row])
+    return None if value is MISSING else value
+
+
+# Rules on ports or subnets: the rule of every row is matched with the values of its columns
+def _apply_rules_by_row(batch: EventBatch, rule_set: RuleSet, start: int) -> None:
+    overflow = batch._overflow
+    priority_overflow = overflow['priority']
+    event_types = batch.event_types
+    threat_levels = batch.threat_levels
+    threat_level_by_priority: Dict[int, str] = {}
+    for row in range(start, len(batch)):
+        event_type = event_types.values[event_types.codes[row]]
+        rule = rule_set.match_values(None if event_type is MISSING else event_type,
+                                     _value(batch.ports, overflow['port'], row),
+                                     _value(batch.source_ips, overflow['source_ip'], row),
+                                     _value(batch.destination_ips, overflow['destination_ip'], row))
+        if rule is not None and rule.priority is not None:
+            batch.priorities[row] = rule.priority
+            priority_overflow.pop(row, None)
+        if rule is not None and rule.threat_level:
+            threat_level = rule.threat_level
+        elif row in priority_overflow:
+            threat_level = threat_level_for_priority(_value(batch.priorities, priority_overflow, row))
+        else:
+            priority = batch.priorities[row]
+            threat_level = threat_level_by_priority.get(priority)
+            if threat_level is None:
+                threat_level = threat_level_by_priority[priority] = threat_level_for_priority(priority)
+        code = threat_levels.code_for(threat_level)
+        threat_levels.codes[row] = code
+
+
+# Rules only on the event type: the rule of every event type code is applied with lookup tables
+def _apply_rules_by_code(batch: EventBatch, rules_by_code: List[Optional[ClassificationRule]], start: int) -> None:
+    type_codes = batch.event_types.codes
+    # Up to 256 event types the codes are bytes and the tables are applied with bytes.translate
+    byte_codes = type_codes.typecode == 'B'
+    codes = type_codes[start:].tobytes() if byte_codes else b''
+    code_list = None if byte_codes else type_codes[start:].tolist()
+    priority_by_code = [rule.priority if rule is not None and rule.priority is not None else 0 for rule in rules_by_code]
+
+    # Priorities: the one of the rule when it sets one, the previous one otherwise
+    priority_overflow = batch._overflow['priority']
+    priorities = batch.priorities[start:].tobytes()
+    if any(priority_by_code):
+        if byte_codes:
+            padded = priority_by_code + [0] * (256 - len(priority_by_code))
+            priorities = _merge_bytes(codes.translate(bytes(padded)),
+                                      codes.translate(bytes(0 if priority else 0xFF for priority in padded)), priorities)
+        else:
+            priorities = bytes(priority_by_code[code] or previous for code, previous in zip(code_list, priorities))
+        column = array('b')
+        column.frombytes(priorities)
+        batch.priorities[start:] = column
+        for row in [row for row in priority_overflow if row >= start and priority_by_code[type_codes[row]]]:
+            del priority_overflow[row]
+
+    # Threat levels: the one of the rule when it sets one, otherwise one code per priority byte (a signed value in the 'b' column)
+    threat_levels = batch.threat_levels
+    threat_code_by_code = [threat_levels.code_for(rule.threat_level) if rule is not None and rule.threat_level else None
+                           for rule in rules_by_code]
+    threat_code_by_byte = [threat_levels.code_for(threat_level_for_priority(value - 256 if value > 127 else value))
+                           for value in range(256)]
+    overflow_codes = {}
+    for row, value in priority_overflow.items():
+        if row >= start:
+            threat_code = threat_code_by_code[type_codes[row]]
+            if threat_code is None:
+                threat_code = threat_levels.code_for(threat_level_for_priority(None if value is MISSING else value))
+            overflow_codes[row] = threat_code
+
+    overrides = any(threat_code is not None for threat_code in threat_code_by_code)
+    if threat_levels.codes.typecode == 'B' and (byte_codes or not overrides):
+        threat_codes = priorities.translate(bytes(threat_code_by_byte))
+        if overrides:
+            padded = threat_code_by_code + [None] * (256 - len(threat_code_by_code))
+            threat_codes = _merge_bytes(codes.translate(bytes(threat_code or 0 for threat_code in padded)),
+                                        codes.translate(bytes(0 if threat_code is not None else 0xFF for threat_code in padded)),
+                                        threat_codes)
+        column = array('B')
+        column.frombytes(threat_codes)
+    elif overrides:
+        column = array(threat_levels.codes.typecode, [
+            threat_code_by_code[code] if threat_code_by_code[code] is not None else threat_code_by_byte[value]
+            for code, value in zip(code_list if code_list is not None else codes, priorities)])
+    else:
+        column = array(threat_levels.codes.typecode, [threat_code_by_byte[value] for value in priorities])
+    threat_levels.codes[start:] = column
+    for row, threat_code in overflow_codes.items():
+        threat_levels.codes[row] = threat_code
+
+
+# Update the priority and set the threat level of the rows from "start" (all of them by default) with the rules
+# of "rule_set" (default: the active rule set of add_threat_level_by_priority), returns the batch
+def add_threat_level_by_priority_to_batch(batch: EventBatch, start: int = 0, rule_set: Optional[RuleSet] = None) -> EventBatch:
+    if len(batch) - start <= 0:
+        return batch
+    rule_set = rule_set or get_active_rule_set()
+    type_codes = batch.event_types.codes
+    byte_codes = type_codes.typecode == 'B'
+    _count_unknown_event_types(batch, rule_set, type_codes[start:].tobytes() if byte_codes else b'',
+                               None if byte_codes else type_codes[start:].tolist())
+
+    if rule_set.constrained_fields <= {'event_type'}:
+        rules_by_code = [rule_set.match_values(None if event_type is MISSING else event_type)
+                         for event_type in batch.event_types.values]
+        _apply_rules_by_code(batch, rules_by_code, start)
+    else:
+        _apply_rules_by_row(batch, rule_set, start)
+    return batch
@@ -0,0 +1,228 @@
+# Columnar batch of events backed by arrays: categorical codes for event_type and threat_level,
+# IPv4 addresses packed as integers, ports in array('H') and the datetime as epoch seconds. Values that do not fit in their typed
+# column (missing fields, non IPv4 addresses, out of range numbers, datetimes that are not normalized) are kept apart, so any event
+# exported with to_dicts is equal to the dictionary that was appended (for the EVENT_FIELDS and ALERT_FIELDS keys). The exception
+# is "datetime_epoch", it is not stored: it is exported for every normalized datetime, as normalize_event_datetime sets it. The
+# fields of the correlation alerts are rare, they are only kept apart
+
+from array import array
+import ipaddress
+from socket import inet_aton, inet_ntoa
+import sys
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from src.basic_functions.normalize_event_datetime import epoch_to_normalized_datetime, normalized_datetime_to_epoch
+from src.compact_events.event_record import ALERT_FIELDS, EVENT_FIELDS, EventRecord
+
+
+# Marker of a field that is not present in the event
+MISSING = object()
+
+# Epoch of the events without a valid datetime, they are older than any other event
+UNKNOWN_EPOCH = -(1 << 63)
+
+_TYPED_COLUMNS = {'source_ip': 'I', 'destination_ip': 'I', 'port': 'H', 'priority': 'b'}
+_NUMERIC_LIMITS = {'port': (0, 0xFFFF), 'priority': (-128, 127)}
+
+
+def ipv4_to_int(ip: Any) -> Optional[int]:
+    try:
+        packed = inet_aton(ip)
+    except (OSError, TypeError, ValueError):
+        return None
+    # inet_aton accepts short forms such as "10.1", only the canonical dotted quad is packed
+    if inet_ntoa(packed) != ip:
+        return None
+    return int.from_bytes(packed, 'big')
+
+
+def int_to_ipv4(value: int) -> str:
+    return inet_ntoa(value.to_bytes(4, 'big'))
+
+
+# (IP version, integer address) of a value: IPv4 text or integer (as stored in the columns) and IPv6 text
+def ip_to_key(value: Any) -> Optional[Tuple[int, int]]:
+    if type(value) is int:
+        return (4, value) if 0 <= value <= 0xFFFFFFFF else None
+    packed = ipv4_to_int(value)
+    if packed is not None:
+        return 4, packed
+    if isinstance(value, str) and ':' in value:
+        try:
+            return 6, int(ipaddress.IPv6Address(value))
+        except ValueError:
+            return None
+    return None
+
+
+class CategoricalColumn:
+    """Column of repeated values stored as small integer codes plus the table of distinct values"""
+
+    def __init__(self):
+        self.codes = array('B')
+        self.values: List[Any] = []
+        self._code_by_value: Dict[Hashable, int] = {}
+
+    # Column with a table of distinct values (e.g. read from a file), every value keeps its position as its code. The codes
+    # of the rows are taken as they are, they refer to that table
+    @classmethod
+    def from_values(cls, values: Iterable[Any], codes: Optional[array] = None) -> 'CategoricalColumn':
+        column = cls()
+        for value in values:
+            column.code_for(value)
+        if codes is not None:
+            column.codes = codes
+        return column
+
+    def code_of(self, value: Any) -> Optional[int]:
+        return self._code_by_value.get(value)
+
+    # Code of the value, it is added to the table of values if needed (without adding a row)
+    def code_for(self, value: Any) -> int:
+        code = self._code_by_value.get(value)
+        if code is None:
+            code = len(self.values)
+            if code > 0xFF and self.codes.typecode == 'B':
+                self.codes = array('I', self.codes)
+            if type(value) is str:
+                value = sys.intern(value)
+            self.values.append(value)
+            self._code_by_value[value] = code
+        return code
+
+    def append(self, value: Any) -> int:
+        code = self._code_by_value.get(value)
+        if code is None:
+            code = self.code_for(value)
+        self.codes.append(code)
+        return code
+
+    def __getitem__(self, index: int) -> Any:
+        return self.values[self.codes[index]]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class EventBatch:
+    """Columnar container of events, a compact alternative to a list of event dictionaries"""
+
+    def __init__(self, events: Iterable[Mapping[str, Any]] = ()):
+        # The datetime text is rebuilt from the epoch, only the values without epoch go to the overflow
+        self.epochs = array('q')
+        self.source_ips = array('I')
+        self.destination_ips = array('I')
+        self.ports = array('H')
+        self.priorities = array('b')
+        self.event_types = CategoricalColumn()
+        self.threat_levels = CategoricalColumn()
+        # Values that do not fit in the typed columns: {field: {index: value}}
+        self._overflow: Dict[str, Dict[int, Any]] = {field: {} for field in ('datetime',) + tuple(_TYPED_COLUMNS) + ALERT_FIELDS}
+        self.extend(events)
+
+    def _typed_column(self, field: str) -> array:
+        return {'source_ip': self.source_ips, 'destination_ip': self.destination_ips,
+                'port': self.ports, 'priority': self.priorities}[field]
+
+    def _append_typed(self, field: str, column: array, value: Any) -> None:
+        if field in _NUMERIC_LIMITS:
+            low, high = _NUMERIC_LIMITS[field]
+            packed = value if type(value) is int and low <= value <= high else None
+        else:
+            packed = ipv4_to_int(value)
+        if packed is None:
+            self._overflow[field][len(column)] = value
+            packed = 0
+        column.append(packed)
+
+    def append(self, event: Mapping[str, Any]) -> None:
+        get = event.get
+        datetime_value = get('datetime', MISSING)
+        epoch = normalized_datetime_to_epoch(datetime_value)
+        if epoch is None:
+            self._overflow['datetime'][len(self.epochs)] = datetime_value
+            epoch = UNKNOWN_EPOCH
+        self.epochs.append(epoch)
+        self._append_typed('source_ip', self.source_ips, get('source_ip', MISSING))
+        self._append_typed('destination_ip', self.destination_ips, get('destination_ip', MISSING))
+        self._append_typed('port', self.ports, get('port', MISSING))
+        self.event_types.append(get('event_type', MISSING))
+        self._append_typed('priority', self.priorities, get('priority', MISSING))
+        self.threat_levels.append(get('threat_level', MISSING))
+        if 'correlation_rule' in event:
+            row = len(self.epochs) - 1
+            for field in ALERT_FIELDS:
+                if field in event:
+                    self._overflow[field][row] = event[field]
+
+    def extend(self, events: Iterable[Mapping[str, Any]]) -> None:
+        for event in events:
+            self.append(event)
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    # Values of a typed field (or the datetime) kept apart from its column: {row: value}
+    def overflow(self, field: str) -> Dict[int, Any]:
+        return self._overflow[field]
+
+    # (IP version, integer address) of source_ip or destination_ip, None when it is missing or not an address
+    def ip_key(self, index: int, field: str) -> Optional[Tuple[int, int]]:
+        overflow = self._overflow[field]
+        if index in overflow:
+            return ip_to_key(overflow[index])
+        return 4, (self.source_ips if field == 'source_ip' else self.destination_ips)[index]
+
+    def get(self, index: int, field: str, default: Any = None) -> Any:
+        if field == 'datetime':
+            overflow = self._overflow['datetime']
+            value = overflow[index] if index in overflow else epoch_to_normalized_datetime(self.epochs[index])
+        elif field == 'datetime_epoch':
+            value = MISSING if index in self._overflow['datetime'] else self.epochs[index]
+        elif field == 'event_type':
+            value = self.event_types[index]
+        elif field == 'threat_level':
+            value = self.threat_levels[index]
+        elif field in ALERT_FIELDS:
+            value = self._overflow[field].get(index, MISSING)
+        elif field in _TYPED_COLUMNS:
+            overflow = self._overflow[field]
+            if index in overflow:
+                value = overflow[index]
+            elif field in _NUMERIC_LIMITS:
+                value = self._typed_column(field)[index]
+            else:
+                value = int_to_ipv4(self._typed_column(field)[index])
+        else:
+            raise KeyError(field)
+        return default if value is MISSING else value
+
+    def to_dict(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += len(self)
+        event = {}
+        for field in EVENT_FIELDS:
+            value = self.get(index, field, MISSING)
+            if value is not MISSING:
+                event[field] = value
+        for field in ALERT_FIELDS:
+            overflow = self._overflow[field]
+            if index in overflow:
+                event[field] = overflow[index]
+        return event
+
+    def record(self, index: int) -> EventRecord:
+        return EventRecord.from_dict(self.to_dict(index))
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if not -len(self) <= index < len(self):
+            raise IndexError('event index out of range')
+        return self.to_dict(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self.to_dict(index) for index in range(len(self)))
+
+    def to_dicts(self, indexes: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        if indexes is None:
+            indexes = range(len(self))
+        return [self.to_dict(index) for index in indexes]
@@ -0,0 +1,335 @@
+# Output formats of the processed events, chosen by the file extension (or an explicit file_format):
+#   .json              JSON array, same text as json.dump(events, f, indent=2) but written event by event
+#   .jsonl / .ndjson   JSON Lines, one compact JSON object per line
+#   .siemcol           Binary columnar file: a magic header followed by blocks of little-endian column
+#                      arrays, loaded with array.frombytes straight from a memory map
+#   .sqlite / .sqlite3 / .db   SQLite database (SqliteEventStore), the events are appended to the history it already has
+# The writers stream the events, the file is written next to the target and renamed when it is complete,
+# so a reader never sees a half written result. A database is written in place, one transaction per block
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, Mapping, Optional
+
+from src.compact_events.event_batch import MISSING, CategoricalColumn, EventBatch
+from src.event_store.sqlite_event_store import SqliteEventStore
+
+
+JSON_FORMAT = 'json'
+JSON_LINES_FORMAT = 'jsonl'
+COLUMNAR_FORMAT = 'siemcol'
+SQLITE_FORMAT = 'sqlite'
+
+FORMATS_BY_EXTENSION = {
+    '.json': JSON_FORMAT,
+    '.jsonl': JSON_LINES_FORMAT,
+    '.ndjson': JSON_LINES_FORMAT,
+    '.siemcol': COLUMNAR_FORMAT,
+    '.sqlite': SQLITE_FORMAT,
+    '.sqlite3': SQLITE_FORMAT,
+    '.db': SQLITE_FORMAT,
+}
+
+COLUMNAR_MAGIC = b'SIEMCOL1'
+# Every block starts with the length of its JSON metadata and the length of its column data
+_BLOCK_HEADER = struct.Struct('<II')
+
+# Characters of JSON Lines read and decoded at once
+_JSON_LINES_GROUP_SIZE = 1 << 20
+
+# Rows per block of the columnar file
+DEFAULT_BLOCK_ROWS = 65536
+
+_ARRAY_COLUMNS = ('epochs', 'source_ips', 'destination_ips', 'ports', 'priorities')
+_CATEGORICAL_COLUMNS = ('event_types', 'threat_levels')
+
+
+def detect_file_format(file_path: str, file_format: Optional[str] = None) -> str:
+    if file_format is None:
+        file_format = FORMATS_BY_EXTENSION.get(os.path.splitext(file_path)[1].lower())
+        if file_format is None:
+            raise ValueError(f"Unknown processed events format for '{file_path}', use one of {sorted(FORMATS_BY_EXTENSION)}")
+    elif file_format not in (JSON_FORMAT, JSON_LINES_FORMAT, COLUMNAR_FORMAT, SQLITE_FORMAT):
+        raise ValueError(f"Unknown processed events format '{file_format}'")
+    return file_format
+
+
+def _little_endian_bytes(column: array) -> bytes:
+    if sys.byteorder == 'big' and column.itemsize > 1:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _categorical_meta(column: CategoricalColumn) -> Dict[str, Any]:
+    values = column.values
+    missing_code = next((code for code, value in enumerate(values) if value is MISSING), None)
+    return {'values': [None if value is MISSING else value for value in values], 'missing': missing_code}
+
+
+def encode_columnar_block(batch: EventBatch, categories: Optional[Dict[str, CategoricalColumn]] = None) -> bytes:
+    # The codes are written against the categories of the whole file (when given), so every block
+    # shares the same code table and the reader keeps the last one
+    columns = [getattr(batch, name) for name in _ARRAY_COLUMNS]
+    meta: Dict[str, Any] = {'rows': len(batch), 'columns': [], 'categories': {}, 'overflow': {}, 'missing': {}}
+    for name in _CATEGORICAL_COLUMNS:
+        column = getattr(batch, name)
+        codes = column.codes
+        if categories is not None:
+            shared = categories[name]
+            recoded = [shared.code_for(value) for value in column.values]
+            if recoded != list(range(len(recoded))):
+                codes = array('B' if len(shared.values) <= 0x100 else 'I', [recoded[code] for code in codes])
+            column = shared
+        meta['categories'][name] = _categorical_meta(column)
+        columns.append(codes)
+    names = _ARRAY_COLUMNS + _CATEGORICAL_COLUMNS
+    data = []
+    for name, column in zip(names, columns):
+        data.append(_little_endian_bytes(column))
+        meta['columns'].append([name, column.typecode, column.itemsize, len(data[-1])])
+    for field, values in batch._overflow.items():
+        meta['overflow'][field] = [[index, value] for index, value in values.items() if value is not MISSING]
+        meta['missing'][field] = [index for index, value in values.items() if value is MISSING]
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    data_bytes = b''.join(data)
+    return _BLOCK_HEADER.pack(len(meta_bytes), len(data_bytes)) + meta_bytes + data_bytes
+
+
+def _extend_column(target: array, typecode: str, data: memoryview) -> array:
+    if target.typecode == typecode and (sys.byteorder == 'little' or target.itemsize == 1):
+        target.frombytes(data)
+        return target
+    block = array(typecode)
+    block.frombytes(data)
+    if sys.byteorder == 'big' and block.itemsize > 1:
+        block.byteswap()
+    # Categorical codes are upgraded from 'B' to 'I' when the table grows past 255 values
+    if target.itemsize < block.itemsize:
+        target = array(typecode, target)
+    elif target.typecode != typecode:
+        block = array(target.typecode, block)
+    target.extend(block)
+    return target
+
+
+def _decode_columnar_block(batch: EventBatch, meta: Dict[str, Any], data: memoryview) -> None:
+    start = len(batch)
+    rows = meta['rows']
+    offset = 0
+    for name, typecode, itemsize, nbytes in meta['columns']:
+        if array(typecode).itemsize != itemsize or nbytes != rows * itemsize:
+            raise ValueError(f"Column '{name}' of the columnar file does not match this platform")
+        chunk = data[offset:offset + nbytes]
+        offset += nbytes
+        if name in _CATEGORICAL_COLUMNS:
+            column = getattr(batch, name)
+            column.codes = _extend_column(column.codes, typecode, chunk)
+        elif name in _ARRAY_COLUMNS:
+            setattr(batch, name, _extend_column(getattr(batch, name), typecode, chunk))
+        chunk.release()
+    for name, category in meta['categories'].items():
+        values = [MISSING if code == category['missing'] else value for code, value in enumerate(category['values'])]
+        setattr(batch, name, CategoricalColumn.from_values(values, getattr(batch, name).codes))
+    for field, values in meta['overflow'].items():
+        overflow = batch._overflow[field]
+        for index, value in values:
+            overflow[start + index] = value
+    for field, indexes in meta['missing'].items():
+        overflow = batch._overflow[field]
+        for index in indexes:
+            overflow[start + index] = MISSING
+
+
+# One block of encode_columnar_block decoded into a new batch, e.g. a block sent by another process
+def decode_columnar_block(block: bytes) -> EventBatch:
+    meta_length, data_length = _BLOCK_HEADER.unpack_from(block)
+    offset = _BLOCK_HEADER.size
+    if offset + meta_length + data_length != len(block):
+        raise ValueError("Truncated columnar block")
+    batch = EventBatch()
+    with memoryview(block) as view:
+        meta = json.loads(bytes(view[offset:offset + meta_length]))
+        with view[offset + meta_length:] as data:
+            _decode_columnar_block(batch, meta, data)
+    return batch
+
+
+def _iter_columnar_file(file_path: str, new_batch: Callable[[], EventBatch]) -> Iterator[EventBatch]:
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty columnar file '{file_path}'")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            view = memoryview(buffer)
+            try:
+                if view[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+                    raise ValueError(f"'{file_path}' is not a columnar events file")
+                offset = len(COLUMNAR_MAGIC)
+                batch = new_batch()
+                while offset < len(view):
+                    if offset + _BLOCK_HEADER.size > len(view):
+                        raise ValueError(f"Truncated columnar file '{file_path}'")
+                    meta_length, data_length = _BLOCK_HEADER.unpack_from(view, offset)
+                    offset += _BLOCK_HEADER.size
+                    if offset + meta_length + data_length > len(view):
+                        raise ValueError(f"Truncated columnar file '{file_path}'")
+                    meta = json.loads(bytes(view[offset:offset + meta_length]))
+                    offset += meta_length
+                    data = view[offset:offset + data_length]
+                    offset += data_length
+                    try:
+                        _decode_columnar_block(batch, meta, data)
+                    except (KeyError, TypeError) as e:
+                        raise ValueError(f"Corrupted block in columnar file '{file_path}': {e}") from e
+                    finally:
+                        data.release()
+                    yield batch
+                    batch = new_batch()
+            finally:
+                view.release()
+
+
+def iter_columnar_blocks(file_path: str) -> Iterator[EventBatch]:
+    # Every block is decoded into its own EventBatch
+    return _iter_columnar_file(file_path, EventBatch)
+
+
+def read_columnar_file(file_path: str) -> EventBatch:
+    # All the blocks are decoded into one batch, the categories of the last block cover every code
+    batch = EventBatch()
+    for _ in _iter_columnar_file(file_path, lambda: batch):
+        pass
+    return batch
+
+
+def _json_array_item(event: Mapping[str, Any]) -> str:
+    # Same text json.dump(events, f, indent=2) writes for an item of the array
+    return '  ' + json.dumps(event, indent=2).replace('\n', '\n  ')
+
+
+class ProcessedEventsWriter:
+    """Streaming writer of processed events, used as a context manager"""
+
+    def __init__(self, file_path: str, file_format: Optional[str] = None, block_rows: int = DEFAULT_BLOCK_ROWS):
+        self.file_path = file_path
+        self.file_format = detect_file_format(file_path, file_format)
+        self.block_rows = block_rows
+        self.events_written = 0
+        self._file = None
+        # Unique per writer, concurrent jobs may write the same target
+        self._temporary_path = f"{file_path}.{os.getpid()}-{id(self)}.tmp"
+        self._block = [] if self.file_format == SQLITE_FORMAT else EventBatch()
+        self._categories = {name: CategoricalColumn() for name in _CATEGORICAL_COLUMNS}
+
+    def __enter__(self) -> 'ProcessedEventsWriter':
+        if self.file_format == SQLITE_FORMAT:
+            # The blocks are inserted as they fill up, so the file is the store itself
+            self._file = SqliteEventStore(self.file_path, insert_batch_rows=self.block_rows)
+        elif self.file_format == COLUMNAR_FORMAT:
+            self._file = open(self._temporary_path, mode='wb')
+            self._file.write(COLUMNAR_MAGIC)
+        else:
+            self._file = open(self._temporary_path, mode='w', encoding='utf-8')
+            if self.file_format == JSON_FORMAT:
+                self._file.write('[')
+        return self
+
+    def write(self, event: Mapping[str, Any]) -> None:
+        if self.file_format == JSON_LINES_FORMAT:
+            self._file.write(json.dumps(event, separators=(',', ':')) + '\n')
+        elif self.file_format == JSON_FORMAT:
+            self._file.write(('\n' if self.events_written == 0 else ',\n') + _json_array_item(event))
+        else:
+            self._block.append(event)
+            if len(self._block) >= self.block_rows:
+                self._flush_block()
+        self.events_written += 1
+
+    def write_events(self, events: Iterable[Mapping[str, Any]]) -> int:
+        written = self.events_written
+        for event in events:
+            self.write(event)
+        return self.events_written - written
+
+    def _flush_block(self) -> None:
+        if self.file_format == SQLITE_FORMAT:
+            if self._block:
+                self._file.append_events(self._block)
+                self._block = []
+        elif len(self._block):
+            self._file.write(encode_columnar_block(self._block, self._categories))
+            self._block = EventBatch()
+
+    # Complete the file and move it to its target, it can be called before leaving the context
+    def close(self) -> None:
+        if self._file is None:
+            return
+        try:
+            if self.file_format == SQLITE_FORMAT:
+                self._flush_block()
+                return
+            if self.file_format == COLUMNAR_FORMAT:
+                self._flush_block()
+            elif self.file_format == JSON_FORMAT:
+                self._file.write('\n]' if self.events_written else ']')
+            self._file.close()
+            os.replace(self._temporary_path, self.file_path)
+        finally:
+            self._discard()
+
+    # The blocks already inserted in a database stay there, only the pending events are dropped
+    def _discard(self) -> None:
+        if self.file_format == SQLITE_FORMAT:
+            self._block = []
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.file_format != SQLITE_FORMAT and os.path.exists(self._temporary_path):
+            os.remove(self._temporary_path)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+
+def write_processed_events(events: Iterable[Mapping[str, Any]], file_path: str, file_format: Optional[str] = None) -> int:
+    with ProcessedEventsWriter(file_path, file_format) as writer:
+        writer.write_events(events)
+    return writer.events_written
+
+
+def iter_processed_events(file_path: str, file_format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    file_format = detect_file_format(file_path, file_format)
+    if file_format == JSON_LINES_FORMAT:
+        # The lines are decoded in groups as one JSON array, a single json.loads call per group
+        with open(file_path, 'r', encoding='utf-8') as f:
+            while True:
+                lines = f.readlines(_JSON_LINES_GROUP_SIZE)
+                if not lines:
+                    break
+                yield from json.loads('[' + ','.join(line for line in lines if not line.isspace()) + ']')
+    elif file_format == JSON_FORMAT:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            events = json.load(f)
+        if not isinstance(events, list):
+            raise ValueError(f"'{file_path}' does not contain a list of events")
+        yield from events
+    elif file_format == SQLITE_FORMAT:
+        with SqliteEventStore(file_path) as store:
+            yield from store.iter_events()
+    else:
+        for batch in iter_columnar_blocks(file_path):
+            yield from batch
+
+
+def read_processed_events(file_path: str, file_format: Optional[str] = None) -> EventBatch:
+    file_format = detect_file_format(file_path, file_format)
+    if file_format == COLUMNAR_FORMAT:
+        return read_columnar_file(file_path)
+    return EventBatch(iter_processed_events(file_path, file_format))
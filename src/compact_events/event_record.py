@@ -0,0 +1,70 @@
+# Compact event record with __slots__, it keeps the dictionary interface used by the basic functions
+# (get, [] and "in"), so it can go through the pipeline and be exported as a dictionary at the API boundary
+
+import sys
+from typing import Any, Dict, Iterator, Mapping
+
+
+EVENT_FIELDS = ('datetime', 'datetime_epoch', 'source_ip', 'destination_ip', 'port', 'event_type', 'priority', 'threat_level')
+
+# Fields of the alerts raised by the correlation stage (the rule and the number of events it correlated), the other
+# events do not have them
+ALERT_FIELDS = ('correlation_rule', 'correlated_events')
+
+# Repeated categorical values are interned, all the records share the same string objects
+_INTERNED_FIELDS = frozenset(('event_type', 'threat_level'))
+
+
+class EventRecord:
+    __slots__ = EVENT_FIELDS
+
+    def __init__(self, **fields: Any):
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, event: Mapping[str, Any]) -> 'EventRecord':
+        record = cls()
+        for key in EVENT_FIELDS:
+            if key in event:
+                record[key] = event[key]
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.keys()}
+
+    def keys(self) -> Iterator[str]:
+        return (key for key in EVENT_FIELDS if hasattr(self, key))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in EVENT_FIELDS:
+            return default
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in EVENT_FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in EVENT_FIELDS:
+            raise KeyError(f"Unknown event field: {key}")
+        if key in _INTERNED_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key: object) -> bool:
+        return key in EVENT_FIELDS and hasattr(self, key)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, EventRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"EventRecord({self.to_dict()!r})"
@@ -0,0 +1,296 @@
+# Pre-aggregated time series of the processed events: the number of events per time bucket broken down by threat level and
+# by event type, maintained as the events are added, so a chart over months of history costs the buckets it returns instead
+# of a scan of the events. Every level of ROLLUP_LEVELS (minute, hour, day) counts the events in buckets aligned on the Unix
+# epoch and keeps its newest "retention" buckets: the fine buckets older than that are dropped and their events stay counted
+# in the coarser buckets that cover them (downsampling), so the storage is bounded whatever the history (2 days of minutes,
+# 90 days of hours, 10 years of days). In memory a level is a dense array('I') of counters per series, a series being a
+# (dimension, value) pair such as ('threat_level', 'High') or ('event_type', 'PORT_SCAN'). The alerts of the correlation
+# stage are not counted, they summarise events that are. The event types get a series each up to MAX_EVENT_TYPE_SERIES, the
+# next ones are counted in the OTHER_EVENT_TYPES series, so junk event types do not grow the rollups without bound
+
+from array import array
+from collections import Counter
+from itertools import compress
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from src.compact_events.event_batch import MISSING, UNKNOWN_EPOCH, EventBatch
+from src.correlation.event_correlation import is_alert_event_type
+
+
+# (bucket width in seconds, buckets kept) of every level, from the finest to the coarsest, every width is a multiple of
+# the previous one
+ROLLUP_LEVELS: Tuple[Tuple[int, int], ...] = ((60, 2 * 1440), (3600, 90 * 24), (86400, 3660))
+
+# Events dated more than this after the current time (e.g. by a source with a wrong clock) are left out of the rollups:
+# the retention of the levels follows the newest counted event, one event in a far future would drop the whole history
+MAX_FUTURE_SECONDS = 86400
+
+# Distinct event types with a series of their own, the events of the other types are counted in OTHER_EVENT_TYPES
+MAX_EVENT_TYPE_SERIES = 100
+OTHER_EVENT_TYPES = 'Other'
+
+# Dimensions of the series
+THREAT_LEVEL = 'threat_level'
+EVENT_TYPE = 'event_type'
+
+# (dimension, value) of a series
+Series = Tuple[str, Any]
+
+# (bucket of a level, dimension, value) -> number of events
+RollupCounts = Dict[Tuple[int, str, Any], int]
+
+
+# Level of the buckets of a width: the coarsest one whose width divides it, the one with the longest history
+def rollup_level_for(width: int, levels: Sequence[Tuple[int, int]] = ROLLUP_LEVELS) -> Tuple[int, int]:
+    if width > 0:
+        for level in reversed(levels):
+            if width % level[0] == 0:
+                return level
+    raise ValueError(f"[ERROR] The bucket width must be a multiple of {levels[0][0]} seconds, received: {width}")
+
+
+# Number of events per (bucket, dimension, value) of a level from the columns of the events: their epochs and their
+# threat levels and event types (labels maps codes, e.g. of categorical columns, to the values). The events without a
+# valid datetime and the ones before the bucket "oldest" are not counted. The grouping runs in Counter, only the distinct
+# groups are visited in Python
+def level_counts(width: int, epochs: Sequence[int], threat_levels: Sequence[Any], event_types: Sequence[Any],
+                 oldest: Optional[int] = None, labels: Optional[Tuple[Sequence[Any], Sequence[Any]]] = None) -> RollupCounts:
+    buckets = [epoch // width for epoch in epochs]
+    oldest = UNKNOWN_EPOCH // width + 1 if oldest is None else max(oldest, UNKNOWN_EPOCH // width + 1)
+    if buckets and min(buckets) < oldest:
+        kept = [bucket >= oldest for bucket in buckets]
+        buckets = list(compress(buckets, kept))
+        threat_levels, event_types = list(compress(threat_levels, kept)), list(compress(event_types, kept))
+    counts: RollupCounts = {}
+    for index, (dimension, values) in enumerate(((THREAT_LEVEL, threat_levels), (EVENT_TYPE, event_types))):
+        label = None if labels is None else labels[index]
+        for (bucket, value), count in Counter(zip(buckets, values)).items():
+            counts[(bucket, dimension, _category(value if label is None else label[value]))] = count
+    return counts
+
+
+# Newest epoch counted by the rollups
+def newest_rollup_epoch() -> int:
+    return int(time.time()) + MAX_FUTURE_SECONDS
+
+
+# Series of some event types (in the order they come) given the event types that already have a series: the event type
+# itself, or OTHER_EVENT_TYPES once there are MAX_EVENT_TYPE_SERIES of them. The new series are added to known
+def event_type_series(event_types: Iterable[Any], known: Set[Any]) -> Dict[Any, Any]:
+    series = {}
+    for event_type in event_types:
+        value = _category(event_type)
+        if value not in known and len(known) < MAX_EVENT_TYPE_SERIES:
+            known.add(value)
+        series[event_type] = value if value in known else OTHER_EVENT_TYPES
+    return series
+
+
+# Counts of every level (by width) of the columns of some events (arguments of level_counts), a level only counts its
+# buckets from oldest[width] on, the events after the epoch "until" and the alerts are not counted. With known_event_types
+# (the event types with a series, see event_type_series) the events of the types beyond the limit are counted in
+# OTHER_EVENT_TYPES. Once a level counted every event, the next ones are coarsened from its counts instead of grouping the
+# events again, so a block of recent events is grouped once
+def rollup_counts(epochs: Sequence[int], threat_levels: Sequence[Any], event_types: Sequence[Any],
+                  levels: Sequence[Tuple[int, int]] = ROLLUP_LEVELS, oldest: Optional[Mapping[int, int]] = None,
+                  labels: Optional[Tuple[Sequence[Any], Sequence[Any]]] = None,
+                  until: Optional[int] = None, known_event_types: Optional[Set[Any]] = None) -> Dict[int, RollupCounts]:
+    if labels is None:
+        alert_types = {value for value in set(event_types) if is_alert_event_type(value)}
+    else:
+        alert_types = {code for code, value in enumerate(labels[1]) if is_alert_event_type(value)}
+    if until is None or not epochs or max(epochs) <= until:
+        until = None
+    if alert_types or until is not None:
+        kept = [(until is None or epoch <= until) and event_type not in alert_types
+                for epoch, event_type in zip(epochs, event_types)]
+        epochs = list(compress(epochs, kept))
+        threat_levels, event_types = list(compress(threat_levels, kept)), list(compress(event_types, kept))
+    if known_event_types is not None:
+        # Only the event types of the counted events take a series
+        if labels is None:
+            series = event_type_series(dict.fromkeys(event_types), known_event_types)
+            if OTHER_EVENT_TYPES in series.values():
+                event_types = [series[event_type] for event_type in event_types]
+        else:
+            present = dict.fromkeys(event_types)
+            series = event_type_series((labels[1][code] for code in present), known_event_types)
+            labels = (labels[0], [series[value] if code in present else value for code, value in enumerate(labels[1])])
+    first_epoch = min(filter(UNKNOWN_EPOCH.__ne__, epochs), default=None)
+    counts: Dict[int, RollupCounts] = {}
+    # (width, counts) of the previous level when it counted every event
+    complete: Optional[Tuple[int, RollupCounts]] = None
+    for width, _ in levels:
+        if first_epoch is None:
+            counts[width] = {}
+            continue
+        if complete is not None:
+            factor = width // complete[0]
+            coarse: RollupCounts = Counter()
+            for (bucket, dimension, value), count in complete[1].items():
+                coarse[(bucket // factor, dimension, value)] += count
+            counts[width] = complete_counts = coarse
+        else:
+            level_oldest = None if oldest is None else oldest.get(width)
+            counts[width] = level_counts(width, epochs, threat_levels, event_types, level_oldest, labels)
+            if level_oldest is not None and first_epoch // width < level_oldest:
+                continue
+            complete_counts = counts[width]
+        complete = (width, complete_counts)
+    return counts
+
+
+# Buckets of a width returned by a query, as bucket numbers (epoch // width). They are the ones of the time window inside the
+# buckets of the level with events, from first to last. The buckets older than the retention before last may have been
+# dropped, a bucket that starts before that is left out as it may only count part of its events
+def bucket_range(width: int, level: Tuple[int, int], first: int, last: int, since: Optional[int] = None,
+                 until: Optional[int] = None) -> range:
+    level_width, retention = level
+    factor = width // level_width
+    start = max(-(-(last - retention + 1) // factor), first // factor)
+    stop = last // factor + 1
+    if since is not None:
+        start = max(start, since // width)
+    if until is not None:
+        stop = min(stop, until // width + 1)
+    return range(start, max(start, stop))
+
+
+# Time series in the format of the timeseries endpoint: the start epoch, the total and the count of every series of each bucket. The
+# series without events in the buckets are left out
+def build_timeseries(width: int, buckets: range, series: Mapping[Series, Sequence[int]]) -> Dict[str, Any]:
+    totals = [0] * len(buckets)
+    breakdowns: Dict[str, Dict[Any, List[int]]] = {THREAT_LEVEL: {}, EVENT_TYPE: {}}
+    for (dimension, value), counts in series.items():
+        if not any(counts):
+            continue
+        breakdowns[dimension][value] = list(counts)
+        if dimension == THREAT_LEVEL:
+            totals = [total + count for total, count in zip(totals, counts)]
+    return {
+        'bucket_seconds': width,
+        'epochs': [bucket * width for bucket in buckets],
+        'total': totals,
+        'threat_levels': breakdowns[THREAT_LEVEL],
+        'event_types': breakdowns[EVENT_TYPE]
+    }
+
+
+# Time series from the (bucket of the level, dimension, value, number of events) rows of the buckets, e.g. read from a database
+def timeseries_from_counts(width: int, level: Tuple[int, int], buckets: range,
+                           rows: Iterable[Tuple[int, str, Any, int]]) -> Dict[str, Any]:
+    factor = width // level[0]
+    series: Dict[Series, List[int]] = {}
+    for bucket, dimension, value, count in rows:
+        counts = series.get((dimension, value))
+        if counts is None:
+            counts = series[(dimension, value)] = [0] * len(buckets)
+        counts[bucket // factor - buckets.start] += count
+    return build_timeseries(width, buckets, series)
+
+
+# Value of a series, the missing ones are 'Unknown' as in the statistics
+def _category(value: Any) -> Any:
+    return 'Unknown' if value is MISSING or value is None else value
+
+
+def _zeros(length: int) -> array:
+    return array('I', [0]) * length
+
+
+class _RollupLevel:
+    """Dense counters of the buckets of one level, from the bucket "first" on"""
+
+    __slots__ = ('width', 'retention', 'first', 'length', 'series')
+
+    def __init__(self, width: int, retention: int):
+        self.width = width
+        self.retention = retention
+        self.first = 0
+        self.length = 0
+        self.series: Dict[Series, array] = {}
+
+    # Oldest bucket kept once the events up to the epoch newest are added
+    def oldest_kept(self, newest: int) -> int:
+        last = newest // self.width
+        if self.length:
+            last = max(last, self.first + self.length - 1)
+        return last - self.retention + 1
+
+    # Add counts of level_counts, the buckets older than the kept ones are only counted by the coarser levels
+    def add(self, counts: RollupCounts) -> None:
+        if not counts:
+            return
+        buckets = [key[0] for key in counts]
+        low, high = min(buckets), max(buckets)
+        if self.length:
+            low, high = min(low, self.first), max(high, self.first + self.length - 1)
+        first = max(low, high - self.retention + 1)
+        if (first, high - first + 1) != (self.first, self.length):
+            self._resize(first, high - first + 1)
+        for (bucket, dimension, value), count in counts.items():
+            position = bucket - first
+            if position < 0:
+                continue
+            values = self.series.get((dimension, value))
+            if values is None:
+                values = self.series[(dimension, value)] = _zeros(self.length)
+            values[position] += count
+
+    def _resize(self, first: int, length: int) -> None:
+        # Move the counters to the buckets from first to first + length - 1, the dropped buckets are the oldest ones
+        start, stop = max(first, self.first), min(first + length, self.first + self.length)
+        for key, values in self.series.items():
+            resized = _zeros(length)
+            if start < stop:
+                resized[start - first:stop - first] = values[start - self.first:stop - self.first]
+            self.series[key] = resized
+        self.first, self.length = first, length
+
+    # Counts of every series in the buckets of a width (a multiple of the level width)
+    def series_counts(self, width: int, buckets: range) -> Dict[Series, Sequence[int]]:
+        factor = width // self.width
+        start, stop = buckets.start * factor - self.first, buckets.stop * factor - self.first
+        if factor == 1:
+            return {key: values[start:stop] for key, values in self.series.items()}
+        # The first bucket can start before the first counters of the level, there were no events
+        return {key: [sum(values[max(position, 0):position + factor]) for position in range(start, stop, factor)]
+                for key, values in self.series.items()}
+
+
+class EventRollups:
+    """Time bucket counts of a set of events at every level of ROLLUP_LEVELS"""
+
+    def __init__(self, levels: Sequence[Tuple[int, int]] = ROLLUP_LEVELS):
+        self.level_specs = tuple(levels)
+        self.levels = [_RollupLevel(width, retention) for width, retention in self.level_specs]
+        # Event types with a series of their own
+        self.event_types: Set[Any] = set()
+
+    # Add the rows of a columnar batch from start to the end, grouped on the codes of the categorical columns. The rows
+    # after "until" (by default newest_rollup_epoch) are left out
+    def add_batch_rows(self, batch: EventBatch, start: int = 0, until: Optional[int] = None) -> None:
+        if start >= len(batch):
+            return
+        until = newest_rollup_epoch() if until is None else until
+        epochs = batch.epochs[start:]
+        threat_levels, event_types = batch.threat_levels.codes[start:], batch.event_types.codes[start:]
+        newest = max(filter(until.__ge__, epochs), default=UNKNOWN_EPOCH)
+        if newest == UNKNOWN_EPOCH:
+            return
+        oldest = {level.width: level.oldest_kept(newest) for level in self.levels}
+        counts = rollup_counts(epochs, threat_levels, event_types, self.level_specs, oldest,
+                               (batch.threat_levels.values, batch.event_types.values), until, self.event_types)
+        for level in self.levels:
+            level.add(counts[level.width])
+
+    # Time series of the buckets of a width in a time window (epochs, inclusive), served by the level of rollup_level_for
+    def timeseries(self, width: int, since: Optional[int] = None, until: Optional[int] = None) -> Dict[str, Any]:
+        spec = rollup_level_for(width, self.level_specs)
+        level = self.levels[self.level_specs.index(spec)]
+        if not level.length:
+            return build_timeseries(width, range(0), {})
+        buckets = bucket_range(width, spec, level.first, level.first + level.length - 1, since, until)
+        return build_timeseries(width, buckets, level.series_counts(width, buckets))
+
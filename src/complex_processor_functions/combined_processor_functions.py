@@ -1,35 +1,325 @@
 # Combine functions to read, normalize, and enrich the events in a complex function.
 
-from typing import Any, Dict, List 
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+import mmap
+import os
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple 
 import logging 
-from src.basic_functions.read_events_from_file import read_events_from_file
+from src.basic_functions.read_events_from_file import read_events_from_file, iter_events_from_file
+from src.basic_functions.read_events_from_file_mmap import iter_events_from_bytes, iter_line_aligned_chunks
 from src.basic_functions.normalize_event_datetime import normalize_event_datetime
 from src.basic_functions.add_threat_level_by_priority import add_threat_level_by_priority
+from src.compact_events.batch_enrichment import add_threat_level_by_priority_to_batch
+from src.compact_events.event_batch import EventBatch
+from src.compact_events.event_file_formats import decode_columnar_block, encode_columnar_block
+from src.correlation.event_correlation import EventCorrelator
+from src.instrumentation import pipeline_metrics
 
 
+# Events read before they go through the next stages, the stages are timed per block in the pipeline metrics
+STAGE_BLOCK_SIZE = 1024
 
 
+# An event is only processed when every field of the log line has a value
+def has_required_fields(event: Dict[str, Any]) -> bool:
+    return bool(event.get('datetime') and event.get('source_ip') and event.get('destination_ip')
+                and event.get('port') and event.get('event_type') and event.get('priority'))
+
+
+# Validate and normalize a block of read events, recording the time and events of both stages
+def validate_normalize_read_events(raw_events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    start = time.perf_counter()
+    valid_events = [event for event in raw_events if has_required_fields(event)]
+    validated = time.perf_counter()
+    normalized_events = [normalize_event_datetime(event) for event in valid_events]
+    normalized = time.perf_counter()
+
+    metrics = pipeline_metrics.PIPELINE_METRICS
+    if len(valid_events) < len(raw_events):
+        metrics.count_rejected('missing_fields', len(raw_events) - len(valid_events))
+    metrics.observe_stage('validate', validated - start, len(raw_events))
+    metrics.observe_stage('normalize', normalized - validated, len(valid_events))
+    return normalized_events
+
+
+# Validate, normalize and enrich a block of read events, recording the time and events of every stage
+def process_read_events(raw_events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    normalized_events = validate_normalize_read_events(raw_events)
+    start = time.perf_counter()
+    processed_events = [add_threat_level_by_priority(event) for event in normalized_events]
+    pipeline_metrics.PIPELINE_METRICS.observe_stage('enrich', time.perf_counter() - start, len(processed_events))
+    return processed_events
+
+
+# Correlation stage: the processed events of a block followed by the alerts they raised in the windows of the correlator
+def correlate_processed_events(events: List[Dict[str, Any]], correlator: EventCorrelator) -> List[Dict[str, Any]]:
+    start = time.perf_counter()
+    alerts = correlator.correlate(events)
+    pipeline_metrics.PIPELINE_METRICS.observe_stage('correlate', time.perf_counter() - start, len(events))
+    return events + alerts if alerts else events
 
 
 def combine_read_file_normalize_timestamp_add_threat_level(
-        file_path: str, max_events: int = 100000) -> List[Dict[str, Any]]:  
+        file_path: str, max_events: Optional[int] = 100000) -> List[Dict[str, Any]]:  
+    start = time.perf_counter()
     raw_events = read_events_from_file(file_path)                           
+    pipeline_metrics.PIPELINE_METRICS.observe_stage('read', time.perf_counter() - start, len(raw_events))
     if not raw_events:                                                      
         print(f"[INFO] It was not found events in '{file_path}'.")
         return []
 
-    if len(raw_events) > max_events:
+    if max_events is not None and len(raw_events) > max_events:
         raise ValueError(f"[ERROR] The file contains {len(raw_events)} events. Limit allowed: {max_events}")      
     logging.info(f"[INFO] Processing {len(raw_events)} events from '{file_path}'...") 
-    processed_events = [                                                         
-        add_threat_level_by_priority(normalize_event_datetime(event)) 
-        for event in raw_events
-        if event.get('datetime') and event.get('source_ip') and event.get('destination_ip')
-        and event.get('port') and event.get('event_type') and event.get('priority')
-         ]
-    
-    return processed_events 
-                                                   
-
-    
-   
+    return process_read_events(raw_events) 
+
+
+# Streaming version of the complex function: the file is read lazily and the events go through the stages
+# in blocks of STAGE_BLOCK_SIZE, so the memory is constant and there is no need for the "max_events" limit.
+# With a correlator the alerts of every block follow its events
+def stream_read_file_normalize_timestamp_add_threat_level(
+        file_path: str, correlator: Optional[EventCorrelator] = None) -> Iterator[Dict[str, Any]]:
+    logging.info(f"[INFO] Streaming events from '{file_path}'...")
+    raw_events = iter_events_from_file(file_path)
+    while True:
+        start = time.perf_counter()
+        block = list(islice(raw_events, STAGE_BLOCK_SIZE))
+        if not block:
+            return
+        pipeline_metrics.PIPELINE_METRICS.observe_stage('read', time.perf_counter() - start, len(block))
+        processed_events = process_read_events(block)
+        yield from processed_events if correlator is None else correlate_processed_events(processed_events, correlator)
+
+
+# Compact version of the complex function: the processed events are kept in a columnar EventBatch instead of
+# a list of dictionaries, every dictionary only lives while it is read, validated and normalized. The enrich stage
+# runs once on the columns of the whole batch (add_threat_level_by_priority_to_batch)
+def combine_read_file_normalize_timestamp_add_threat_level_to_batch(file_path: str) -> EventBatch:
+    batch = EventBatch()
+    raw_events = iter_events_from_file(file_path)
+    while True:
+        start = time.perf_counter()
+        block = list(islice(raw_events, STAGE_BLOCK_SIZE))
+        if not block:
+            break
+        pipeline_metrics.PIPELINE_METRICS.observe_stage('read', time.perf_counter() - start, len(block))
+        batch.extend(validate_normalize_read_events(block))
+
+    start = time.perf_counter()
+    add_threat_level_by_priority_to_batch(batch)
+    pipeline_metrics.PIPELINE_METRICS.observe_stage('enrich', time.perf_counter() - start, len(batch))
+    return batch
+
+
+# Group a stream of events in lists of "batch_size" events, the last batch can be smaller
+def batch_events(events: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    if batch_size < 1:
+        raise ValueError(f"[ERROR] The batch size must be a positive number, received: {batch_size}")
+    events = iter(events)
+    batch = list(islice(events, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(events, batch_size))
+
+
+# Streaming consumer API: deliver the processed events to the "consumer" callable batch by batch,
+# the first results are available before the whole file is read. Returns the number of processed events
+def consume_read_file_normalize_timestamp_add_threat_level(
+        file_path: str,
+        consumer: Callable[[List[Dict[str, Any]]], None],
+        batch_size: int = 1000) -> int:
+    processed_count = 0
+    for batch in batch_events(stream_read_file_normalize_timestamp_add_threat_level(file_path), batch_size):
+        consumer(batch)
+        processed_count += len(batch)
+
+    if processed_count == 0:
+        print(f"[INFO] It was not found events in '{file_path}'.")
+    else:
+        logging.info(f"[INFO] It was processed {processed_count} events from '{file_path}'.")
+    return processed_count
+
+
+# Split the file in up to "shards" byte ranges of similar size, every range starts at the beginning of a line
+def split_file_into_byte_ranges(file_path: str, shards: int) -> List[Tuple[int, int]]:
+    file_size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, mode='rb') as f:
+        for shard in range(1, shards):
+            position = max(file_size * shard // shards, boundaries[-1] + 1)
+            if position >= file_size:
+                break
+            # Move to the first byte after the newline that ends the line containing "position - 1"
+            f.seek(position - 1)
+            f.readline()
+            boundary = f.tell()
+            if boundary >= file_size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+# Read, normalize and enrich a block of complete lines
+def process_event_bytes(data: bytes) -> List[Dict[str, Any]]:
+    start = time.perf_counter()
+    raw_events = list(iter_events_from_bytes(data))
+    pipeline_metrics.PIPELINE_METRICS.observe_stage('read', time.perf_counter() - start, len(raw_events))
+    return process_read_events(raw_events)
+
+
+# Block version of the streaming function: the file is memory-mapped and processed in blocks of complete lines,
+# every block yields (lines read, processed events) so the caller can report progress or stop between blocks
+def stream_read_file_blocks_normalize_timestamp_add_threat_level(
+        file_path: str, block_size: int = 1 << 20) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    try:
+        with open(file_path, mode='rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                for block in iter_line_aligned_chunks(mapped_file, block_size):
+                    lines_read = block.count(b'\n') + (0 if block.endswith(b'\n') else 1)
+                    yield lines_read, process_event_bytes(block)
+    except FileNotFoundError:
+        logging.error(f"[ERROR]: The file in the path '{file_path}' was not found.")
+
+
+# Worker of the parallel mode: process the lines of one byte range of the file
+def process_byte_range(file_path: str, start: int, end: int) -> List[Dict[str, Any]]:
+    with open(file_path, mode='rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return process_event_bytes(data)
+
+
+# Compact worker of the parallel mode: the lines of one byte range in a columnar EventBatch, the enrich stage runs on
+# the columns of the batch as in combine_read_file_normalize_timestamp_add_threat_level_to_batch
+def process_byte_range_to_batch(file_path: str, start: int, end: int) -> EventBatch:
+    with open(file_path, mode='rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    read_start = time.perf_counter()
+    raw_events = list(iter_events_from_bytes(data))
+    pipeline_metrics.PIPELINE_METRICS.observe_stage('read', time.perf_counter() - read_start, len(raw_events))
+    batch = EventBatch(validate_normalize_read_events(raw_events))
+    enrich_start = time.perf_counter()
+    add_threat_level_by_priority_to_batch(batch)
+    pipeline_metrics.PIPELINE_METRICS.observe_stage('enrich', time.perf_counter() - enrich_start, len(batch))
+    return batch
+
+
+# Worker of the process pool: the metrics of the worker process are sent back with the events of the range
+def _process_byte_range_with_metrics(file_path: str, start: int, end: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    pipeline_metrics.PIPELINE_METRICS.reset()
+    events = process_byte_range(file_path, start, end)
+    return events, pipeline_metrics.PIPELINE_METRICS.as_dict()
+
+
+# Compact worker of the process pool: the batch of the range is sent back as one block of the columnar format, the
+# parent decodes it with array.frombytes instead of unpickling a dictionary per event
+def _process_byte_range_to_block_with_metrics(file_path: str, start: int, end: int) -> Tuple[bytes, Dict[str, Any]]:
+    pipeline_metrics.PIPELINE_METRICS.reset()
+    batch = process_byte_range_to_batch(file_path, start, end)
+    return encode_columnar_block(batch), pipeline_metrics.PIPELINE_METRICS.as_dict()
+
+
+# Results of a worker over the byte ranges, in file order, from a process pool. At most "max_pending" ranges are
+# submitted ahead of the consumer, so the finished shards waiting for a slow consumer stay bounded. The metrics of
+# every worker are merged in this process
+def _map_byte_ranges(worker: Callable[[str, int, int], Tuple[Any, Dict[str, Any]]], file_path: str,
+                     byte_ranges: List[Tuple[int, int]], workers: int, max_pending: int) -> Iterator[Any]:
+    with ProcessPoolExecutor(max_workers=min(workers, len(byte_ranges))) as executor:
+        ranges = iter(byte_ranges)
+        pending: Deque[Future] = deque(executor.submit(worker, file_path, start, end)
+                                       for start, end in islice(ranges, max(max_pending, 1)))
+        try:
+            while pending:
+                result, worker_metrics = pending.popleft().result()
+                # The next range runs while the consumer handles this one
+                next_range = next(ranges, None)
+                if next_range is not None:
+                    pending.append(executor.submit(worker, file_path, *next_range))
+                pipeline_metrics.PIPELINE_METRICS.merge(worker_metrics)
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# Byte ranges of the parallel mode and the number of workers, None when the file does not exist
+def _parallel_byte_ranges(file_path: str, workers: Optional[int], shards_per_worker: int,
+                          min_shard_bytes: int) -> Optional[Tuple[List[Tuple[int, int]], int]]:
+    workers = workers or os.cpu_count() or 1
+    try:
+        file_size = os.path.getsize(file_path)
+    except FileNotFoundError:
+        logging.error(f"[ERROR]: The file in the path '{file_path}' was not found.")
+        return None
+    shards = max(1, min(workers * shards_per_worker, file_size // max(min_shard_bytes, 1)))
+    byte_ranges = split_file_into_byte_ranges(file_path, shards)
+    logging.info(f"[INFO] Processing '{file_path}' in {len(byte_ranges)} shards with {workers} workers...")
+    return byte_ranges, workers
+
+
+# Parallel mode: the file is split in byte ranges aligned to newlines and every range is processed in a process pool.
+# The shards are yielded in file order, so the result is the same as the sequential functions, and at most
+# "pending_per_worker" shards per worker are processed ahead of the consumer, so the memory stays bounded. The correlation
+# needs the whole stream, it runs in this process on the shards in order. The event dictionaries of every shard are
+# unpickled in this process, a serial cost that limits the speedup: the batches version avoids it
+def stream_read_file_normalize_timestamp_add_threat_level_parallel(
+        file_path: str,
+        workers: Optional[int] = None,
+        shards_per_worker: int = 4,
+        min_shard_bytes: int = 1 << 20,
+        correlator: Optional[EventCorrelator] = None,
+        pending_per_worker: int = 2) -> Iterator[List[Dict[str, Any]]]:
+    parallel = _parallel_byte_ranges(file_path, workers, shards_per_worker, min_shard_bytes)
+    if parallel is None:
+        return
+    byte_ranges, workers = parallel
+    if workers == 1 or len(byte_ranges) <= 1:
+        shards = (process_byte_range(file_path, start, end) for start, end in byte_ranges)
+    else:
+        shards = _map_byte_ranges(_process_byte_range_with_metrics, file_path, byte_ranges, workers,
+                                  workers * pending_per_worker)
+    for events in shards:
+        yield events if correlator is None else correlate_processed_events(events, correlator)
+
+
+# Compact parallel mode: the shards are yielded as columnar EventBatch objects in file order. The workers build and
+# enrich the batches and send them as columnar blocks, this process only decodes the column arrays, so the work left
+# to it does not grow with the events and the speedup follows the workers. Bounded as the dictionaries version
+def stream_read_file_normalize_timestamp_add_threat_level_parallel_batches(
+        file_path: str,
+        workers: Optional[int] = None,
+        shards_per_worker: int = 4,
+        min_shard_bytes: int = 1 << 20,
+        pending_per_worker: int = 2) -> Iterator[EventBatch]:
+    parallel = _parallel_byte_ranges(file_path, workers, shards_per_worker, min_shard_bytes)
+    if parallel is None:
+        return
+    byte_ranges, workers = parallel
+    if workers == 1 or len(byte_ranges) <= 1:
+        for start, end in byte_ranges:
+            yield process_byte_range_to_batch(file_path, start, end)
+        return
+    for block in _map_byte_ranges(_process_byte_range_to_block_with_metrics, file_path, byte_ranges, workers,
+                                  workers * pending_per_worker):
+        yield decode_columnar_block(block)
+
+
+def combine_read_file_normalize_timestamp_add_threat_level_parallel(
+        file_path: str,
+        workers: Optional[int] = None,
+        min_shard_bytes: int = 1 << 20) -> List[Dict[str, Any]]:
+    processed_events = []
+    for shard_events in stream_read_file_normalize_timestamp_add_threat_level_parallel(
+            file_path, workers=workers, min_shard_bytes=min_shard_bytes):
+        processed_events.extend(shard_events)
+    if not processed_events:
+        print(f"[INFO] It was not found events in '{file_path}'.")
+    return processed_events
@@ -0,0 +1,123 @@
+# Follow a growing event log file: only the complete lines appended since the last run are read, normalized and enriched,
+# and the byte offset reached is saved in a checkpoint file so a restart resumes from it
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from src.complex_processor_functions.combined_processor_functions import correlate_processed_events, process_event_bytes
+from src.correlation.event_correlation import EventCorrelator
+
+
+CHUNK_SIZE = 1 << 22
+
+
+def load_checkpoint(checkpoint_path: str) -> Dict[str, Any]:
+    try:
+        with open(checkpoint_path, mode='r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if isinstance(checkpoint, dict) and isinstance(checkpoint.get('offset'), int):
+            return checkpoint
+        logging.warning(f"[WARNING]: Invalid checkpoint in '{checkpoint_path}', starting from the beginning.")
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"[WARNING]: It was not possible to read the checkpoint '{checkpoint_path}'. Error: {e}")
+    return {'offset': 0, 'device': None, 'inode': None}
+
+
+# The checkpoint is written in a temporary file and renamed, a crash never leaves a half written checkpoint
+def save_checkpoint(checkpoint_path: str, checkpoint: Dict[str, Any]) -> None:
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, mode='w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary_path, checkpoint_path)
+
+
+def _file_identity(stat_result: os.stat_result) -> Tuple[int, int]:
+    return (stat_result.st_dev, stat_result.st_ino)
+
+
+# Read the complete lines from "offset", returns the block and the offset after its last newline.
+# A line longer than "chunk_size" is read until its end
+def _read_complete_lines(f: Any, offset: int, chunk_size: int) -> Tuple[bytes, int]:
+    f.seek(offset)
+    data = f.read(chunk_size)
+    end = data.rfind(b'\n')
+    while end == -1:
+        more = f.read(chunk_size)
+        if not more:
+            return b'', offset
+        end = more.rfind(b'\n')
+        if end != -1:
+            end += len(data)
+        data += more
+    return data[:end + 1], offset + end + 1
+
+
+# Generator of the batches of processed events appended to the file. The checkpoint is saved when the consumer asks
+# for the next batch, so a batch is never lost if the consumer fails (it is processed again after a restart).
+# Rotation (the path points to a new file) and truncation (the file is smaller than the offset) restart from the
+# beginning of the new content. The generator ends when "stop_event" is set, or once the file is drained when
+# "follow" is False (one-shot incremental run, e.g. from a scheduled job). A correlator keeps its windows across the
+# batches, the alerts of a batch follow its events
+def follow_file_normalize_timestamp_add_threat_level(
+        file_path: str,
+        checkpoint_path: str,
+        poll_interval: float = 1.0,
+        chunk_size: int = CHUNK_SIZE,
+        stop_event: Optional[threading.Event] = None,
+        follow: bool = True,
+        correlator: Optional[EventCorrelator] = None) -> Iterator[List[Dict[str, Any]]]:
+    stop_event = stop_event or threading.Event()
+    checkpoint = load_checkpoint(checkpoint_path)
+    f = None
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(file_path, mode='rb')
+                except FileNotFoundError:
+                    f = None
+                if f is not None:
+                    identity = _file_identity(os.fstat(f.fileno()))
+                    if [checkpoint.get('device'), checkpoint.get('inode')] != list(identity):
+                        if checkpoint.get('inode') is not None:
+                            logging.info(f"[INFO] '{file_path}' was rotated, reading the new file from the beginning.")
+                        checkpoint = {'offset': 0, 'device': identity[0], 'inode': identity[1]}
+
+            if f is not None:
+                if os.fstat(f.fileno()).st_size < checkpoint['offset']:
+                    logging.info(f"[INFO] '{file_path}' was truncated, reading it from the beginning.")
+                    checkpoint['offset'] = 0
+
+                while True:
+                    data, next_offset = _read_complete_lines(f, checkpoint['offset'], chunk_size)
+                    if not data:
+                        break
+                    processed_events = process_event_bytes(data)
+                    if correlator is not None and processed_events:
+                        processed_events = correlate_processed_events(processed_events, correlator)
+                    if processed_events:
+                        yield processed_events
+                    checkpoint['offset'] = next_offset
+                    save_checkpoint(checkpoint_path, checkpoint)
+                    if stop_event.is_set():
+                        return
+
+                # Once the old file is drained, a different file in the path means it was rotated
+                try:
+                    rotated = _file_identity(os.stat(file_path)) != _file_identity(os.fstat(f.fileno()))
+                except FileNotFoundError:
+                    rotated = False
+                if rotated:
+                    f.close()
+                    f = None
+                    continue
+
+            if not follow or stop_event.wait(poll_interval):
+                return
+    finally:
+        if f is not None:
+            f.close()
@@ -0,0 +1,196 @@
+# Correlation stage of the pipeline, after add_threat_level_by_priority: the events of one key (by default the source IP)
+# are correlated in a sliding time window and a derived alert event, with an escalated priority and threat level, is
+# emitted when a rule matches:
+#   - count rules: "threshold" events of some types within "window_seconds" (brute force). The epochs of the last
+#     "threshold" events of a key are kept in a ring buffer (deque with maxlen), the rule matches when the newest and
+#     the oldest of them (by epoch, not by arrival) are less than a window apart
+#   - distinct rules: "threshold" distinct values of a field within "window_seconds" (port scan). The last epoch of
+#     every value is kept in a dictionary, the values out of the window of the newest event of the key are dropped when
+#     it reaches the threshold, so it never holds more than "threshold" values
+# The time is the event time (datetime_epoch). The log is not always in time order: the events older than one window
+# before the newest epoch seen (the watermark) are late and ignored by the rules, the other ones count in their window.
+# The memory is bounded with millions of distinct keys: the keys of a rule are kept in the order their newest epoch was
+# reached, the ones idle for longer than the window are evicted from the front (as the late events are ignored, an idle
+# key behind a recent one is evicted at most one window later), and "max_keys" caps the keys of a rule (the least
+# recently seen one is dropped). After an alert the key is quiet for one window, a sustained attack raises one alert per
+# window.
+# The alerts (event types ending in ALERT_SUFFIX) are not correlated again, an alert names the rule that raised it
+# (correlation_rule) and the number of events in the window that matched (correlated_events)
+
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Mapping, Optional, Sequence
+
+
+# Keys kept per rule, about 200 bytes each
+DEFAULT_MAX_KEYS = 200000
+
+# Event types of the alerts, they are derived events and never input of the rules
+ALERT_SUFFIX = '_ALERT'
+
+
+# An alert summarises events that are stored too, the statistics and the rollups do not count it as one more event
+def is_alert_event_type(event_type: Any) -> bool:
+    return isinstance(event_type, str) and event_type.endswith(ALERT_SUFFIX)
+
+
+class CorrelationRule:
+    """Sliding window condition of one correlation rule and the alert it raises"""
+
+    __slots__ = ('name', 'alert_event_type', 'threshold', 'window_seconds', 'event_types', 'key_field',
+                 'distinct_field', 'priority', 'threat_level')
+
+    def __init__(self, name: str, alert_event_type: str, threshold: int, window_seconds: int = 60,
+                 event_types: Optional[Iterable[str]] = None, key_field: str = 'source_ip',
+                 distinct_field: Optional[str] = None, priority: int = 5, threat_level: str = 'High'):
+        if type(threshold) is not int or threshold < 1:
+            raise ValueError(f"[ERROR] The threshold of the correlation rule '{name}' must be a positive integer, received: {threshold!r}")
+        if not isinstance(window_seconds, (int, float)) or window_seconds <= 0:
+            raise ValueError(f"[ERROR] The window of the correlation rule '{name}' must be a positive number of seconds, received: {window_seconds!r}")
+        self.name = name
+        self.alert_event_type = alert_event_type
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        # None matches any event type
+        self.event_types = None if event_types is None else frozenset(event_types)
+        self.key_field = key_field
+        # None counts the events, a field counts its distinct values
+        self.distinct_field = distinct_field
+        self.priority = priority
+        self.threat_level = threat_level
+
+
+DEFAULT_CORRELATION_RULES = (
+    CorrelationRule('brute_force', 'BRUTE_FORCE_ALERT', threshold=5, window_seconds=60,
+                    event_types=('SSH_BRUTE_FORCE', 'LOGIN_FAILED', 'RDP_LOGIN_FAILED')),
+    CorrelationRule('port_scan', 'PORT_SCAN_ALERT', threshold=10, window_seconds=60, distinct_field='port',
+                    event_types=('PORT_SCAN', 'LOGIN_FAILED', 'SSH_BRUTE_FORCE', 'RDP_LOGIN_FAILED',
+                                 'UNAUTHORIZED_ACCESS', 'WEB_ATTACK')),
+)
+
+
+class _KeyWindow:
+    """Sliding window of one key for one rule"""
+
+    __slots__ = ('last_epoch', 'epochs', 'values', 'quiet_until')
+
+    def __init__(self, rule: CorrelationRule):
+        self.last_epoch = 0
+        self.epochs: Optional[Deque[int]] = None if rule.distinct_field else deque(maxlen=rule.threshold)
+        self.values: Optional[Dict[Any, int]] = {} if rule.distinct_field else None
+        self.quiet_until = 0
+
+
+class EventCorrelator:
+    """State of the correlation rules over a stream of processed events, fed block by block"""
+
+    def __init__(self, rules: Sequence[CorrelationRule] = DEFAULT_CORRELATION_RULES, max_keys: int = DEFAULT_MAX_KEYS):
+        if max_keys < 1:
+            raise ValueError(f"[ERROR] The maximum number of keys must be a positive number, received: {max_keys}")
+        self.rules = tuple(rules)
+        self.max_keys = max_keys
+        self._windows: List['OrderedDict[Any, _KeyWindow]'] = [OrderedDict() for _ in self.rules]
+        self.alerts_raised = 0
+        # Keys dropped by max_keys before they were idle, their windows start again
+        self.evicted_keys = 0
+        # Newest epoch seen, the windows of the keys idle since more than a window before it are evicted
+        self.watermark: Optional[int] = None
+
+    @property
+    def key_count(self) -> int:
+        return sum(len(windows) for windows in self._windows)
+
+    # Feed a block of processed events, returns the alerts they raised in the order of the events
+    def correlate(self, events: Iterable[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+        alerts: List[Dict[str, Any]] = []
+        watermark = self.watermark
+        rules = tuple(zip(self.rules, self._windows))
+        max_keys = self.max_keys
+        for event in events:
+            epoch = event.get('datetime_epoch')
+            if epoch is None:
+                continue
+            if watermark is None or epoch > watermark:
+                watermark = epoch
+            age = watermark - epoch
+            event_type = event.get('event_type')
+            if is_alert_event_type(event_type):
+                continue
+            for rule, windows in rules:
+                if rule.event_types is not None and event_type not in rule.event_types:
+                    continue
+                if age > rule.window_seconds:
+                    continue
+                key = event.get(rule.key_field)
+                if key is None:
+                    continue
+                window = windows.get(key)
+                if window is None:
+                    window = windows[key] = _KeyWindow(rule)
+                    if len(windows) > max_keys:
+                        windows.popitem(last=False)
+                        self.evicted_keys += 1
+                elif epoch > window.last_epoch:
+                    windows.move_to_end(key)
+                if epoch > window.last_epoch:
+                    window.last_epoch = epoch
+                if epoch < window.quiet_until:
+                    continue
+                correlated_events = self._matches(rule, window, event, epoch)
+                if correlated_events:
+                    window.quiet_until = epoch + rule.window_seconds
+                    alerts.append(self._alert(rule, event, correlated_events))
+        self.watermark = watermark
+        if watermark is not None:
+            self._evict_idle_keys(watermark)
+        self.alerts_raised += len(alerts)
+        return alerts
+
+    @staticmethod
+    def _matches(rule: CorrelationRule, window: _KeyWindow, event: Mapping[str, Any], epoch: int) -> int:
+        # Record the event in the window of its key. When the rule matches, returns the number of events (or distinct
+        # values) in the window and empties it for the next alert, 0 otherwise
+        if rule.distinct_field is None:
+            epochs = window.epochs
+            epochs.append(epoch)
+            if len(epochs) == rule.threshold and max(epochs) - min(epochs) <= rule.window_seconds:
+                epochs.clear()
+                return rule.threshold
+            return 0
+        value = event.get(rule.distinct_field)
+        if value is None:
+            return 0
+        values = window.values
+        values[value] = max(epoch, values.get(value, epoch))
+        if len(values) < rule.threshold:
+            return 0
+        oldest = window.last_epoch - rule.window_seconds
+        for stale in [seen for seen, seen_epoch in values.items() if seen_epoch < oldest]:
+            del values[stale]
+        correlated_events = len(values)
+        if correlated_events < rule.threshold:
+            return 0
+        values.clear()
+        return correlated_events
+
+    def _evict_idle_keys(self, watermark: int) -> None:
+        # The keys are in the order their newest epoch was reached, the idle ones are at the front (up to one window out of
+        # order, the late events are ignored)
+        for rule, windows in zip(self.rules, self._windows):
+            oldest = watermark - rule.window_seconds
+            while windows:
+                key, window = next(iter(windows.items()))
+                if window.last_epoch >= oldest:
+                    break
+                del windows[key]
+
+    @staticmethod
+    def _alert(rule: CorrelationRule, event: Mapping[str, Any], correlated_events: int) -> Dict[str, Any]:
+        # Derived event with the fields of the event that raised it, the escalated classification replaces its own and
+        # the rule and the number of events it correlated are added
+        alert = dict(event)
+        alert['event_type'] = rule.alert_event_type
+        alert['priority'] = rule.priority
+        alert['threat_level'] = rule.threat_level
+        alert['correlation_rule'] = rule.name
+        alert['correlated_events'] = correlated_events
+        return alert
@@ -0,0 +1,411 @@
+# Embedded SQLite storage of the processed events. The history accumulates across runs in one database file (WAL journal,
+# so the readers do not block the writer), the events are inserted in batched transactions and the queries of the dashboard
+# are answered by the indexes: time order, threat level, event type and IP address ranges. The id of an event is its data
+# version, AUTOINCREMENT never reuses it. Per (threat level, event type) counters are updated in the same transactions,
+# so the overall statistics do not scan the events, and so are the time bucket rollups of ROLLUP_LEVELS: one row per
+# (bucket width, bucket, dimension, value), the buckets older than the retention of their level are deleted as newer
+# ones are written, so a time series reads the rows of the buckets it returns. The event types with a series of their own
+# (up to MAX_EVENT_TYPE_SERIES) are recorded in rollup_event_types, the rollups of the others are counted in OTHER_EVENT_TYPES.
+# The fields of the correlation alerts
+# (ALERT_FIELDS) are nullable columns of the events, NULL for the other events
+
+from contextlib import contextmanager
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from src.basic_functions.normalize_event_datetime import normalized_datetime_to_epoch
+from src.compact_events.event_batch import UNKNOWN_EPOCH, ip_to_key
+from src.compact_events.event_record import ALERT_FIELDS, EVENT_FIELDS
+from src.compact_events.event_rollups import (EVENT_TYPE, MAX_EVENT_TYPE_SERIES, ROLLUP_LEVELS, newest_rollup_epoch,
+                                              rollup_counts)
+
+
+# Events inserted per transaction
+DEFAULT_INSERT_BATCH_ROWS = 10000
+
+# Seconds a connection waits for the write lock of another process
+_BUSY_TIMEOUT_SECONDS = 30
+
+# Largest epoch of a time window, the SQLite integers are signed 64 bits
+_MAX_EPOCH = (1 << 63) - 1
+
+# (IP version, first address, last address) of an IP filter, as integers
+IpRange = Tuple[int, int, int]
+
+# (threat_level, event_type, number of events, newest epoch) of a group of events, missing values are 'Unknown'
+CountGroup = Tuple[Any, Any, int, Optional[int]]
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    datetime,
+    datetime_epoch INTEGER NOT NULL,
+    source_ip,
+    source_ip_key,
+    destination_ip,
+    destination_ip_key,
+    port,
+    event_type,
+    priority,
+    threat_level,
+    correlation_rule,
+    correlated_events
+);
+CREATE INDEX IF NOT EXISTS events_by_time ON events (datetime_epoch DESC, id);
+CREATE INDEX IF NOT EXISTS events_by_threat_level ON events (threat_level, datetime_epoch DESC, id);
+CREATE INDEX IF NOT EXISTS events_by_event_type ON events (event_type, datetime_epoch DESC, id);
+CREATE INDEX IF NOT EXISTS events_by_source_ip ON events (source_ip_key);
+CREATE INDEX IF NOT EXISTS events_by_destination_ip ON events (destination_ip_key);
+CREATE TABLE IF NOT EXISTS event_counts (
+    threat_level NOT NULL,
+    event_type NOT NULL,
+    events INTEGER NOT NULL,
+    last_epoch INTEGER NOT NULL,
+    PRIMARY KEY (threat_level, event_type)
+);
+CREATE TABLE IF NOT EXISTS event_rollups (
+    width INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    dimension TEXT NOT NULL,
+    value NOT NULL,
+    events INTEGER NOT NULL,
+    PRIMARY KEY (width, bucket, dimension, value)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_event_types (
+    value PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS store_info (
+    name TEXT PRIMARY KEY,
+    value
+);
+'''
+
+# The columns have no type affinity (except the epoch), the values are returned with the type they were inserted with
+_INSERT_EVENT = '''
+INSERT INTO events (datetime, datetime_epoch, source_ip, source_ip_key, destination_ip, destination_ip_key,
+                    port, event_type, priority, threat_level, correlation_rule, correlated_events)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_ADD_COUNTS = '''
+INSERT INTO event_counts (threat_level, event_type, events, last_epoch) VALUES (?, ?, ?, ?)
+ON CONFLICT (threat_level, event_type) DO UPDATE
+SET events = events + excluded.events, last_epoch = MAX(last_epoch, excluded.last_epoch)
+'''
+
+_ADD_ROLLUP = '''
+INSERT INTO event_rollups (width, bucket, dimension, value, events) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (width, bucket, dimension, value) DO UPDATE SET events = events + excluded.events
+'''
+
+_ADD_ROLLUP_EVENT_TYPE = 'INSERT OR IGNORE INTO rollup_event_types (value) VALUES (?)'
+
+_DROP_OLD_ROLLUPS = '''
+DELETE FROM event_rollups
+WHERE width = ? AND bucket <= (SELECT MAX(bucket) FROM event_rollups WHERE width = ?) - ?
+'''
+
+# Columns exported as an event, in the order of EVENT_FIELDS and ALERT_FIELDS, followed by the id
+_EXPORTED_FIELDS = EVENT_FIELDS + ALERT_FIELDS
+_EVENT_COLUMNS = ', '.join(_EXPORTED_FIELDS) + ', id'
+
+# Newest first, the id orders the events with the same datetime
+_TIME_ORDER = 'ORDER BY datetime_epoch DESC, id'
+
+
+# Indexed key of an IP address: the integer of an IPv4 address, the 16 bytes of an IPv6 one (SQLite orders
+# every INTEGER before every BLOB, so the two ranges never mix)
+def _ip_key(version: int, address: int) -> Union[int, bytes]:
+    return address if version == 4 else address.to_bytes(16, 'big')
+
+
+def _ip_key_of(value: Any) -> Union[int, bytes, None]:
+    key = ip_to_key(value)
+    return None if key is None else _ip_key(*key)
+
+
+def _event_row(event: Mapping[str, Any]) -> Tuple[Any, ...]:
+    get = event.get
+    epoch = normalized_datetime_to_epoch(get('datetime'))
+    source_ip, destination_ip = get('source_ip'), get('destination_ip')
+    return (get('datetime'), UNKNOWN_EPOCH if epoch is None else epoch, source_ip, _ip_key_of(source_ip),
+            destination_ip, _ip_key_of(destination_ip), get('port'), get('event_type'), get('priority'),
+            get('threat_level'), get('correlation_rule'), get('correlated_events'))
+
+
+# Event dictionary of a selected row, the NULL columns are missing fields
+def _row_event(row: Sequence[Any]) -> Dict[str, Any]:
+    event = {field: value for field, value in zip(_EXPORTED_FIELDS, row) if value is not None}
+    if event.get('datetime_epoch') == UNKNOWN_EPOCH:
+        del event['datetime_epoch']
+    return event
+
+
+class SqliteEventStore:
+    """Processed events stored in a SQLite database file, queried in place instead of being loaded in memory"""
+
+    def __init__(self, path: str, insert_batch_rows: int = DEFAULT_INSERT_BATCH_ROWS):
+        # The connections are pooled: a thread takes one for a query and gives it back, so the
+        # short lived request threads of the server do not open a connection each
+        self.path = path
+        self.insert_batch_rows = insert_batch_rows
+        self._idle: List[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        with self._write_lock, self._connection() as connection:
+            connection.executescript(_SCHEMA)
+            self._add_alert_columns(connection)
+            self._build_rollups(connection)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode, the writes open their transactions explicitly
+        connection = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT_SECONDS, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        # 32 MiB of pages, the index updates of an insert block stay in memory
+        connection.execute('PRAGMA cache_size=-32768')
+        return connection
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        with self._pool_lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            connection = self._connect()
+        try:
+            yield connection
+        finally:
+            with self._pool_lock:
+                if self._closed:
+                    connection.close()
+                else:
+                    self._idle.append(connection)
+
+    def close(self) -> None:
+        with self._pool_lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def __enter__(self) -> 'SqliteEventStore':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    # Version of the newest stored event, it keeps growing after clear
+    @property
+    def version(self) -> int:
+        with self._connection() as connection:
+            row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        return 0 if row is None else row[0]
+
+    # Version of the events removed by the last clear, the older versions are not known anymore
+    @property
+    def base_version(self) -> int:
+        with self._connection() as connection:
+            row = connection.execute("SELECT value FROM store_info WHERE name = 'base_version'").fetchone()
+        return 0 if row is None else row[0]
+
+    def __len__(self) -> int:
+        with self._connection() as connection:
+            return connection.execute('SELECT COALESCE(SUM(events), 0) FROM event_counts').fetchone()[0]
+
+    # Insert events in transactions of insert_batch_rows, returns the versions (ids) of the inserted events
+    def append_events(self, events: Iterable[Mapping[str, Any]]) -> range:
+        first_version = last_version = None
+        block: List[Tuple[Any, ...]] = []
+        with self._write_lock, self._connection() as connection:
+            for event in events:
+                block.append(_event_row(event))
+                if len(block) >= self.insert_batch_rows:
+                    versions = self._insert_block(connection, block)
+                    first_version = versions.start if first_version is None else first_version
+                    last_version = versions.stop
+                    block = []
+            if block:
+                versions = self._insert_block(connection, block)
+                first_version = versions.start if first_version is None else first_version
+                last_version = versions.stop
+        if first_version is None:
+            return range(0)
+        return range(first_version, last_version)
+
+    def _insert_block(self, connection: sqlite3.Connection, rows: List[Tuple[Any, ...]]) -> range:
+        groups: Dict[Tuple[Any, Any], List[int]] = {}
+        for row in rows:
+            key = ('Unknown' if row[9] is None else row[9], 'Unknown' if row[7] is None else row[7])
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [1, row[1]]
+            else:
+                group[0] += 1
+                if row[1] > group[1]:
+                    group[1] = row[1]
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(_INSERT_EVENT, rows)
+            connection.executemany(_ADD_COUNTS, [key + tuple(group) for key, group in groups.items()])
+            self._add_rollups(connection, [row[1] for row in rows], [row[9] for row in rows], [row[7] for row in rows])
+            last_version = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()[0]
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return range(last_version - len(rows) + 1, last_version + 1)
+
+    @staticmethod
+    def _add_rollups(connection: sqlite3.Connection, epochs: List[int], threat_levels: List[Any],
+                     event_types: List[Any]) -> None:
+        # Add the events to the rollups of every level in the transaction of the caller, then drop the old buckets. The
+        # events dated in the future (newest_rollup_epoch) are left out, they would move the retention past the history.
+        # The event types are read in the transaction, the ones of the other writers are seen
+        known_event_types = {row[0] for row in connection.execute('SELECT value FROM rollup_event_types')}
+        new_event_types = set(known_event_types)
+        counts_by_width = rollup_counts(epochs, threat_levels, event_types, until=newest_rollup_epoch(),
+                                        known_event_types=new_event_types)
+        connection.executemany(_ADD_ROLLUP_EVENT_TYPE, [(value,) for value in new_event_types - known_event_types])
+        for width, counts in counts_by_width.items():
+            connection.executemany(_ADD_ROLLUP, [(width,) + key + (count,) for key, count in counts.items()])
+        for width, retention in ROLLUP_LEVELS:
+            connection.execute(_DROP_OLD_ROLLUPS, (width, width, retention))
+
+    @staticmethod
+    def _add_alert_columns(connection: sqlite3.Connection) -> None:
+        # A database written before the alert fields gets their columns, NULL for the stored events
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(events)')}
+        for field in ALERT_FIELDS:
+            if field not in columns:
+                connection.execute(f'ALTER TABLE events ADD COLUMN {field}')
+
+    def _build_rollups(self, connection: sqlite3.Connection) -> None:
+        # Roll up the events of a database written before the rollups existed, once. The event types of rollups written
+        # before rollup_event_types existed keep their series
+        if connection.execute("SELECT 1 FROM store_info WHERE name = 'rollups'").fetchone():
+            if not connection.execute('SELECT 1 FROM rollup_event_types').fetchone():
+                connection.execute(
+                    "INSERT OR IGNORE INTO rollup_event_types (value) "
+                    "SELECT DISTINCT value FROM event_rollups WHERE dimension = ? LIMIT ?",
+                    (EVENT_TYPE, MAX_EVENT_TYPE_SERIES))
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = connection.execute('SELECT datetime_epoch, threat_level, event_type FROM events ORDER BY id')
+            while True:
+                rows = cursor.fetchmany(self.insert_batch_rows)
+                if not rows:
+                    break
+                self._add_rollups(connection, *map(list, zip(*rows)))
+            connection.execute("INSERT OR REPLACE INTO store_info (name, value) VALUES ('rollups', 1)")
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    # Remove every event, the versions keep growing after a gap: the version of the store is bumped even when no event
+    # is added, and every version of the removed events is older than the base version
+    def clear(self) -> None:
+        with self._write_lock, self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM events')
+                connection.execute('DELETE FROM event_counts')
+                connection.execute('DELETE FROM event_rollups')
+                connection.execute('DELETE FROM rollup_event_types')
+                if connection.execute("UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'events'").rowcount == 0:
+                    connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('events', 1)")
+                connection.execute(
+                    "INSERT OR REPLACE INTO store_info (name, value) "
+                    "SELECT 'base_version', seq FROM sqlite_sequence WHERE name = 'events'")
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    # Every stored event in the order they were inserted
+    def iter_events(self) -> Iterator[Dict[str, Any]]:
+        with self._connection() as connection:
+            cursor = connection.execute(f'SELECT {_EVENT_COLUMNS} FROM events ORDER BY id')
+            while True:
+                rows = cursor.fetchmany(self.insert_batch_rows)
+                if not rows:
+                    break
+                yield from map(_row_event, rows)
+
+    @staticmethod
+    def _conditions(
+        threat_level: Optional[str] = None,
+        event_type: Optional[str] = None,
+        source_range: Optional[IpRange] = None,
+        destination_range: Optional[IpRange] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        after_version: Optional[int] = None,
+        until_version: Optional[int] = None
+    ) -> Tuple[str, List[Any]]:
+        # WHERE clause of the filters, the events without a valid datetime are out of any time window
+        conditions, parameters = [], []
+        if threat_level:
+            conditions.append('threat_level = ?')
+            parameters.append(threat_level)
+        if event_type:
+            conditions.append('event_type = ?')
+            parameters.append(event_type)
+        for column, ip_range in (('source_ip_key', source_range), ('destination_ip_key', destination_range)):
+            if ip_range is not None:
+                version, first, last = ip_range
+                conditions.append(f'{column} BETWEEN ? AND ?')
+                parameters += [_ip_key(version, first), _ip_key(version, last)]
+        if since is not None or until is not None:
+            conditions.append('datetime_epoch BETWEEN ? AND ?')
+            parameters += [UNKNOWN_EPOCH + 1 if since is None else max(since, UNKNOWN_EPOCH + 1),
+                           _MAX_EPOCH if until is None else until]
+        if after is not None:
+            # Keyset of the time order: an older datetime, or the same one and a later id
+            conditions.append('datetime_epoch <= ? AND (datetime_epoch < ? OR id > ?)')
+            parameters += [after[0], after[0], after[1]]
+        if after_version is not None:
+            conditions.append('id > ?')
+            parameters.append(after_version)
+        if until_version is not None:
+            conditions.append('id <= ?')
+            parameters.append(until_version)
+        return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+    # Newest events matching the filters (keyword arguments of _conditions), as (version, event) pairs
+    def newest_events(self, limit: int, **filters: Any) -> List[Tuple[int, Dict[str, Any]]]:
+        if limit <= 0:
+            return []
+        where, parameters = self._conditions(**filters)
+        with self._connection() as connection:
+            rows = connection.execute(f'SELECT {_EVENT_COLUMNS} FROM events {where} {_TIME_ORDER} LIMIT ?',
+                                      parameters + [limit]).fetchall()
+        return [(row[-1], _row_event(row)) for row in rows]
+
+    # Number of events and newest epoch per (threat level, event type), of a time window or of every event
+    def count_groups(self, since: Optional[int] = None, until: Optional[int] = None) -> List[CountGroup]:
+        with self._connection() as connection:
+            if since is None and until is None:
+                return connection.execute('SELECT threat_level, event_type, events, last_epoch FROM event_counts').fetchall()
+            where, parameters = self._conditions(since=since, until=until)
+            return connection.execute(
+                "SELECT COALESCE(threat_level, 'Unknown'), COALESCE(event_type, 'Unknown'), COUNT(*), MAX(datetime_epoch) "
+                f'FROM events {where} GROUP BY 1, 2', parameters).fetchall()
+
+    # First and last bucket of the rollups of a bucket width (a level of ROLLUP_LEVELS), None when there are none
+    def rollup_bounds(self, width: int) -> Optional[Tuple[int, int]]:
+        with self._connection() as connection:
+            row = connection.execute('SELECT MIN(bucket), MAX(bucket) FROM event_rollups WHERE width = ?', (width,)).fetchone()
+        return None if row[0] is None else row
+
+    # (bucket, dimension, value, number of events) of the rollups of a bucket width, from the bucket first to last
+    def rollup_rows(self, width: int, first: int, last: int) -> List[Tuple[int, str, Any, int]]:
+        with self._connection() as connection:
+            return connection.execute(
+                'SELECT bucket, dimension, value, events FROM event_rollups WHERE width = ? AND bucket BETWEEN ? AND ?',
+                (width, first, last)).fetchall()
@@ -0,0 +1,138 @@
+# Aggregated metrics of the processing pipeline, they replace the per-event log lines of the hot path:
+#   - per stage (read, validate, normalize, enrich, correlate): events, seconds and a histogram of the block durations
+#   - counters of the rejected lines by reason, unparseable dates, dates parsed by the dateutil fallback
+#     and the unknown event types
+# The stages are timed per block of events by the complex functions, the basic functions only count the
+# exceptional cases. Per-event debug logging is emitted only when it is enabled explicitly, with
+# set_debug_logging(True) or the PIPELINE_DEBUG_LOGGING environment variable
+
+from bisect import bisect_left
+import os
+import threading
+from typing import Any, Dict
+
+
+STAGES = ('read', 'validate', 'normalize', 'enrich', 'correlate')
+
+# Upper bounds (seconds) of the buckets of the block duration histogram, the last bucket has no bound
+HISTOGRAM_BOUNDS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+# Distinct unknown event types that are counted one by one, the rest are added to OTHER_EVENT_TYPES
+MAX_UNKNOWN_EVENT_TYPES = 100
+OTHER_EVENT_TYPES = '(other)'
+
+# Checked by the basic functions before formatting any per-event log line
+DEBUG_LOGGING = os.environ.get('PIPELINE_DEBUG_LOGGING', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def set_debug_logging(enabled: bool) -> None:
+    global DEBUG_LOGGING
+    DEBUG_LOGGING = bool(enabled)
+
+
+class StageMetrics:
+    """Events, time and block duration histogram of one pipeline stage"""
+
+    def __init__(self):
+        self.blocks = 0
+        self.events = 0
+        self.seconds = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def observe(self, seconds: float, events: int) -> None:
+        self.blocks += 1
+        self.events += events
+        self.seconds += seconds
+        self.histogram[bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+
+    def merge(self, other: Dict[str, Any]) -> None:
+        self.blocks += other['blocks']
+        self.events += other['events']
+        self.seconds += other['seconds']
+        for bucket, count in enumerate(other['histogram']):
+            self.histogram[bucket] += count
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'blocks': self.blocks,
+            'events': self.events,
+            'seconds': self.seconds,
+            'events_per_second': self.events / self.seconds if self.seconds > 0 else None,
+            'histogram': list(self.histogram),
+        }
+
+
+class PipelineMetrics:
+    """Thread safe registry of the pipeline metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread_counts = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stages = {stage: StageMetrics() for stage in STAGES}
+            self.rejected: Dict[str, int] = {}
+            self.counters: Dict[str, int] = {'dates_unparseable': 0, 'dates_parsed_with_fallback': 0}
+            self.unknown_event_types: Dict[str, int] = {}
+
+    def observe_stage(self, stage: str, seconds: float, events: int) -> None:
+        with self._lock:
+            self.stages[stage].observe(seconds, events)
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def count_rejected(self, reason: str, amount: int = 1) -> None:
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + amount
+        self._thread_counts.rejected = self.thread_rejected() + amount
+
+    # Rejected lines counted by the calling thread, whatever the reason. The registry is shared by the threads (e.g. the
+    # processing jobs running at the same time), a thread gets the lines rejected by its own work as a difference
+    def thread_rejected(self) -> int:
+        return getattr(self._thread_counts, 'rejected', 0)
+
+    def count_unknown_event_type(self, event_type: Any, amount: int = 1) -> None:
+        key = str(event_type)
+        with self._lock:
+            if key not in self.unknown_event_types and len(self.unknown_event_types) >= MAX_UNKNOWN_EVENT_TYPES:
+                key = OTHER_EVENT_TYPES
+            self.unknown_event_types[key] = self.unknown_event_types.get(key, 0) + amount
+
+    # Add the metrics exported by another registry, e.g. the one of a worker process
+    def merge(self, other: Dict[str, Any]) -> None:
+        for stage, values in other['stages'].items():
+            with self._lock:
+                self.stages[stage].merge(values)
+        for reason, count in other['rejected'].items():
+            self.count_rejected(reason, count)
+        for counter, count in other['counters'].items():
+            self.increment(counter, count)
+        for event_type, count in other['unknown_event_types'].items():
+            self.count_unknown_event_type(event_type, count)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'stages': {stage: metrics.as_dict() for stage, metrics in self.stages.items()},
+                'rejected': dict(self.rejected),
+                'counters': dict(self.counters),
+                'unknown_event_types': dict(self.unknown_event_types),
+                'histogram_bounds_seconds': list(HISTOGRAM_BOUNDS),
+                'debug_logging': DEBUG_LOGGING,
+            }
+
+
+# Registry used by the pipeline functions of this process
+PIPELINE_METRICS = PipelineMetrics()
+
+
+def get_pipeline_metrics() -> Dict[str, Any]:
+    return PIPELINE_METRICS.as_dict()
+
+
+def reset_pipeline_metrics() -> None:
+    PIPELINE_METRICS.reset()
@@ -0,0 +1,275 @@
+# Configurable classification rules for the priority and the threat level of the events. Every rule has conditions
+# (event_type, port, source_cidr, destination_cidr, a missing condition matches any value, a list matches any of its
+# values) and sets the priority and/or the threat level of the events that match all of them.
+# The rules are compiled into one bitset (a Python int, bit i = rule i) per condition value:
+#   - hash tables {value: bitset} for the exact matches (event_type, port)
+#   - sorted CIDR boundary tables for the subnets: every elementary interval between two boundaries has the bitset
+#     of the rules whose subnets cover it, and the interval of an address is found with bisect
+# The rules matched by an event are the AND of the bitsets of its values and the first one in precedence order is
+# the lowest set bit, so the cost of a classification does not grow with the number of rules evaluated one by one.
+# The precedence is the order of the rules in the file, the default rules (one per EVENT_PRIORITY_MAP event type)
+# go after them unless "include_default_rules" is false. The file is set with the CLASSIFICATION_RULES_FILE
+# environment variable, without it only the default rules are used
+
+from bisect import bisect_right
+import ipaddress
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from src.basic_functions.assign_priority_by_event_type import EVENT_PRIORITY_MAP
+from src.compact_events.event_batch import ip_to_key
+
+
+RULES_FILE_ENVIRONMENT_VARIABLE = 'CLASSIFICATION_RULES_FILE'
+
+CONDITION_FIELDS = ('event_type', 'port', 'source_cidr', 'destination_cidr')
+ACTION_FIELDS = ('priority', 'threat_level')
+
+# Event field checked by every condition
+EVENT_FIELD_BY_CONDITION = {'event_type': 'event_type', 'port': 'port',
+                            'source_cidr': 'source_ip', 'destination_cidr': 'destination_ip'}
+
+# Priorities of the 1 to 5 scale of EVENT_PRIORITY_MAP
+MIN_PRIORITY = 1
+MAX_PRIORITY = 5
+
+
+def _as_list(value: Any) -> List[Any]:
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class ClassificationRule:
+    """Conditions and actions of one classification rule"""
+
+    __slots__ = ('name', 'event_types', 'ports', 'source_networks', 'destination_networks', 'priority', 'threat_level')
+
+    def __init__(self, name: str, event_types: Optional[List[str]] = None, ports: Optional[List[int]] = None,
+                 source_networks: Optional[List[Any]] = None, destination_networks: Optional[List[Any]] = None,
+                 priority: Optional[int] = None, threat_level: Optional[str] = None):
+        self.name = name
+        self.event_types = event_types
+        self.ports = ports
+        self.source_networks = source_networks
+        self.destination_networks = destination_networks
+        self.priority = priority
+        self.threat_level = threat_level
+
+    # Build a rule from its configuration, "position" names the rules without "name" in the error messages
+    @classmethod
+    def from_dict(cls, config: Mapping[str, Any], position: int = 0) -> 'ClassificationRule':
+        if not isinstance(config, Mapping):
+            raise ValueError(f"[ERROR] The rule {position} must be an object, received: {config!r}")
+        name = str(config.get('name', f'rule_{position}'))
+        unknown_fields = set(config) - set(CONDITION_FIELDS) - set(ACTION_FIELDS) - {'name'}
+        if unknown_fields:
+            raise ValueError(f"[ERROR] Unknown fields {sorted(unknown_fields)} in the rule '{name}'")
+
+        priority = config.get('priority')
+        if priority is not None and (type(priority) is not int or not MIN_PRIORITY <= priority <= MAX_PRIORITY):
+            raise ValueError(f"[ERROR] The priority of the rule '{name}' must be an integer from {MIN_PRIORITY} to {MAX_PRIORITY}, received: {priority!r}")
+        threat_level = config.get('threat_level')
+        if threat_level is not None and (not isinstance(threat_level, str) or not threat_level):
+            raise ValueError(f"[ERROR] The threat level of the rule '{name}' must be a non empty string, received: {threat_level!r}")
+        if priority is None and threat_level is None:
+            raise ValueError(f"[ERROR] The rule '{name}' must set a priority or a threat level")
+
+        event_types = None
+        if 'event_type' in config:
+            event_types = _as_list(config['event_type'])
+            if not event_types or not all(isinstance(event_type, str) and event_type for event_type in event_types):
+                raise ValueError(f"[ERROR] The event types of the rule '{name}' must be non empty strings, received: {config['event_type']!r}")
+        ports = None
+        if 'port' in config:
+            ports = _as_list(config['port'])
+            if not ports or not all(type(port) is int and 0 <= port <= 0xFFFF for port in ports):
+                raise ValueError(f"[ERROR] The ports of the rule '{name}' must be integers from 0 to 65535, received: {config['port']!r}")
+
+        networks = {}
+        for condition in ('source_cidr', 'destination_cidr'):
+            if condition not in config:
+                networks[condition] = None
+                continue
+            try:
+                networks[condition] = [ipaddress.ip_network(cidr, strict=False) for cidr in _as_list(config[condition])]
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"[ERROR] Invalid {condition} in the rule '{name}': {e}") from e
+            if not networks[condition]:
+                raise ValueError(f"[ERROR] The {condition} list of the rule '{name}' is empty")
+
+        return cls(name, event_types, ports, networks['source_cidr'], networks['destination_cidr'], priority, threat_level)
+
+    def to_dict(self) -> Dict[str, Any]:
+        config = {'name': self.name}
+        for condition, values in (('event_type', self.event_types), ('port', self.ports),
+                                  ('source_cidr', self.source_networks), ('destination_cidr', self.destination_networks)):
+            if values is not None:
+                config[condition] = [str(value) for value in values] if condition.endswith('cidr') else list(values)
+        for action in ACTION_FIELDS:
+            if getattr(self, action) is not None:
+                config[action] = getattr(self, action)
+        return config
+
+    # Slow reference implementation, the rules are evaluated through RuleSet
+    def matches(self, event: Mapping[str, Any]) -> bool:
+        if self.event_types is not None and event.get('event_type') not in self.event_types:
+            return False
+        if self.ports is not None and (type(event.get('port')) is not int or event.get('port') not in self.ports):
+            return False
+        for networks, field in ((self.source_networks, 'source_ip'), (self.destination_networks, 'destination_ip')):
+            if networks is not None:
+                key = ip_to_key(event.get(field))
+                if key is None or not any(network.version == key[0] and int(network.network_address) <= key[1] <= int(network.broadcast_address)
+                                          for network in networks):
+                    return False
+        return True
+
+
+class _CidrTable:
+    """Sorted boundaries of the subnets of one IP version and the bitset of the interval that starts at each of them"""
+
+    def __init__(self, ranges_by_bit: Dict[int, List[Tuple[int, int]]]):
+        # The ranges of every rule are merged, so the bit of a rule is toggled on at the start of a range and off after its end
+        toggles: Dict[int, int] = {}
+        for bit, ranges in ranges_by_bit.items():
+            merged: List[List[int]] = []
+            for first, last in sorted(ranges):
+                if merged and first <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], last)
+                else:
+                    merged.append([first, last])
+            for first, last in merged:
+                toggles[first] = toggles.get(first, 0) ^ (1 << bit)
+                toggles[last + 1] = toggles.get(last + 1, 0) ^ (1 << bit)
+        self.bounds = sorted(toggles)
+        self.masks = []
+        mask = 0
+        for bound in self.bounds:
+            mask ^= toggles[bound]
+            self.masks.append(mask)
+
+    def lookup(self, address: int) -> int:
+        index = bisect_right(self.bounds, address) - 1
+        return self.masks[index] if index >= 0 else 0
+
+
+class RuleSet:
+    """Classification rules compiled into per condition bitsets, the first matching rule wins"""
+
+    def __init__(self, rules: Iterable[ClassificationRule]):
+        self.rules = list(rules)
+        self._all_rules = (1 << len(self.rules)) - 1
+        self._event_type_masks: Dict[str, int] = {}
+        self._port_masks: Dict[int, int] = {}
+        self._cidr_tables: Dict[str, Dict[int, _CidrTable]] = {}
+        # Rules without a condition on a field match any value of it
+        self._any_value_masks = {field: 0 for field in EVENT_FIELD_BY_CONDITION.values()}
+
+        ranges: Dict[str, Dict[int, Dict[int, List[Tuple[int, int]]]]] = {'source_ip': {4: {}, 6: {}}, 'destination_ip': {4: {}, 6: {}}}
+        for bit, rule in enumerate(self.rules):
+            for values, masks, field in ((rule.event_types, self._event_type_masks, 'event_type'),
+                                         (rule.ports, self._port_masks, 'port')):
+                if values is None:
+                    self._any_value_masks[field] |= 1 << bit
+                for value in values or ():
+                    masks[value] = masks.get(value, 0) | 1 << bit
+            for networks, field in ((rule.source_networks, 'source_ip'), (rule.destination_networks, 'destination_ip')):
+                if networks is None:
+                    self._any_value_masks[field] |= 1 << bit
+                for network in networks or ():
+                    ranges[field][network.version].setdefault(bit, []).append(
+                        (int(network.network_address), int(network.broadcast_address)))
+        for field, ranges_by_version in ranges.items():
+            self._cidr_tables[field] = {version: _CidrTable(ranges_by_bit) for version, ranges_by_bit in ranges_by_version.items()}
+
+        # Fields with at least one condition, the rest are not looked up
+        self.constrained_fields = frozenset(field for field, mask in self._any_value_masks.items() if mask != self._all_rules)
+        self._by_event_type = 'event_type' in self.constrained_fields
+        self._by_port = 'port' in self.constrained_fields
+        self._by_source_ip = 'source_ip' in self.constrained_fields
+        self._by_destination_ip = 'destination_ip' in self.constrained_fields
+        self._event_type_any = self._any_value_masks['event_type']
+        self._port_any = self._any_value_masks['port']
+        # Only event type conditions (as the default rules): the rule of every event type is resolved beforehand
+        self._rule_by_event_type: Optional[Dict[str, Optional[ClassificationRule]]] = None
+        if self.constrained_fields <= {'event_type'}:
+            self._rule_without_event_type = self.match_values()
+            self._rule_by_event_type = {event_type: self.match_values(event_type) for event_type in self._event_type_masks}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    # True when a rule has a condition on this event type, the rest are the unknown event types
+    def knows_event_type(self, event_type: Any) -> bool:
+        return event_type in self._event_type_masks
+
+    def _ip_mask(self, field: str, ip: Any) -> int:
+        key = ip_to_key(ip)
+        return self._any_value_masks[field] | (self._cidr_tables[field][key[0]].lookup(key[1]) if key else 0)
+
+    # First rule that matches the values, None when no rule does. The IP addresses can be text or IPv4 integers
+    def match_values(self, event_type: Any = None, port: Any = None,
+                     source_ip: Any = None, destination_ip: Any = None) -> Optional[ClassificationRule]:
+        mask = self._all_rules
+        if self._by_event_type:
+            mask &= self._event_type_any | self._event_type_masks.get(event_type, 0)
+        if self._by_port and mask:
+            mask &= self._port_any | (self._port_masks.get(port, 0) if type(port) is int else 0)
+        if self._by_source_ip and mask:
+            mask &= self._ip_mask('source_ip', source_ip)
+        if self._by_destination_ip and mask:
+            mask &= self._ip_mask('destination_ip', destination_ip)
+        if not mask:
+            return None
+        return self.rules[(mask & -mask).bit_length() - 1]
+
+    def match(self, event: Mapping[str, Any]) -> Optional[ClassificationRule]:
+        get = event.get
+        if self._rule_by_event_type is not None:
+            return self._rule_by_event_type.get(get('event_type'), self._rule_without_event_type)
+        return self.match_values(get('event_type'), get('port'), get('source_ip'), get('destination_ip'))
+
+
+# One rule per event type of EVENT_PRIORITY_MAP, the classification of previous versions
+def default_rules() -> List[ClassificationRule]:
+    return [ClassificationRule(f'default_{event_type.lower()}', event_types=[event_type], priority=priority)
+            for event_type, priority in EVENT_PRIORITY_MAP.items()]
+
+
+# Rules file: {"rules": [...], "include_default_rules": true} or just the list of rules
+def load_rule_set(file_path: str) -> RuleSet:
+    with open(file_path, mode='r', encoding='utf-8') as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        config = {'rules': config}
+    if not isinstance(config, dict) or not isinstance(config.get('rules', []), list):
+        raise ValueError(f"[ERROR] The rules file '{file_path}' must contain a list of rules")
+    rules = [ClassificationRule.from_dict(rule, position) for position, rule in enumerate(config.get('rules', []))]
+    if config.get('include_default_rules', True):
+        rules.extend(default_rules())
+    return RuleSet(rules)
+
+
+_active_rule_set: Optional[RuleSet] = None
+_active_rule_set_lock = threading.Lock()
+
+
+# Rule set used by add_threat_level_by_priority, loaded on first use from CLASSIFICATION_RULES_FILE or the default rules
+def get_active_rule_set() -> RuleSet:
+    global _active_rule_set
+    rule_set = _active_rule_set
+    if rule_set is None:
+        with _active_rule_set_lock:
+            if _active_rule_set is None:
+                file_path = os.environ.get(RULES_FILE_ENVIRONMENT_VARIABLE)
+                _active_rule_set = load_rule_set(file_path) if file_path else RuleSet(default_rules())
+            rule_set = _active_rule_set
+    return rule_set
+
+
+# Replace the active rule set, with None it is loaded again on the next use
+def set_active_rule_set(rule_set: Optional[RuleSet]) -> None:
+    global _active_rule_set
+    with _active_rule_set_lock:
+        _active_rule_set = rule_set
@@ -0,0 +1,60 @@
+# Test to validate the batch enrichment of the columnar EventBatch, it must give the same events as "add_threat_level_by_priority".
+
+import copy
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.basic_functions.add_threat_level_by_priority import add_threat_level_by_priority
+from src.basic_functions.assign_priority_by_event_type import EVENT_PRIORITY_MAP
+from src.compact_events.batch_enrichment import add_threat_level_by_priority_to_batch
+from src.compact_events.event_batch import EventBatch
+from src.instrumentation import pipeline_metrics
+
+
+class TestBatchEnrichment(TestEventSiemLogProcessor):
+    def assert_same_as_scalar(self, events, start=0):
+        pipeline_metrics.reset_pipeline_metrics()
+        expected = [copy.copy(event) for event in events]
+        expected[start:] = [add_threat_level_by_priority(event) for event in expected[start:]]
+        expected_metrics = pipeline_metrics.get_pipeline_metrics()
+        pipeline_metrics.reset_pipeline_metrics()
+
+        batch = EventBatch(events)
+        self.assertIs(add_threat_level_by_priority_to_batch(batch, start=start), batch)
+        self.assertEqual(batch.to_dicts(), expected)
+        self.assertEqual(pipeline_metrics.get_pipeline_metrics()['unknown_event_types'],
+                         expected_metrics['unknown_event_types'])
+
+    def test_batch_enrichment_edge_cases(self):
+        events = [
+            {'event_type': 'DATA_EXFILTRATION', 'priority': 1},
+            {'event_type': 'UNKNOWN_TYPE', 'priority': 2},
+            {'event_type': 'UNKNOWN_TYPE', 'priority': 99},
+            {'event_type': '', 'priority': 4},
+            {'priority': 5},
+            {'event_type': 'LOGIN_FAILED'},
+            {'event_type': 'SQL_INJECTION', 'priority': 'notanumber'},
+            {'event_type': 'OTHER_TYPE', 'priority': True},
+            {'event_type': 'OTHER_TYPE', 'priority': 300},
+            {'event_type': 'OTHER_TYPE', 'priority': -3},
+            {'event_type': 'OTHER_TYPE', 'priority': None},
+        ]
+        self.assert_same_as_scalar(events)
+        self.assert_same_as_scalar(events, start=5)
+
+    def test_batch_enrichment_many_event_types(self):
+        # More than 256 event types, the codes no longer fit in a byte
+        event_types = list(EVENT_PRIORITY_MAP) + [f'CUSTOM_{index}' for index in range(300)]
+        events = [{'event_type': event_types[index % len(event_types)], 'priority': index % 7}
+                  for index in range(1000)]
+        self.assert_same_as_scalar(events)
+        self.assert_same_as_scalar(events, start=600)
+
+    def test_batch_enrichment_without_known_event_types(self):
+        self.assert_same_as_scalar([{'event_type': 'UNKNOWN_TYPE', 'priority': priority} for priority in range(7)])
+        batch = EventBatch()
+        self.assertIs(add_threat_level_by_priority_to_batch(batch), batch)
+        self.assertEqual(len(batch), 0)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,53 @@
+# Test to validate the benchmark suite helpers (reproducible datasets, measures and comparison of results).
+
+import os
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from benchmarks.bench_pipeline import (
+    TARGETS,
+    compare_results,
+    generate_dataset,
+    parse_datetime_mix,
+    parse_size,
+    run_benchmarks
+)
+from src.basic_functions.read_events_from_file import read_events_from_file
+
+
+class TestBenchmarks(TestEventSiemLogProcessor):
+    def test_parse_parameters(self):
+        self.assertEqual([parse_size(size) for size in ('10k', '1M', '2.5m', '500')], [10000, 1000000, 2500000, 500])
+        self.assertEqual(parse_datetime_mix('with_zulu=3,without_timezone'), {'with_zulu': 3.0, 'without_timezone': 1.0})
+        with self.assertRaises(ValueError):
+            parse_datetime_mix('iso8601=1')
+
+    def test_dataset_is_reproducible(self):
+        first = generate_dataset(os.path.join(self.test_dir, 'a'), 200, seed=7, malformed_ratio=0.2)
+        second = generate_dataset(os.path.join(self.test_dir, 'b'), 200, seed=7, malformed_ratio=0.2)
+        with open(first) as f, open(second) as g:
+            self.assertEqual(f.read(), g.read())
+
+        # The malformed lines are rejected by the reader or keep an unparseable date
+        self.assertLess(len(read_events_from_file(first)), 200)
+
+        only_zulu = generate_dataset(self.test_dir, 50, seed=7, datetime_mix=parse_datetime_mix('with_zulu'))
+        with open(only_zulu) as f:
+            self.assertTrue(all(line.split(',')[0].endswith('Z') for line in f))
+
+    def test_run_and_compare(self):
+        results = run_benchmarks([100], self.test_dir, repeat=1)
+        measures = results['datasets'][0]['results']
+        self.assertEqual([measure['target'] for measure in measures], list(TARGETS))
+        self.assertTrue(all(measure['events'] == 100 and measure['peak_memory_bytes'] > 0 for measure in measures))
+
+        # Half of the throughput of the previous run is a regression
+        slower = {'datasets': [{'events': 100, 'results': [dict(measure, events_per_second=measure['events_per_second'] * 2)
+                                                           for measure in measures]}]}
+        changes = compare_results(results, slower)
+        self.assertEqual(len(changes), len(TARGETS))
+        self.assertTrue(all(change['regression'] for change in changes))
+        self.assertFalse(any(change['regression'] for change in compare_results(results, results)))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,137 @@
+# Test to validate the compiled classification rules, the default rule set and its use by the scalar and batch enrichment.
+
+import copy
+import json
+import os
+import random
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.basic_functions.add_threat_level_by_priority import add_threat_level_by_priority
+from src.basic_functions.assign_priority_by_event_type import EVENT_PRIORITY_MAP
+from src.compact_events.batch_enrichment import add_threat_level_by_priority_to_batch
+from src.compact_events.event_batch import EventBatch
+from src.rule_engine import classification_rules
+from src.rule_engine.classification_rules import (
+    RULES_FILE_ENVIRONMENT_VARIABLE,
+    ClassificationRule,
+    RuleSet,
+    default_rules,
+    get_active_rule_set,
+    load_rule_set,
+    set_active_rule_set
+)
+
+EXAMPLE_RULES_FILE = os.path.join(os.path.dirname(__file__), '..', 'docs', 'classification_rules_example.json')
+
+
+class TestClassificationRules(TestEventSiemLogProcessor):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(set_active_rule_set, None)
+
+    def write_rules(self, config):
+        file_path = os.path.join(self.test_dir, 'rules.json')
+        with open(file_path, mode='w', encoding='utf-8') as f:
+            json.dump(config, f)
+        return file_path
+
+    def test_default_rules(self):
+        rule_set = RuleSet(default_rules())
+        self.assertEqual(rule_set.constrained_fields, {'event_type'})
+        for event_type, priority in EVENT_PRIORITY_MAP.items():
+            self.assertEqual(rule_set.match({'event_type': event_type}).priority, priority)
+        self.assertIsNone(rule_set.match({'event_type': 'UNKNOWN_TYPE'}))
+        self.assertFalse(rule_set.knows_event_type('UNKNOWN_TYPE'))
+
+    def test_precedence_and_conditions(self):
+        file_path = self.write_rules({'rules': [
+            {'name': 'ssh_to_servers', 'event_type': 'LOGIN_FAILED', 'port': 22, 'destination_cidr': '10.10.0.0/16', 'priority': 5},
+            {'name': 'internal', 'source_cidr': ['192.168.0.0/16', 'fd00::/8'], 'threat_level': 'Internal'},
+            {'name': 'ssh', 'port': 22, 'priority': 3},
+        ]})
+        rule_set = load_rule_set(file_path)
+        self.assertEqual(len(rule_set), 3 + len(EVENT_PRIORITY_MAP))
+
+        event = {'event_type': 'LOGIN_FAILED', 'port': 22, 'source_ip': '192.168.1.1', 'destination_ip': '10.10.5.5'}
+        self.assertEqual(rule_set.match(event).name, 'ssh_to_servers')
+        self.assertEqual(rule_set.match(dict(event, destination_ip='10.11.0.1')).name, 'internal')
+        self.assertEqual(rule_set.match(dict(event, source_ip='fd12::1', destination_ip='8.8.8.8')).name, 'internal')
+        self.assertEqual(rule_set.match(dict(event, source_ip='8.8.8.8', destination_ip='8.8.8.8')).name, 'ssh')
+        self.assertEqual(rule_set.match({'event_type': 'LOGIN_FAILED', 'port': 80}).name, 'default_login_failed')
+
+        # The threat level of a rule replaces the one of the priority
+        processed = add_threat_level_by_priority({'priority': 1, 'source_ip': '192.168.1.1'}, rule_set)
+        self.assertEqual(processed, {'priority': 1, 'source_ip': '192.168.1.1', 'threat_level': 'Internal'})
+
+        # Without the default rules only the rules of the file are used
+        file_path = self.write_rules({'include_default_rules': False, 'rules': [{'port': 22, 'priority': 3}]})
+        self.assertEqual(len(load_rule_set(file_path)), 1)
+        self.assertEqual(len(load_rule_set(EXAMPLE_RULES_FILE)), 3 + len(EVENT_PRIORITY_MAP))
+
+    def test_invalid_rules(self):
+        for rule in ({'port': 22}, {'port': 70000, 'priority': 1}, {'priority': 9}, {'priority': True},
+                     {'source_cidr': '10.0.0.0/33', 'priority': 1}, {'event_type': '', 'priority': 1},
+                     {'unknown': 1, 'priority': 1}, {'source_cidr': [], 'priority': 1}):
+            with self.subTest(rule=rule), self.assertRaises(ValueError):
+                ClassificationRule.from_dict(rule)
+        with self.assertRaises(ValueError):
+            load_rule_set(self.write_rules({'rules': {'port': 22}}))
+
+    def test_compiled_rules_match_linear_evaluation(self):
+        rng = random.Random(7)
+        event_types = list(EVENT_PRIORITY_MAP) + ['CUSTOM']
+        rules = []
+        for index in range(2000):
+            config = {'name': f'rule_{index}', 'priority': rng.randint(1, 5)}
+            if rng.random() < 0.5:
+                config['event_type'] = rng.sample(event_types, rng.randint(1, 3))
+            if rng.random() < 0.5:
+                config['port'] = rng.sample([22, 80, 443, 3389], rng.randint(1, 2))
+            for condition in ('source_cidr', 'destination_cidr'):
+                if rng.random() < 0.5:
+                    config[condition] = [f'10.{rng.randrange(4)}.{rng.randrange(256)}.0/{rng.choice([8, 16, 20, 24, 28])}'
+                                         for _ in range(rng.randint(1, 3))]
+            rules.append(ClassificationRule.from_dict(config))
+        rule_set = RuleSet(rules)
+
+        for _ in range(3000):
+            event = {'event_type': rng.choice(event_types), 'port': rng.choice([22, 80, 443, 3389, 8080]),
+                     'source_ip': f'10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(256)}',
+                     'destination_ip': rng.choice(['10.0.0.1', '10.1.2.3', '192.168.0.1', 'fe80::1', 'not an ip'])}
+            expected = next((rule for rule in rules if rule.matches(event)), None)
+            self.assertIs(rule_set.match(event), expected)
+
+    def test_batch_enrichment_uses_the_rules(self):
+        rule_set = load_rule_set(self.write_rules({'rules': [
+            {'event_type': 'LOGIN_FAILED', 'threat_level': 'Watch'},
+            {'event_type': 'PORT_SCAN', 'priority': 1, 'threat_level': 'Noise'},
+        ]}))
+        events = [{'event_type': event_type, 'priority': priority, 'port': port, 'source_ip': source_ip}
+                  for event_type in list(EVENT_PRIORITY_MAP) + ['CUSTOM'] for priority in (2, 'x')
+                  for port in (22, 3306) for source_ip in ('10.1.2.3', '192.168.1.1', 'fe80::1')]
+        events.append({'port': 3306})
+        expected = [add_threat_level_by_priority(copy.copy(event), rule_set) for event in events]
+        batch = add_threat_level_by_priority_to_batch(EventBatch(events), rule_set=rule_set)
+        self.assertEqual(batch.to_dicts(), expected)
+
+        # Rules on ports and subnets are matched row by row
+        rule_set = load_rule_set(EXAMPLE_RULES_FILE)
+        events[0].update(event_type='PORT_SCAN', source_ip='10.9.9.9')
+        expected = [add_threat_level_by_priority(copy.copy(event), rule_set) for event in events]
+        batch = add_threat_level_by_priority_to_batch(EventBatch(events), rule_set=rule_set)
+        self.assertEqual(batch.to_dicts(), expected)
+        self.assertEqual(expected[0]['priority'], 1)
+
+    def test_rules_file_from_environment(self):
+        file_path = self.write_rules([{'event_type': 'LOGIN_SUCCESS', 'priority': 5}])
+        os.environ[RULES_FILE_ENVIRONMENT_VARIABLE] = file_path
+        self.addCleanup(os.environ.pop, RULES_FILE_ENVIRONMENT_VARIABLE, None)
+        set_active_rule_set(None)
+
+        self.assertEqual(len(get_active_rule_set()), 1 + len(EVENT_PRIORITY_MAP))
+        self.assertIs(get_active_rule_set(), classification_rules._active_rule_set)
+        self.assertEqual(add_threat_level_by_priority({'event_type': 'LOGIN_SUCCESS', 'priority': 1})['threat_level'], 'High')
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,70 @@
+# Test to validate the compact event containers (EventRecord with __slots__ and the columnar EventBatch).
+
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.basic_functions.add_threat_level_by_priority import add_threat_level_by_priority
+from src.basic_functions.normalize_event_datetime import normalize_event_datetime
+from src.compact_events.event_batch import EventBatch, int_to_ipv4, ipv4_to_int
+from src.compact_events.event_record import EventRecord
+from src.complex_processor_functions.combined_processor_functions import (
+    combine_read_file_normalize_timestamp_add_threat_level,
+    combine_read_file_normalize_timestamp_add_threat_level_to_batch
+)
+
+
+class TestCompactEvents(TestEventSiemLogProcessor):
+    def test_event_record_in_pipeline(self):
+        record = EventRecord(datetime='2024/09/01 14:23:01-0400', source_ip='10.0.0.1', destination_ip='10.0.0.2',
+                             port=22, event_type='SSH_BRUTE_FORCE', priority=1)
+
+        # The basic functions work with the record as with a dictionary
+        processed = add_threat_level_by_priority(normalize_event_datetime(record))
+        self.assertIs(processed, record)
+        self.assertEqual(record['datetime'], '2024-09-01 18:23:01')
+        self.assertEqual(record.get('priority'), 4)
+        self.assertEqual(record.to_dict()['threat_level'], 'Medium')
+
+        # Only the event fields are accepted and there is no per instance dictionary
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertNotIn('unknown', record)
+        self.assertIsNone(record.get('unknown'))
+        with self.assertRaises(KeyError):
+            record['unknown'] = 1
+        with self.assertRaises(KeyError):
+            record['to_dict']
+
+    def test_event_batch_round_trip(self):
+        events = combine_read_file_normalize_timestamp_add_threat_level(self.test_file_path)
+        batch = combine_read_file_normalize_timestamp_add_threat_level_to_batch(self.test_file_path)
+
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch.to_dicts(), events)
+        self.assertEqual(batch[-1], events[-1])
+        self.assertEqual(batch.record(0), events[0])
+
+        # Repeated categorical values share one code
+        batch.extend(events)
+        self.assertLessEqual(len(batch.event_types.values), 3)
+        self.assertEqual(batch.event_types[3], events[0]['event_type'])
+
+    def test_event_batch_values_outside_columns(self):
+        events = [
+            {'datetime': 'Unknown Format', 'source_ip': 'fe80::1', 'destination_ip': '10.1',
+             'port': 70000, 'event_type': 'PORT_SCAN', 'priority': 300, 'threat_level': 'Unknown'},
+            {'source_ip': '192.168.1.10', 'priority': 2}
+        ]
+        batch = EventBatch(events)
+
+        # Non IPv4 addresses, out of range numbers and missing fields are exported unchanged
+        self.assertEqual(list(batch), events)
+        self.assertIsNone(batch.get(1, 'threat_level'))
+
+    def test_ipv4_to_int(self):
+        self.assertEqual(ipv4_to_int('10.0.0.1'), 0x0A000001)
+        self.assertEqual(int_to_ipv4(0x0A000001), '10.0.0.1')
+        self.assertIsNone(ipv4_to_int('10.1'))
+        self.assertIsNone(ipv4_to_int('not an ip'))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
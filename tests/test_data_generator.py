@@ -1,12 +1,19 @@
 # Test to validate the data generator functions
 
+import os
+import tempfile
 import unittest
+from datetime import datetime
 from helpers.data_generator import (
+    DATETIME_FORMATS,
     generate_siem_event,
     generate_siem_events_csv,
+    generate_siem_events_file,
     generate_test_data_with_edge_cases,
-    generate_demo_data
+    generate_demo_data,
+    iter_siem_event_lines_bulk
 )
+from src.complex_processor_functions.combined_processor_functions import stream_read_file_normalize_timestamp_add_threat_level
 
 
 class TestDataGenerator(unittest.TestCase):
@@ -116,6 +123,41 @@ class TestDataGenerator(unittest.TestCase):
         # Should have generated at least 2 different formats
         self.assertGreaterEqual(len(formats_found), 2)
 
+    # Test that the bulk generator is deterministic for a seed and keeps every datetime format
+    def test_bulk_lines_are_reproducible(self):
+        end_date = datetime(2025, 1, 1)
+        first = [line for lines in iter_siem_event_lines_bulk(500, seed=3, end_date=end_date, chunk_size=200) for line in lines]
+        second = [line for lines in iter_siem_event_lines_bulk(500, seed=3, end_date=end_date, chunk_size=200) for line in lines]
+        other = [line for lines in iter_siem_event_lines_bulk(500, seed=4, end_date=end_date, chunk_size=200) for line in lines]
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(first), 500)
+
+        # Same layouts as generate_siem_event for every format
+        for datetime_format in DATETIME_FORMATS:
+            line = next(iter_siem_event_lines_bulk(1, seed=3, datetime_weights={datetime_format: 1}, end_date=end_date))[0]
+            reference = generate_siem_event(datetime_format, end_date=end_date)['datetime']
+            self.assertEqual(len(line.split(',')[0]), len(reference))
+            self.assertEqual(line.split(',')[0].translate(str.maketrans('0123456789', 'dddddddddd')),
+                             reference.translate(str.maketrans('0123456789', 'dddddddddd')))
+
+    # Test that the bulk file is processed by the pipeline with the exact ratio of malformed lines and the edge cases
+    def test_bulk_file_with_malformed_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'events.txt')
+            written = generate_siem_events_file(file_path, 1000, seed=1, malformed_ratio=0.04, include_edge_cases=True,
+                                                end_date=datetime(2025, 1, 1), chunk_size=300)
+            self.assertEqual(written, 1002)
+            with open(file_path) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[-2:], ['linea,invalida', '2024/09/01 14:23:01-0400,192.168.1.10,172.16.0.1,443,LOGIN_FAILED,notanumber'])
+
+            events = list(stream_read_file_normalize_timestamp_add_threat_level(file_path))
+            # 40 malformed lines in turns: 10 of them keep an unparseable date, the other 30 and the edge cases are rejected
+            self.assertEqual(len(events), 1000 - 30)
+            self.assertEqual(sum(event['datetime'] == 'Unknown Format' for event in events), 10)
+            self.assertTrue(all(event['threat_level'] in ('Low', 'Medium', 'High') for event in events))
+
 
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
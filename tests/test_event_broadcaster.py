@@ -0,0 +1,130 @@
+# Test to validate the live feed of the web UI: the shared buffer of the "EventBroadcaster", its slow client resync and the SSE endpoint.
+
+import json
+import os
+import threading
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from ui.models import event_model as event_model_module
+from ui.models.event_broadcaster import EventBroadcaster
+from ui.models.event_model import EventModel
+
+
+def parse_messages(text):
+    messages = []
+    for block in text.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':') and ': ' in line)
+        if 'event' in fields:
+            messages.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    return messages
+
+
+class TestEventBroadcaster(TestEventSiemLogProcessor):
+    def test_every_client_reads_the_shared_buffer(self):
+        broadcaster = EventBroadcaster()
+        first, second = broadcaster.subscribe(), broadcaster.subscribe()
+        self.assertEqual(broadcaster.client_count, 2)
+        broadcaster.publish('events', {'count': 1})
+        broadcaster.publish('events', {'count': 2})
+
+        messages = first.next_messages(0)
+        self.assertEqual(parse_messages(''.join(messages)), [(1, 'events', {'count': 1}), (2, 'events', {'count': 2})])
+        # The messages are serialized once for every client
+        self.assertTrue(all(a is b for a, b in zip(messages, second.next_messages(0))))
+        self.assertEqual(first.next_messages(0), [])
+
+        first.close()
+        self.assertEqual(broadcaster.client_count, 1)
+
+    def test_slow_client_resync(self):
+        broadcaster = EventBroadcaster(buffer_size=8, max_client_backlog=3)
+        slow, fast = broadcaster.subscribe(), broadcaster.subscribe()
+        for index in range(5):
+            broadcaster.publish('events', {'count': index})
+            self.assertEqual(len(fast.next_messages(0)), 1)
+
+        # Behind by more than the backlog: the pending messages are dropped for a single resync
+        self.assertEqual(parse_messages(''.join(slow.next_messages(0))),
+                         [(5, 'resync', {'reason': 'behind', 'dropped_messages': 5})])
+        self.assertEqual(slow.dropped_messages, 5)
+        broadcaster.publish('events', {'count': 5})
+        self.assertEqual(parse_messages(''.join(slow.next_messages(0))), [(6, 'events', {'count': 5})])
+
+    def test_resume_from_last_event_id(self):
+        broadcaster = EventBroadcaster(buffer_size=4)
+        for index in range(6):
+            broadcaster.publish('events', {'count': index})
+
+        resumed = broadcaster.subscribe(last_event_id=4)
+        self.assertEqual([message[0] for message in parse_messages(''.join(resumed.next_messages(0)))], [5, 6])
+        # The message after id 1 already left the buffer
+        self.assertEqual(parse_messages(''.join(broadcaster.subscribe(last_event_id=1).next_messages(0)))[0][1], 'resync')
+        self.assertEqual(broadcaster.subscribe(last_event_id=99).position, 7)
+
+    def test_close_wakes_a_waiting_client(self):
+        broadcaster = EventBroadcaster()
+        subscription = broadcaster.subscribe()
+        result = []
+        reader = threading.Thread(target=lambda: result.append(subscription.next_messages(30)))
+        reader.start()
+        subscription.close()
+        reader.join(5)
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(result, [[]])
+
+    def test_model_publishes_appended_events(self):
+        data_file = os.path.join(self.test_dir, 'processed_events.json')
+        model = EventModel(data_file)
+        model.replace_events([{'datetime': '2024-09-01 10:00:00', 'threat_level': 'Low'}])
+        subscription = model.broadcaster.subscribe()
+
+        self.addCleanup(setattr, event_model_module, 'FEED_MAX_EVENTS', event_model_module.FEED_MAX_EVENTS)
+        event_model_module.FEED_MAX_EVENTS = 2
+        new_events = [{'datetime': f'2024-09-02 10:00:0{second}', 'threat_level': 'High'} for second in (1, 3, 2)]
+        self.assertEqual(model.append_events(new_events), 3)
+        model.append_events([])
+        model.replace_events([])
+
+        (_, event, data), (_, resync, resync_data) = parse_messages(''.join(subscription.next_messages(0)))
+        self.assertEqual(event, 'events')
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([new_event['datetime'] for new_event in data['events']], ['2024-09-02 10:00:03', '2024-09-02 10:00:02'])
+        self.assertEqual((data['statistics']['total_events'], data['statistics']['high_threat']), (4, 3))
+        self.assertEqual((resync, resync_data['reason'], resync_data['statistics']['total_events']), ('resync', 'replace', 0))
+
+    def test_stream_endpoint(self):
+        from ui.app import create_app
+        from ui.routes import event_routes
+        model = EventModel(os.path.join(self.test_dir, 'processed_events.json'))
+        self.addCleanup(setattr, event_routes, 'event_model', event_routes.event_model)
+        event_routes.event_model = model
+        app = create_app()
+        app.config['EVENT_STREAM_HEARTBEAT_SECONDS'] = 0.01
+        client = app.test_client()
+
+        response = client.get('/api/events/stream', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+        first = next(chunks).decode()
+        self.assertTrue(first.startswith('retry: '))
+        self.assertEqual(parse_messages(first), [(0, 'ready', {'resumed': False})])
+        self.assertEqual(model.broadcaster.client_count, 1)
+
+        # Without messages a heartbeat comment keeps the connection open
+        self.assertEqual(next(chunks).decode(), ': keep-alive\n\n')
+        model.append_events([{'datetime': '2024-09-01 10:00:00', 'threat_level': 'High'}])
+        self.assertEqual(parse_messages(next(chunks).decode())[0][1], 'events')
+        response.close()
+        self.assertEqual(model.broadcaster.client_count, 0)
+
+        # A reconnection resumes after its Last-Event-ID
+        model.append_events([{'datetime': '2024-09-01 11:00:00', 'threat_level': 'Low'}])
+        response = client.get('/api/events/stream', headers={'Last-Event-ID': '1'}, buffered=False)
+        messages = parse_messages(''.join(chunk.decode() for _, chunk in zip(range(2), response.response)))
+        self.assertEqual([(message_id, event) for message_id, event, _ in messages], [(1, 'ready'), (2, 'events')])
+        self.assertTrue(messages[0][2]['resumed'])
+        response.close()
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,127 @@
+# Test to validate the correlation stage: brute force and port scan alerts from the sliding windows of the "EventCorrelator",
+# its bounded memory with many distinct sources and the correlation of the streaming pipeline.
+
+import os
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.complex_processor_functions.combined_processor_functions import stream_read_file_normalize_timestamp_add_threat_level
+from src.correlation.event_correlation import CorrelationRule, EventCorrelator
+from src.instrumentation.pipeline_metrics import PIPELINE_METRICS
+
+START = 1725184800
+
+
+def login_failed(offset, source_ip='10.0.0.1', port=22):
+    return {'datetime_epoch': START + offset, 'source_ip': source_ip, 'destination_ip': '172.16.0.1', 'port': port,
+            'event_type': 'LOGIN_FAILED', 'priority': 2, 'threat_level': 'Low'}
+
+
+class TestEventCorrelation(TestEventSiemLogProcessor):
+    def test_brute_force_alert(self):
+        correlator = EventCorrelator()
+        # 5 failures in 60 seconds from one source, the other sources do not count
+        events = [login_failed(offset * 10) for offset in range(4)] + [login_failed(35, '10.0.0.2'), login_failed(40)]
+        alerts = correlator.correlate(events[:3]) + correlator.correlate(events[3:])
+        self.assertEqual(alerts, [dict(events[-1], event_type='BRUTE_FORCE_ALERT', priority=5, threat_level='High',
+                                       correlation_rule='brute_force', correlated_events=5)])
+
+        # The key is quiet for one window after an alert, then a new burst raises a new one
+        self.assertEqual(correlator.correlate([login_failed(50 + offset) for offset in range(8)]), [])
+        self.assertEqual(len(correlator.correlate([login_failed(101 + offset) for offset in range(5)])), 1)
+        self.assertEqual(correlator.alerts_raised, 2)
+
+    def test_slow_attempts_do_not_raise_alerts(self):
+        correlator = EventCorrelator()
+        self.assertEqual(correlator.correlate([login_failed(offset * 20) for offset in range(20)]), [])
+        # Events without a normalized datetime are not correlated
+        self.assertEqual(correlator.correlate([dict(login_failed(0), datetime_epoch=None)] * 10), [])
+
+    def test_out_of_order_events(self):
+        # 5 failures spread over almost 3 hours, the newest one first: not a burst
+        correlator = EventCorrelator()
+        self.assertEqual(correlator.correlate([login_failed(offset) for offset in (10000, 100, 3000, 5000, 7000)]), [])
+        # A burst in a shuffled order is still one
+        self.assertEqual(len(correlator.correlate([login_failed(10000 + offset) for offset in (40, 0, 30, 10, 20)])), 1)
+
+        # The late events (more than a window before the newest one) are ignored, also by the distinct rule
+        correlator = EventCorrelator()
+        correlator.correlate([login_failed(5000, '10.9.9.9', 1)])
+        late_ports = [dict(login_failed(port, '10.9.9.9', 1000 + port), event_type='WEB_ATTACK') for port in range(20)]
+        self.assertEqual(correlator.correlate(late_ports), [])
+        scan = [dict(login_failed(5000 - port, '10.9.9.9', 2000 + port), event_type='WEB_ATTACK') for port in range(10)]
+        self.assertEqual([alert['correlated_events'] for alert in correlator.correlate(scan)], [10])
+
+        # An idle key behind a recent one (out of order) is evicted at most one window later, for both rules
+        correlator = EventCorrelator()
+        correlator.correlate([login_failed(1030, '10.0.0.2'), login_failed(1000, '10.0.0.1')])
+        correlator.correlate([login_failed(1080, '10.0.0.3')])
+        self.assertEqual(correlator.key_count, 3 * 2)
+        correlator.correlate([login_failed(1100, '10.0.0.3')])
+        self.assertEqual(correlator.key_count, 1 * 2)
+
+    def test_port_scan_alert(self):
+        correlator = EventCorrelator()
+        same_port = [dict(login_failed(offset), event_type='PORT_SCAN') for offset in range(20)]
+        self.assertEqual(correlator.correlate(same_port), [])
+
+        # 10 distinct ports within the window, the ports seen before the window do not count
+        old_ports = [dict(login_failed(100 + port, '10.9.9.9', port), event_type='WEB_ATTACK') for port in range(5)]
+        ports = [dict(login_failed(200 + port, '10.9.9.9', 1000 + port), event_type='WEB_ATTACK') for port in range(10)]
+        alerts = correlator.correlate(old_ports + ports)
+        self.assertEqual([(alert['event_type'], alert['port'], alert['threat_level'], alert['correlation_rule'],
+                           alert['correlated_events']) for alert in alerts],
+                         [('PORT_SCAN_ALERT', 1009, 'High', 'port_scan', 10)])
+
+        # Only the event types of the rule count: successful logins and alerts on many ports are not a scan
+        for event_type in ('LOGIN_SUCCESS', 'BRUTE_FORCE_ALERT'):
+            with self.subTest(event_type=event_type):
+                events = [dict(login_failed(port, '10.8.8.8', 2000 + port), event_type=event_type) for port in range(20)]
+                self.assertEqual(EventCorrelator().correlate(events), [])
+
+    def test_alerts_are_not_correlated_again(self):
+        correlator = EventCorrelator()
+        alerts = correlator.correlate([login_failed(offset) for offset in range(5)])
+        self.assertEqual(len(alerts), 1)
+        # Alerts fed back in a later block (e.g. a processed file read again) raise nothing
+        rule = CorrelationRule('any', 'ANY_ALERT', threshold=1)
+        self.assertEqual(EventCorrelator([rule]).correlate(alerts), [])
+        self.assertEqual(len(EventCorrelator([rule]).correlate([login_failed(0)])), 1)
+
+    def test_memory_is_bounded(self):
+        rule = CorrelationRule('brute_force', 'BRUTE_FORCE_ALERT', threshold=3, window_seconds=60, event_types=['LOGIN_FAILED'])
+        correlator = EventCorrelator([rule], max_keys=100)
+        events = [login_failed(index // 100, f'10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}') for index in range(5000)]
+        for start in range(0, len(events), 512):
+            correlator.correlate(events[start:start + 512])
+            self.assertLessEqual(correlator.key_count, 100)
+        self.assertGreater(correlator.evicted_keys, 0)
+
+        # The idle keys are evicted once the time moves past their window
+        correlator.correlate([login_failed(1000, '10.255.255.255')])
+        self.assertEqual(correlator.key_count, 1)
+
+    def test_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            CorrelationRule('burst', 'ALERT', threshold=0)
+        with self.assertRaises(ValueError):
+            CorrelationRule('burst', 'ALERT', threshold=3, window_seconds=0)
+        with self.assertRaises(ValueError):
+            EventCorrelator(max_keys=0)
+
+    def test_streaming_pipeline(self):
+        file_path = os.path.join(self.test_dir, 'brute_force.txt')
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for second in range(6):
+                f.write(f'2024-09-01T10:00:{second:02d}Z,192.168.1.10,172.16.0.1,22,SSH_BRUTE_FORCE,4\n')
+        PIPELINE_METRICS.reset()
+
+        events = list(stream_read_file_normalize_timestamp_add_threat_level(file_path, correlator=EventCorrelator()))
+        self.assertEqual([event['event_type'] for event in events], ['SSH_BRUTE_FORCE'] * 6 + ['BRUTE_FORCE_ALERT'])
+        self.assertEqual((events[-1]['datetime'], events[-1]['threat_level']), ('2024-09-01 10:00:04', 'High'))
+        self.assertEqual(PIPELINE_METRICS.as_dict()['stages']['correlate']['events'], 6)
+        # Without a correlator the pipeline is unchanged
+        self.assertEqual(len(list(stream_read_file_normalize_timestamp_add_threat_level(file_path))), 6)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
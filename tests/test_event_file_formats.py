@@ -0,0 +1,101 @@
+# Test to validate the output formats of the processed events (JSON, JSON Lines and binary columnar).
+
+import json
+import os
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.compact_events.event_file_formats import (
+    ProcessedEventsWriter,
+    iter_processed_events,
+    read_processed_events,
+    write_processed_events
+)
+from src.complex_processor_functions.combined_processor_functions import stream_read_file_normalize_timestamp_add_threat_level
+from ui.models.event_model import EventModel
+
+
+class TestEventFileFormats(TestEventSiemLogProcessor):
+    def setUp(self):
+        super().setUp()
+        self.events = list(stream_read_file_normalize_timestamp_add_threat_level(self.test_file_path))
+        # Values that do not fit in the columns must be kept as they are
+        self.events.append({'datetime': 'Unknown Format', 'source_ip': 'fe80::1', 'port': 70000,
+                            'event_type': None, 'priority': 'high'})
+        # The fields of a correlation alert are kept by every format
+        self.events.append(dict(self.events[0], event_type='BRUTE_FORCE_ALERT', priority=5, threat_level='High',
+                                correlation_rule='brute_force', correlated_events=5))
+
+    def test_round_trip_by_extension(self):
+        for extension in ('json', 'jsonl', 'ndjson', 'siemcol'):
+            with self.subTest(extension=extension):
+                file_path = os.path.join(self.test_dir, f"processed_events.{extension}")
+                self.assertEqual(write_processed_events(iter(self.events), file_path), len(self.events))
+
+                self.assertEqual(list(iter_processed_events(file_path)), self.events)
+                self.assertEqual(read_processed_events(file_path).to_dicts(), self.events)
+
+    def test_json_is_the_indented_dump(self):
+        file_path = os.path.join(self.test_dir, "processed_events.json")
+        write_processed_events(self.events, file_path)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), json.dumps(self.events, indent=2))
+
+        write_processed_events([], file_path)
+        self.assertEqual(list(iter_processed_events(file_path)), [])
+
+    def test_columnar_blocks_share_categories(self):
+        # Blocks of 2 rows, the categorical codes of every block refer to the same table
+        file_path = os.path.join(self.test_dir, "processed_events.siemcol")
+        events = [dict(self.events[0], event_type=f"TYPE_{index % 300}") for index in range(600)]
+        with ProcessedEventsWriter(file_path, block_rows=2) as writer:
+            writer.write_events(events)
+
+        batch = read_processed_events(file_path)
+        self.assertEqual(batch.to_dicts(), events)
+        # The loaded table keeps the codes of the file and still encodes new values
+        self.assertEqual(batch.event_types.code_of('TYPE_299'), 299)
+        batch.append(dict(self.events[0], event_type='TYPE_NEW'))
+        self.assertEqual((batch.event_types.code_of('TYPE_NEW'), batch[600]['event_type']), (300, 'TYPE_NEW'))
+
+    def test_failed_write_keeps_previous_file(self):
+        file_path = os.path.join(self.test_dir, "processed_events.jsonl")
+        write_processed_events(self.events, file_path)
+
+        with self.assertRaises(RuntimeError):
+            with ProcessedEventsWriter(file_path) as writer:
+                writer.write(self.events[0])
+                raise RuntimeError("processing failed")
+
+        self.assertEqual(list(iter_processed_events(file_path)), self.events)
+        self.assertEqual(os.listdir(self.test_dir).count("processed_events.jsonl"), 1)
+        self.assertFalse([name for name in os.listdir(self.test_dir) if name.endswith('.tmp')])
+
+    def test_unknown_or_corrupted_file(self):
+        with self.assertRaises(ValueError):
+            write_processed_events(self.events, os.path.join(self.test_dir, "processed_events.csv"))
+
+        file_path = os.path.join(self.test_dir, "processed_events.siemcol")
+        with open(file_path, 'wb') as f:
+            f.write(b'not a columnar file')
+        with self.assertRaises(ValueError):
+            read_processed_events(file_path)
+
+        # The model serves an empty snapshot instead of failing
+        model = EventModel(file_path, background_reload=False)
+        self.assertEqual(model.get_event_statistics()['total_events'], 0)
+
+    def test_event_model_loads_every_format(self):
+        for extension in ('json', 'jsonl', 'siemcol'):
+            with self.subTest(extension=extension):
+                file_path = os.path.join(self.test_dir, f"processed_events.{extension}")
+                write_processed_events(self.events, file_path)
+
+                model = EventModel(file_path, background_reload=False)
+                # The alert is counted apart from the events
+                statistics = model.get_event_statistics()
+                self.assertEqual((statistics['total_events'], statistics['alerts']), (len(self.events) - 1, 1))
+                self.assertEqual(model.load_processed_events(), self.events)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,355 @@
+# Test to validate the "EventModel" class of the web UI that loads the processed events and answers the dashboard queries.
+
+import ipaddress
+import json
+import os
+import random
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.compact_events.event_batch import EventBatch
+from ui.models.event_model import EventModel
+from ui.models.event_snapshot import EventSnapshot, parse_time_bound
+from ui.models.event_statistics import EventStatistics
+
+
+class TestEventModel(TestEventSiemLogProcessor):
+    def setUp(self):
+        super().setUp()
+        self.events = [
+            {'datetime': '2024-09-01 10:00:00', 'datetime_epoch': 1725184800, 'source_ip': '10.0.0.1', 'destination_ip': '172.16.0.1',
+             'port': 22, 'event_type': 'SSH_BRUTE_FORCE', 'priority': 4, 'threat_level': 'Medium'},
+            {'datetime': '2024-09-01 12:00:00', 'datetime_epoch': 1725192000, 'source_ip': '110.0.0.1', 'destination_ip': '172.16.0.2',
+             'port': 443, 'event_type': 'DATA_EXFILTRATION', 'priority': 5, 'threat_level': 'High'},
+            {'datetime': '2024-09-01 11:00:00', 'datetime_epoch': 1725188400, 'source_ip': '10.0.0.2', 'destination_ip': '172.16.0.1',
+             'port': 22, 'event_type': 'LOGIN_FAILED', 'priority': 2, 'threat_level': 'Low'},
+            {'datetime': '2024-09-01 09:00:00', 'datetime_epoch': 1725181200, 'source_ip': '10.0.0.1', 'destination_ip': '172.16.0.3',
+             'port': 3389, 'event_type': 'SSH_BRUTE_FORCE', 'priority': 4, 'threat_level': 'Medium'},
+        ]
+        self.data_file = os.path.join(self.test_dir, "processed_events.json")
+        self.write_events(self.events)
+        self.model = EventModel(self.data_file)
+
+    def write_events(self, events):
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump(events, f, indent=2)
+
+    def test_get_event_statistics(self):
+        stats = self.model.get_event_statistics()
+
+        self.assertEqual(stats['total_events'], 4)
+        self.assertEqual(stats['high_threat'], 1)
+        self.assertEqual(stats['medium_threat'], 2)
+        self.assertEqual(stats['low_threat'], 1)
+        self.assertEqual(stats['unknown_threat'], 0)
+        self.assertEqual(stats['last_updated'], '2024-09-01 12:00:00')
+        self.assertEqual(stats['event_types'], {'SSH_BRUTE_FORCE': 2, 'DATA_EXFILTRATION': 1, 'LOGIN_FAILED': 1})
+
+    def test_filter_events(self):
+        medium = self.model.filter_events(threat_level='Medium')
+        self.assertEqual([event['datetime'] for event in medium], ['2024-09-01 10:00:00', '2024-09-01 09:00:00'])
+        self.assertEqual(medium[0], self.events[0])
+
+        self.assertEqual(len(self.model.filter_events(event_type='SSH_BRUTE_FORCE', limit=1)), 1)
+        self.assertEqual(self.model.filter_events(threat_level='Critical'), [])
+
+        # Source IP is an address match, leading octets match their subnet: "10.0" does not match "110.0.0.1"
+        self.assertEqual(len(self.model.filter_events(source_ip='10.0.0.1')), 2)
+        self.assertEqual(len(self.model.filter_events(source_ip='10.0.')), 3)
+        self.assertEqual(len(self.model.filter_events(source_ip='10')), 3)
+        self.assertEqual(self.model.filter_events(source_ip='10.0.0.2', threat_level='Medium'), [])
+
+        # Several criteria are intersected
+        rows = self.model.get_snapshot().query(threat_level='Medium', event_type='SSH_BRUTE_FORCE', source_ip='10.0.0.1')
+        self.assertEqual(sorted(rows), [0, 3])
+
+    def test_filter_events_by_ip_ranges(self):
+        self.assertEqual(len(self.model.filter_events(source_ip='10.0.0.0/8')), 3)
+        self.assertEqual(len(self.model.filter_events(source_ip='96.0.0.0/3')), 1)
+        self.assertEqual(len(self.model.filter_events(source_ip='10.0.0.2-110.0.0.1')), 2)
+        self.assertEqual(self.model.filter_events(destination_ip='172.16.0.1/32', source_ip='10.0.0.0/30'),
+                         [self.events[2], self.events[0]])
+        self.assertEqual(self.model.filter_events(destination_ip='172.16.0.3', threat_level='Medium'), [self.events[3]])
+        for invalid in ('10.0.0.0/33', 'abc', '10.0.0.9-10.0.0.1', '10.0.0.1-fe80::1'):
+            with self.subTest(invalid=invalid), self.assertRaises(ValueError):
+                self.model.filter_events(source_ip=invalid)
+
+        # Addresses outside the integer column (IPv6) are indexed too
+        self.model.append_events([dict(self.events[0], source_ip='fe80::1'), dict(self.events[0], source_ip='not an ip')])
+        self.assertEqual(len(self.model.filter_events(source_ip='fe80::/10')), 1)
+        self.assertEqual(len(self.model.filter_events(source_ip='10.0.0.1')), 2)
+        self.assertEqual(len(self.model.filter_events(source_ip='10.0.0.0/8', threat_level='Medium')), 2)
+
+    def test_events_endpoint_ip_filters(self):
+        from ui.app import create_app
+        from ui.routes import event_routes
+        self.addCleanup(setattr, event_routes, 'event_model', event_routes.event_model)
+        event_routes.event_model = self.model
+        client = create_app().test_client()
+
+        response = client.get('/api/events?source_cidr=10.0.0.0/24&destination_ip=172.16.0.1')
+        self.assertEqual(response.get_json()['count'], 2)
+        response = client.get('/api/events?source_cidr=10.0.0.0/40')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()['success'])
+
+    def test_filter_events_by_time_window(self):
+        # Epochs, normalized datetimes and durations before now are accepted, both bounds are inclusive
+        self.assertEqual(self.model.filter_events(since='2024-09-01 10:00:00'),
+                         [self.events[1], self.events[2], self.events[0]])
+        self.assertEqual(self.model.filter_events(since=1725184800, until='2024-09-01T11:00:00Z'),
+                         [self.events[2], self.events[0]])
+        self.assertEqual(self.model.filter_events(until='2024-09-01 12:00:00+02:00'), [self.events[0], self.events[3]])
+        self.assertEqual(self.model.filter_events(since='2024-09-01 09:30:00', threat_level='Medium'), [self.events[0]])
+        self.assertEqual(self.model.filter_events(since='1h'), [])
+        self.assertEqual(parse_time_bound('15m', now=1725184800), 1725183900)
+        self.assertEqual(self.model.filter_events(since='2024-09-02 00:00:00'), [])
+        with self.assertRaises(ValueError):
+            self.model.filter_events(since='yesterday-ish')
+
+        # Events without a valid datetime are outside every window
+        self.model.append_events([dict(self.events[0], datetime='Unknown Format', datetime_epoch=None)])
+        self.assertEqual(len(self.model.filter_events(until='2024-09-01 10:00:00')), 2)
+        self.assertEqual(len(self.model.filter_events(event_type='SSH_BRUTE_FORCE', until=1725184800)), 2)
+
+        stats = self.model.get_event_statistics(since='2024-09-01 10:30:00')
+        self.assertEqual(stats['total_events'], 2)
+        self.assertEqual((stats['high_threat'], stats['low_threat'], stats['medium_threat']), (1, 1, 0))
+        self.assertEqual(stats['last_updated'], '2024-09-01 12:00:00')
+        self.assertEqual(self.model.get_event_statistics(until=0)['total_events'], 0)
+        self.assertEqual(self.model.get_event_statistics()['total_events'], 5)
+
+    def test_time_windows_match_linear_scan(self):
+        rng = random.Random(11)
+        events = [{'datetime': f'2024-09-01 {rng.randint(0, 3):02d}:{rng.randint(0, 59):02d}:00',
+                   'threat_level': rng.choice(['Low', 'High']), 'source_ip': f'10.0.0.{rng.randint(0, 9)}'}
+                  for _ in range(400)]
+        snapshot = EventSnapshot(EventBatch(events))
+        epochs = snapshot.events.epochs
+        for _ in range(50):
+            since, until = sorted(rng.randint(1725148800 - 600, 1725148800 + 4 * 3600) for _ in range(2))
+            for criteria in ({}, {'threat_level': 'High'}, {'source_ip': '10.0.0.3'}):
+                expected = sorted((row for row in range(len(events)) if since <= epochs[row] <= until
+                                   and all(events[row][key] == value for key, value in criteria.items())),
+                                  key=lambda row: (-epochs[row], row))
+                self.assertEqual(sorted(snapshot.query(since=since, until=until, **criteria)), sorted(expected))
+                for limit in (1, 10, 400):
+                    self.assertEqual(snapshot.newest_rows(limit, since=since, until=until, **criteria), expected[:limit])
+
+            # Small windows are counted, large ones are the statistics of every event minus the rows outside
+            reference = EventStatistics()
+            reference.add_events(events[row] for row in range(len(events)) if since <= epochs[row] <= until)
+            self.assertEqual(snapshot.statistics_between(since, until).as_dict(), reference.as_dict())
+        self.assertEqual(snapshot.statistics_between().as_dict()['total_events'], 400)
+
+    def test_events_endpoint_time_window(self):
+        from ui.app import create_app
+        from ui.routes import event_routes
+        self.addCleanup(setattr, event_routes, 'event_model', event_routes.event_model)
+        event_routes.event_model = self.model
+        client = create_app().test_client()
+
+        self.assertEqual(client.get('/api/events?since=2024-09-01 10:30:00').get_json()['count'], 2)
+        stats = client.get('/api/events/stats?since=1725184800&until=1725188400').get_json()['statistics']
+        self.assertEqual(stats['total_events'], 2)
+        self.assertEqual(client.get('/api/events/stats?until=soon').status_code, 400)
+        self.assertEqual(client.get('/api/events?since=soon').status_code, 400)
+
+    def test_pages_match_single_query(self):
+        rng = random.Random(5)
+        events = [{'datetime': rng.choice(['Unknown Format', f'2024-09-01 10:{rng.randint(0, 5):02d}:00']),
+                   'threat_level': rng.choice(['Low', 'High']), 'source_ip': f'10.0.0.{rng.randint(0, 3)}'}
+                  for _ in range(300)]
+        model = EventModel(self.data_file)
+        model.replace_events(events)
+        snapshot = model.get_snapshot()
+
+        # Following next_cursor gives the order of a single query, without repeating or skipping events
+        for criteria in ({}, {'threat_level': 'High'}, {'source_ip': '10.0.0.1'}, {'until': '2024-09-01 10:03:00'}):
+            for limit in (1, 7, 100):
+                rows, cursor = [], None
+                while True:
+                    page, cursor = model.get_events_page(limit=limit, cursor=cursor, **criteria)
+                    self.assertLessEqual(len(page), limit)
+                    rows.extend(page)
+                    if cursor is None:
+                        break
+                expected = snapshot.versioned_dicts(snapshot.newest_rows(len(events), **criteria))
+                self.assertEqual(rows, expected)
+
+        # Newer appended events do not move the next page
+        page, cursor = model.get_events_page(limit=10)
+        second_page = model.get_events_page(limit=10, cursor=cursor)[0]
+        model.append_events([dict(events[0], datetime='2024-09-02 00:00:00')])
+        self.assertEqual(model.get_events_page(limit=10, cursor=cursor)[0], second_page)
+        self.assertEqual(model.get_events_page(limit=1)[0][0]['datetime'], '2024-09-02 00:00:00')
+        with self.assertRaises(ValueError):
+            model.get_events_page(cursor='not a cursor')
+
+    def test_events_endpoint_pagination(self):
+        from ui.app import create_app
+        from ui.routes import event_routes
+        self.addCleanup(setattr, event_routes, 'event_model', event_routes.event_model)
+        event_routes.event_model = self.model
+        client = create_app().test_client()
+
+        first = client.get('/api/events?limit=3').get_json()
+        # The events have their data version, the row in the file plus one
+        self.assertEqual(first['events'], [dict(self.events[1], version=2), dict(self.events[2], version=3),
+                                           dict(self.events[0], version=1)])
+        last = client.get(f"/api/events?limit=3&cursor={first['next_cursor']}").get_json()
+        self.assertEqual((last['events'], last['next_cursor']), ([dict(self.events[3], version=4)], None))
+        self.assertEqual(client.get('/api/events?cursor=%%%').status_code, 400)
+
+    def test_events_since_version(self):
+        self.assertEqual(self.model.get_data_version(), 4)
+        self.assertEqual(self.model.get_events_since(4), {'version': 4, 'reset': False, 'truncated': False, 'events': []})
+
+        # Only the newer events are returned, filtered and from the newest to the oldest
+        new_events = [dict(self.events[0], datetime='2024-09-02 08:00:00', datetime_epoch=1725264000),
+                      dict(self.events[1], datetime='2024-09-02 09:00:00', datetime_epoch=1725267600),
+                      dict(self.events[2], datetime='2024-09-02 07:00:00', datetime_epoch=1725260400)]
+        self.model.append_events(new_events)
+        delta = self.model.get_events_since(4)
+        self.assertEqual((delta['version'], delta['reset'], delta['truncated']), (7, False, False))
+        self.assertEqual(delta['events'], [dict(new_events[1], version=6), dict(new_events[0], version=5),
+                                           dict(new_events[2], version=7)])
+        self.assertEqual(self.model.get_events_since(5, threat_level='Low')['events'], [dict(new_events[2], version=7)])
+        self.assertEqual(self.model.get_events_since(4, limit=1)['truncated'], True)
+        self.assertEqual(self.model.get_events_since(0)['version'], 7)
+        self.assertEqual(len(self.model.get_events_since(0)['events']), 7)
+
+        # Replaced events continue the versions after a gap, a client at any version of the replaced
+        # events (the latest one too) has to load everything again
+        self.model.replace_events(self.events[:2])
+        self.assertEqual(self.model.get_data_version(), 10)
+        self.assertEqual(self.model.get_events_since(7), {'version': 10, 'reset': True, 'truncated': False, 'events': []})
+        self.assertEqual([event['version'] for event in self.model.get_events_since(8)['events']], [10, 9])
+        self.assertTrue(self.model.get_events_since(6)['reset'])
+        self.assertTrue(self.model.get_events_since(11)['reset'])
+
+        # Replacing with no events is a new version too
+        self.model.replace_events([])
+        self.assertEqual(self.model.get_data_version(), 11)
+        self.assertTrue(self.model.get_events_since(10)['reset'])
+        self.assertEqual(self.model.get_events_since(11)['reset'], False)
+
+    def test_etag_and_delta_endpoints(self):
+        from ui.app import create_app
+        from ui.routes import event_routes
+        self.addCleanup(setattr, event_routes, 'event_model', event_routes.event_model)
+        event_routes.event_model = self.model
+        client = create_app().test_client()
+
+        for url in ('/api/events?threat_level=Medium', '/api/events/stats', '/api/events/stats?since=2024-09-01 10:00:00'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                etag = response.headers['ETag']
+                self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+                not_modified = client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual((not_modified.status_code, not_modified.data), (304, b''))
+                self.assertEqual(not_modified.headers['ETag'], etag)
+
+                # New data changes the ETag
+                self.model.append_events([self.events[0]])
+                self.assertEqual(client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+        version = client.get('/api/events').get_json()['version']
+        self.model.append_events([self.events[1]])
+        delta = client.get(f'/api/events/since?version={version}').get_json()
+        self.assertEqual((delta['count'], delta['version'], delta['reset']), (1, version + 1, False))
+        self.assertEqual(delta['events'][0]['version'], version + 1)
+        self.assertEqual(client.get('/api/events/since').status_code, 400)
+        self.assertEqual(client.get('/api/events/since?version=1&source_ip=abc').status_code, 400)
+
+    def test_get_recent_events(self):
+        recent = self.model.get_recent_events(limit=2)
+        self.assertEqual(recent, [self.events[1], self.events[2]])
+
+    def test_newest_rows_match_full_sort(self):
+        rng = random.Random(7)
+        events = [
+            {'datetime': rng.choice(['Unknown Format', f'2024-09-0{rng.randint(1, 3)} 10:00:0{rng.randint(0, 2)}']),
+             'source_ip': f'10.0.{rng.randint(0, 3)}.{rng.randint(0, 3)}',
+             'event_type': rng.choice(['LOGIN_FAILED', 'PORT_SCAN', 'WEB_ATTACK']),
+             'threat_level': rng.choice(['Low', 'Medium', 'High'])}
+            for _ in range(300)
+        ]
+        snapshot = EventSnapshot(EventBatch(events))
+
+        # Reference: stable sort from the newest datetime, events without a valid datetime are the oldest
+        def expected(limit, **criteria):
+            rows = [row for row, event in enumerate(events)
+                    if all(ipaddress.ip_address(event[key]) in ipaddress.ip_network(value) if key == 'source_ip'
+                           else event[key] == value for key, value in criteria.items())]
+            rows.sort(key=lambda row: events[row]['datetime'] if events[row]['datetime'] != 'Unknown Format' else '',
+                      reverse=True)
+            return rows[:limit]
+
+        # Small and large limits exercise both the walk of the time index and the heap
+        for limit in (1, 5, 300):
+            self.assertEqual(snapshot.newest_rows(limit), expected(limit))
+            self.assertEqual(snapshot.newest_rows(limit, threat_level='High'), expected(limit, threat_level='High'))
+            self.assertEqual(snapshot.newest_rows(limit, source_ip='10.0.1.0/24', event_type='PORT_SCAN'),
+                             expected(limit, source_ip='10.0.1.0/24', event_type='PORT_SCAN'))
+            self.assertEqual(snapshot.newest_rows(limit, source_ip='10.0.2.0/23'), expected(limit, source_ip='10.0.2.0/23'))
+        self.assertEqual(snapshot.newest_rows(0), [])
+
+    def test_append_events_updates_statistics(self):
+        self.model.get_event_statistics()
+        new_events = [
+            {'datetime': '2024-09-02 08:00:00', 'datetime_epoch': 1725264000, 'source_ip': '10.0.0.3', 'destination_ip': '172.16.0.1',
+             'port': 80, 'event_type': 'WEB_ATTACK', 'priority': 4, 'threat_level': 'Medium'},
+            {'datetime': 'Unknown Format', 'source_ip': '10.0.0.0', 'destination_ip': '172.16.0.1',
+             'port': 80, 'event_type': 'PORT_SCAN', 'priority': 2, 'threat_level': 'Low'},
+        ]
+        self.assertEqual(self.model.append_events(new_events), 2)
+
+        stats = self.model.get_event_statistics()
+        self.assertEqual(stats['total_events'], 6)
+        self.assertEqual(stats['medium_threat'], 3)
+        self.assertEqual(stats['low_threat'], 2)
+        # "Unknown Format" is not a datetime, the newest valid one is reported
+        self.assertEqual(stats['last_updated'], '2024-09-02 08:00:00')
+
+        # The indexes include the appended events
+        self.assertEqual(self.model.get_recent_events(limit=1), [new_events[0]])
+        self.assertEqual(self.model.get_recent_events(limit=6)[-1], new_events[1])
+        self.assertEqual(self.model.filter_events(source_ip='10.0.0.0'), [new_events[1]])
+
+        # Large appends sort the indexes again
+        many_events = [dict(new_events[0], datetime=f'2024-09-03 00:{minute:02d}:00', datetime_epoch=1725321600 + minute * 60)
+                       for minute in range(60)] * 2
+        self.model.append_events(many_events)
+        self.assertEqual(self.model.get_recent_events(limit=2), many_events[59:60] + many_events[119:120])
+        self.assertEqual(self.model.get_event_statistics()['event_types']['WEB_ATTACK'], 121)
+
+    def test_replace_events(self):
+        self.model.replace_events(self.events[:1])
+        self.assertEqual(self.model.get_event_statistics()['total_events'], 1)
+
+    def test_snapshot_is_cached(self):
+        snapshot = self.model.get_snapshot()
+        self.assertIs(self.model.get_snapshot(), snapshot)
+
+        # A new file (different size) is loaded in the background, the old snapshot is served meanwhile
+        self.write_events(self.events[:2])
+        served = self.model.get_snapshot()
+        self.model.wait_for_reload()
+        self.assertIn(served, (snapshot, self.model.get_snapshot()))
+        self.assertEqual(self.model.get_event_statistics()['total_events'], 2)
+
+    def test_invalidate(self):
+        model = EventModel(self.data_file, background_reload=False)
+        snapshot = model.get_snapshot()
+
+        model.invalidate()
+        self.assertIsNot(model.get_snapshot(), snapshot)
+
+    def test_missing_file(self):
+        model = EventModel(os.path.join(self.test_dir, "missing.json"))
+        self.assertEqual(model.get_event_statistics()['total_events'], 0)
+        self.assertEqual(model.filter_events(), [])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
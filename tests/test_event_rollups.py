@@ -0,0 +1,211 @@
+# Test to validate the time bucket rollups ("EventRollups"): the time series match a count of the events, the old fine
+# buckets are dropped while the coarse ones keep counting their events, and the in-memory snapshot, the SQLite store and
+# the timeseries endpoint serve the same series.
+
+import os
+import random
+import sqlite3
+import unittest
+from collections import Counter
+from helpers.test import TestEventSiemLogProcessor
+from src.basic_functions.normalize_event_datetime import epoch_to_normalized_datetime
+from src.compact_events.event_batch import EventBatch
+from src.compact_events.event_rollups import MAX_EVENT_TYPE_SERIES, OTHER_EVENT_TYPES, ROLLUP_LEVELS, EventRollups
+from ui.models.event_model import EventModel
+
+START = 1725184800
+MIDNIGHT = 1725148800
+
+
+def random_events(rng, count, span_seconds):
+    return [{'datetime': rng.choice(['Unknown Format', epoch_to_normalized_datetime(START + rng.randrange(span_seconds))]),
+             'source_ip': '10.0.0.1', 'destination_ip': '172.16.0.1', 'port': 22,
+             'event_type': rng.choice(['SSH_BRUTE_FORCE', 'PORT_SCAN', 'DATA_EXFILTRATION']),
+             'priority': 3, 'threat_level': rng.choice(['Low', 'Medium', 'High', None])}
+            for _ in range(count)]
+
+
+def linear_timeseries(events, width, epochs):
+    # Expected total and threat level counts of the buckets starting at epochs, by a scan of the events
+    dated = [(EventBatch([event]).epochs[0] // width, event) for event in events if event['datetime'] != 'Unknown Format']
+    totals = Counter(bucket for bucket, _ in dated)
+    threat_levels = Counter((bucket, event['threat_level'] or 'Unknown') for bucket, event in dated)
+    return ([totals[epoch // width] for epoch in epochs],
+            {level: [threat_levels[(epoch // width, level)] for epoch in epochs] for _, level in threat_levels})
+
+
+class TestEventRollups(TestEventSiemLogProcessor):
+    def test_timeseries_match_linear_scan(self):
+        events = random_events(random.Random(4), 3000, 3 * 86400)
+        rollups = EventRollups()
+        batch = EventBatch(events[:1000])
+        rollups.add_batch_rows(batch)
+        # Appended rows are added as a delta
+        batch.extend(events[1000:])
+        rollups.add_batch_rows(batch, 1000)
+
+        for bucket_seconds, since, until in ((60, None, None), (900, START + 86400, None), (3600, None, START + 7200),
+                                             (6 * 3600, None, None), (86400, START, START + 3 * 86400), (604800, None, None)):
+            with self.subTest(bucket_seconds=bucket_seconds, since=since, until=until):
+                timeseries = rollups.timeseries(bucket_seconds, since, until)
+                totals, threat_levels = linear_timeseries(events, bucket_seconds, timeseries['epochs'])
+                self.assertEqual(timeseries['bucket_seconds'], bucket_seconds)
+                self.assertEqual(timeseries['total'], totals)
+                self.assertEqual(timeseries['threat_levels'],
+                                 {level: counts for level, counts in threat_levels.items() if any(counts)})
+                self.assertEqual([sum(counts) for counts in zip(*timeseries['event_types'].values())], totals)
+                if since is not None:
+                    self.assertLessEqual(timeseries['epochs'][0], since)
+                    self.assertGreater(timeseries['epochs'][0] + bucket_seconds, since)
+        # The minute buckets of the last 2 days are kept, the hour buckets cover the whole history
+        self.assertLessEqual(len(rollups.timeseries(60)['epochs']), 2 * 1440)
+        self.assertEqual(sum(rollups.timeseries(3600)['total']), sum(event['datetime'] != 'Unknown Format' for event in events))
+        with self.assertRaises(ValueError):
+            rollups.timeseries(90)
+
+    def test_old_buckets_are_downsampled(self):
+        rollups = EventRollups()
+        # One event per hour during a year: the storage of every level is bounded by its retention
+        events = [{'datetime': epoch_to_normalized_datetime(MIDNIGHT + hour * 3600), 'event_type': 'PORT_SCAN',
+                   'threat_level': 'Low'} for hour in range(365 * 24)]
+        batch = EventBatch()
+        for start in range(0, len(events), 500):
+            batch.extend(events[start:start + 500])
+            rollups.add_batch_rows(batch, start)
+        for level, (width, retention) in zip(rollups.levels, ROLLUP_LEVELS):
+            self.assertLessEqual(level.length, retention)
+            self.assertEqual(level.width, width)
+
+        # The dropped minute and hour buckets are still counted by the day buckets
+        self.assertEqual(rollups.timeseries(86400)['total'], [24] * 365)
+        hours = rollups.timeseries(3600)
+        self.assertEqual((len(hours['epochs']), hours['epochs'][-1]), (90 * 24, MIDNIGHT + (365 * 24 - 1) * 3600))
+        self.assertEqual(sum(rollups.timeseries(60)['total']), 48)
+
+        # A late event older than the minute buckets is only added to the coarser levels
+        batch.append({'datetime': epoch_to_normalized_datetime(MIDNIGHT + 100 * 86400 + 5), 'event_type': 'PORT_SCAN',
+                      'threat_level': 'High'})
+        rollups.add_batch_rows(batch, len(batch) - 1)
+        self.assertEqual(rollups.timeseries(86400, MIDNIGHT + 100 * 86400, MIDNIGHT + 100 * 86400)['threat_levels'],
+                         {'Low': [24], 'High': [1]})
+        self.assertEqual(sum(rollups.timeseries(60)['total']), 48)
+
+    def test_future_events_keep_the_history(self):
+        # 5 events on 2024-09-01 and one dated 2099-01-01 by a wrong clock: the outlier is left out of the rollups
+        events = [{'datetime': epoch_to_normalized_datetime(START + minute * 60), 'event_type': 'PORT_SCAN',
+                   'threat_level': 'Low'} for minute in range(5)]
+        events.append({'datetime': '2099-01-01 00:00:00', 'event_type': 'PORT_SCAN', 'threat_level': 'High'})
+        rollups = EventRollups()
+        rollups.add_batch_rows(EventBatch(events))
+        memory_model = EventModel(os.path.join(self.test_dir, 'processed_events.json'))
+        memory_model.replace_events(events)
+        model = EventModel(os.path.join(self.test_dir, 'events.sqlite'))
+        self.addCleanup(model.store.close)
+        model.replace_events(events)
+
+        for timeseries in (rollups.timeseries(86400), rollups.timeseries(3600), memory_model.get_event_timeseries('1d'),
+                           model.get_event_timeseries('1d'), model.get_event_timeseries('1h')):
+            self.assertEqual(sum(timeseries['total']), 5)
+            self.assertEqual(timeseries['threat_levels'], {'Low': timeseries['total']})
+        self.assertEqual(rollups.timeseries(86400)['epochs'], [MIDNIGHT])
+        self.assertEqual(model.get_event_timeseries('1h')['epochs'], [START])
+
+    def test_event_type_series_are_bounded(self):
+        # A known event type, then junk event types (one per event) and the known event type again
+        events = [{'datetime': epoch_to_normalized_datetime(START + index * 60), 'event_type': event_type,
+                   'threat_level': 'Low'}
+                  for index, event_type in enumerate(['PORT_SCAN'] + [f'JUNK_{index}' for index in range(300)] + ['PORT_SCAN'])]
+        rollups = EventRollups()
+        batch = EventBatch(events[:150])
+        rollups.add_batch_rows(batch)
+        batch.extend(events[150:])
+        rollups.add_batch_rows(batch, 150)
+        memory_model = EventModel(os.path.join(self.test_dir, 'processed_events.json'))
+        memory_model.replace_events(events)
+        model = EventModel(os.path.join(self.test_dir, 'events.sqlite'))
+        self.addCleanup(model.store.close)
+        model.store.insert_batch_rows = 70
+        model.replace_events(events)
+
+        # Every level keeps MAX_EVENT_TYPE_SERIES event type series and the "Other" one, every event is still counted
+        for level in rollups.levels:
+            self.assertEqual(sum(dimension == 'event_type' for dimension, _ in level.series), MAX_EVENT_TYPE_SERIES + 1)
+        for timeseries in (rollups.timeseries(3600), memory_model.get_event_timeseries('1h'), model.get_event_timeseries('1h')):
+            event_types = timeseries['event_types']
+            self.assertEqual(len(event_types), MAX_EVENT_TYPE_SERIES + 1)
+            self.assertEqual(sum(event_types['PORT_SCAN']), 2)
+            self.assertEqual(sum(event_types[OTHER_EVENT_TYPES]), len(events) - MAX_EVENT_TYPE_SERIES - 1)
+            self.assertEqual(sum(timeseries['total']), len(events))
+        self.assertEqual(model.get_event_timeseries('1h'), memory_model.get_event_timeseries('1h'))
+
+        # A database written before rollup_event_types gets the event types of its rollups, a new event type is counted
+        # in "Other"
+        model.store.close()
+        with sqlite3.connect(os.path.join(self.test_dir, 'events.sqlite')) as connection:
+            connection.execute('DELETE FROM rollup_event_types')
+        model = EventModel(os.path.join(self.test_dir, 'events.sqlite'))
+        self.addCleanup(model.store.close)
+        model.append_events([{'datetime': epoch_to_normalized_datetime(START), 'event_type': 'NEW_TYPE', 'threat_level': 'Low'}])
+        self.assertNotIn('NEW_TYPE', model.get_event_timeseries('1h')['event_types'])
+        self.assertEqual(sum(model.get_event_timeseries('1h')['event_types'][OTHER_EVENT_TYPES]), len(events) - MAX_EVENT_TYPE_SERIES)
+
+    def test_store_serves_the_same_timeseries(self):
+        events = random_events(random.Random(8), 2000, 4 * 86400)
+        memory_model = EventModel(os.path.join(self.test_dir, 'processed_events.json'))
+        memory_model.replace_events(events[:1200])
+        memory_model.append_events(events[1200:])
+        database = os.path.join(self.test_dir, 'events.sqlite')
+        model = EventModel(database)
+        model.store.insert_batch_rows = 300
+        model.replace_events(events[:1200])
+        model.append_events(events[1200:])
+        # The minute rows of the store are trimmed to the retention as the blocks are inserted
+        self.assertLessEqual(model.store.rollup_bounds(60)[1] - model.store.rollup_bounds(60)[0], 2 * 1440)
+
+        for bucket, since in (('1m', None), ('15m', None), ('1h', START + 86400), ('1d', None), ('1w', None)):
+            with self.subTest(bucket=bucket, since=since):
+                self.assertEqual(model.get_event_timeseries(bucket, since=since),
+                                 memory_model.get_event_timeseries(bucket, since=since))
+        with self.assertRaises(ValueError):
+            model.get_event_timeseries('1x')
+        expected = model.get_event_timeseries('1h')
+        model.store.close()
+
+        # A database written before the rollups is rolled up when it is opened
+        with sqlite3.connect(database) as connection:
+            connection.execute('DELETE FROM event_rollups')
+            connection.execute("DELETE FROM store_info WHERE name = 'rollups'")
+        model = EventModel(database)
+        self.addCleanup(model.store.close)
+        self.assertEqual(model.get_event_timeseries('1h'), expected)
+        model.replace_events([])
+        self.assertEqual(model.get_event_timeseries('1h')['epochs'], [])
+
+    def test_timeseries_endpoint(self):
+        from ui.app import create_app
+        from ui.routes import event_routes
+        model = EventModel(os.path.join(self.test_dir, 'processed_events.json'))
+        model.replace_events(random_events(random.Random(2), 200, 86400))
+        self.addCleanup(setattr, event_routes, 'event_model', event_routes.event_model)
+        event_routes.event_model = model
+        client = create_app().test_client()
+
+        response = client.get(f'/api/events/timeseries?bucket=1h&since={START + 3600}')
+        timeseries = response.get_json()['timeseries']
+        self.assertEqual(timeseries, model.get_event_timeseries('1h', since=START + 3600))
+        self.assertEqual((timeseries['bucket_seconds'], timeseries['epochs'][0]), (3600, START + 3600))
+        etag = response.headers['ETag']
+        self.assertEqual(client.get('/api/events/timeseries?bucket=1h&since=1725188400',
+                                    headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(client.get('/api/events/timeseries?bucket=1d', headers={'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(len(client.get('/api/events/timeseries').get_json()['timeseries']['epochs']), 24)
+        for url in ('/api/events/timeseries?bucket=abc', '/api/events/timeseries?bucket=30s',
+                    '/api/events/timeseries?since=abc'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.get_json()['success'])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
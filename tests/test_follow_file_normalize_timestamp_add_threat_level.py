@@ -0,0 +1,81 @@
+# Test to validate the follow mode (follow_file_normalize_timestamp_add_threat_level) that processes only the lines appended to a growing file.
+
+import os
+import threading
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from helpers.data_generator import generate_siem_events_csv
+from src.complex_processor_functions.follow_processor_functions import (
+    follow_file_normalize_timestamp_add_threat_level,
+    load_checkpoint
+)
+
+
+class TestFollowFileNormalizeTimestampAddThreatLevel(TestEventSiemLogProcessor):
+    def setUp(self):
+        super().setUp()
+        self.log_path = os.path.join(self.test_dir, "growing_events.txt")
+        self.checkpoint_path = os.path.join(self.test_dir, "growing_events.checkpoint")
+
+    def append(self, text):
+        with open(self.log_path, "a") as f:
+            f.write(text)
+
+    def run_once(self, **kwargs):
+        batches = follow_file_normalize_timestamp_add_threat_level(
+            self.log_path, self.checkpoint_path, follow=False, **kwargs)
+        return [event for batch in batches for event in batch]
+
+    def test_only_appended_lines_are_processed(self):
+        self.append(generate_siem_events_csv(count=5))
+        self.assertEqual(len(self.run_once()), 5)
+
+        # A restart resumes from the checkpoint
+        self.assertEqual(self.run_once(), [])
+
+        # Incomplete lines wait for their newline
+        self.append(generate_siem_events_csv(count=3, include_edge_cases=True))
+        self.append("2024-09-01T14:25:37Z,10.0.0.1,10.0.0.2,22,SSH_BRUTE_")
+        self.assertEqual(len(self.run_once(chunk_size=16)), 3)
+        self.append("FORCE,4\n")
+        events = self.run_once()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['event_type'], 'SSH_BRUTE_FORCE')
+        self.assertEqual(events[0]['threat_level'], 'Medium')
+        self.assertEqual(load_checkpoint(self.checkpoint_path)['offset'], os.path.getsize(self.log_path))
+
+    def test_truncation_and_rotation(self):
+        self.append(generate_siem_events_csv(count=4))
+        self.assertEqual(len(self.run_once()), 4)
+
+        # Truncated file: the new content is read from the beginning
+        with open(self.log_path, "w") as f:
+            f.write(generate_siem_events_csv(count=2))
+        self.assertEqual(len(self.run_once()), 2)
+
+        # Rotated file: a new file in the same path, even if it is bigger than the offset
+        os.rename(self.log_path, self.log_path + ".1")
+        self.append(generate_siem_events_csv(count=6))
+        self.assertEqual(len(self.run_once()), 6)
+
+    def test_follow_until_stopped(self):
+        self.append(generate_siem_events_csv(count=2))
+        stop_event = threading.Event()
+        received = []
+        for batch in follow_file_normalize_timestamp_add_threat_level(
+                self.log_path, self.checkpoint_path, poll_interval=0.01, stop_event=stop_event):
+            received.extend(batch)
+            if len(received) == 2:
+                self.append(generate_siem_events_csv(count=1))
+            else:
+                stop_event.set()
+
+        self.assertEqual(len(received), 3)
+        self.assertEqual(load_checkpoint(self.checkpoint_path)['offset'], os.path.getsize(self.log_path))
+
+    def test_missing_file(self):
+        self.assertEqual(self.run_once(), [])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
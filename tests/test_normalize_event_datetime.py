@@ -2,7 +2,7 @@
 
 import unittest
 from helpers.test import TestEventSiemLogProcessor
-from src.basic_functions.normalize_event_datetime import normalize_event_datetime
+from src.basic_functions.normalize_event_datetime import normalize_event_datetime, normalized_datetime_to_epoch
 
 
 class TestNormalizeEventDatetime(TestEventSiemLogProcessor):
@@ -27,5 +27,36 @@ class TestNormalizeEventDatetime(TestEventSiemLogProcessor):
         normalized4 = normalize_event_datetime(event4)
         self.assertEqual(normalized4['datetime'], 'Unknown Format')
 
+    def test_fast_parsers_match_dateutil(self):
+        from helpers.data_generator import DATETIME_FORMATS, generate_siem_event
+        from src.basic_functions.normalize_event_datetime import _normalize_with_dateutil
+
+        # Every layout of the data generator has to give the same output as dateutil
+        for datetime_format in DATETIME_FORMATS:
+            for _ in range(20):
+                raw_datetime = generate_siem_event(datetime_format)['datetime']
+                normalized = normalize_event_datetime({'datetime': raw_datetime})
+                self.assertEqual(normalized['datetime'], _normalize_with_dateutil(raw_datetime))
+                self.assertEqual(normalized['datetime_epoch'], normalized_datetime_to_epoch(normalized['datetime']))
+
+    def test_fallback_to_dateutil(self):
+        # Known layout with a day first value (month 13) is resolved by dateutil as before
+        self.assertEqual(normalize_event_datetime({'datetime': '13-01-2024 15:00:15'})['datetime'], '2024-01-13 15:00:15')
+
+        # Shapes without a compiled parser are still parsed
+        self.assertEqual(normalize_event_datetime({'datetime': 'Sep 1 2024 14:23:01'})['datetime'], '2024-09-01 14:23:01')
+        self.assertEqual(normalize_event_datetime({'datetime': '2024-09-01T14:25:37+05:30'})['datetime'], '2024-09-01 08:55:37')
+
+        # Invalid values on a known layout
+        self.assertEqual(normalize_event_datetime({'datetime': '2024-02-30 10:00:00'})['datetime'], 'Unknown Format')
+
+    def test_datetime_epoch(self):
+        # Every normalized datetime carries its seconds since the Unix epoch, from both parsers
+        self.assertEqual(normalize_event_datetime({'datetime': '2024-09-01 15:00:15'})['datetime_epoch'], 1725202815)
+        self.assertEqual(normalize_event_datetime({'datetime': '2024/09/01 14:23:01-0400'})['datetime_epoch'], 1725214981)
+        self.assertEqual(normalize_event_datetime({'datetime': 'Sep 1 2024 14:23:01'})['datetime_epoch'], 1725200581)
+        self.assertNotIn('datetime_epoch', normalize_event_datetime({'datetime': 'not-a-date'}))
+
+
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
\ No newline at end of file
@@ -0,0 +1,83 @@
+# Test to validate the parallel mode of the complex processor (split_file_into_byte_ranges, combine_read_file_normalize_timestamp_add_threat_level_parallel, the bounded shards in flight and the batches stream).
+
+import os
+import time
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from helpers.data_generator import generate_siem_events_csv
+from src.complex_processor_functions.combined_processor_functions import (
+    combine_read_file_normalize_timestamp_add_threat_level_parallel,
+    _map_byte_ranges,
+    split_file_into_byte_ranges,
+    stream_read_file_normalize_timestamp_add_threat_level,
+    stream_read_file_normalize_timestamp_add_threat_level_parallel_batches
+)
+
+
+# Worker of _map_byte_ranges that leaves a marker file for every range it starts
+def mark_byte_range(file_path, start, end):
+    open(f"{file_path}.{start}", "w").close()
+    return start, {'stages': {}, 'rejected': {}, 'counters': {}, 'unknown_event_types': {}}
+
+
+class TestParallelReadFileNormalizeTimestampAddThreatLevel(TestEventSiemLogProcessor):
+    def setUp(self):
+        super().setUp()
+        self.large_file_path = os.path.join(self.test_dir, "large_test_events.txt")
+        with open(self.large_file_path, "w") as f:
+            f.write(generate_siem_events_csv(count=200, include_edge_cases=True))
+
+    def test_split_file_into_byte_ranges(self):
+        byte_ranges = split_file_into_byte_ranges(self.large_file_path, 7)
+        with open(self.large_file_path, 'rb') as f:
+            data = f.read()
+
+        # The ranges are contiguous, cover the whole file and every range starts at the beginning of a line
+        self.assertEqual(byte_ranges[0][0], 0)
+        self.assertEqual(byte_ranges[-1][1], len(data))
+        for (_, previous_end), (start, _) in zip(byte_ranges, byte_ranges[1:]):
+            self.assertEqual(previous_end, start)
+            self.assertEqual(data[start - 1:start], b'\n')
+
+        # More shards than lines is not a problem
+        self.assertEqual(split_file_into_byte_ranges(self.test_file_path, 1000)[-1][1], os.path.getsize(self.test_file_path))
+
+    def test_parallel_matches_sequential(self):
+        expected = list(stream_read_file_normalize_timestamp_add_threat_level(self.large_file_path))
+        processed_events = combine_read_file_normalize_timestamp_add_threat_level_parallel(
+            self.large_file_path, workers=2, min_shard_bytes=1)
+
+        # Same events in the same order (200 valid events, edge cases are omitted)
+        self.assertEqual(len(processed_events), 200)
+        self.assertEqual(processed_events, expected)
+
+    def test_parallel_batches_match_sequential(self):
+        expected = list(stream_read_file_normalize_timestamp_add_threat_level(self.large_file_path))
+        batches = list(stream_read_file_normalize_timestamp_add_threat_level_parallel_batches(
+            self.large_file_path, workers=2, min_shard_bytes=1, pending_per_worker=1))
+
+        # One batch per shard, the columns come back as the same events in the same order
+        self.assertEqual(len(batches), 8)
+        self.assertEqual([event for batch in batches for event in batch.to_dicts()], expected)
+
+    def test_parallel_shards_in_flight_are_bounded(self):
+        marker_path = os.path.join(self.test_dir, "marker")
+        byte_ranges = [(start, start + 1) for start in range(10)]
+        shards = _map_byte_ranges(mark_byte_range, marker_path, byte_ranges, workers=2, max_pending=2)
+
+        # Only the ranges in flight and the one submitted after the first result have been started
+        self.assertEqual(next(shards), 0)
+        time.sleep(0.5)
+        started = [name for name in os.listdir(self.test_dir) if name.startswith("marker.")]
+        self.assertLessEqual(len(started), 3)
+
+        # The rest arrive in order
+        self.assertEqual(list(shards), list(range(1, 10)))
+
+    def test_parallel_missing_file(self):
+        self.assertEqual(combine_read_file_normalize_timestamp_add_threat_level_parallel('missing_file.txt'), [])
+        self.assertEqual(list(stream_read_file_normalize_timestamp_add_threat_level_parallel_batches('missing_file.txt')), [])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
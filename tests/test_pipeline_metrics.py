@@ -0,0 +1,94 @@
+# Test to validate the aggregated pipeline metrics (counters, stage timings) and the /api/metrics endpoint.
+
+import logging
+import threading
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.basic_functions.assign_priority_by_event_type import assign_priority_by_event_type
+from src.basic_functions.normalize_event_datetime import normalize_event_datetime
+from src.complex_processor_functions.combined_processor_functions import (
+    combine_read_file_normalize_timestamp_add_threat_level,
+    combine_read_file_normalize_timestamp_add_threat_level_parallel,
+    stream_read_file_normalize_timestamp_add_threat_level
+)
+from src.instrumentation import pipeline_metrics
+from src.instrumentation.pipeline_metrics import MAX_UNKNOWN_EVENT_TYPES, OTHER_EVENT_TYPES, PIPELINE_METRICS
+from ui.app import create_app
+
+
+class TestPipelineMetrics(TestEventSiemLogProcessor):
+    def setUp(self):
+        super().setUp()
+        PIPELINE_METRICS.reset()
+        self.addCleanup(pipeline_metrics.set_debug_logging, pipeline_metrics.DEBUG_LOGGING)
+        pipeline_metrics.set_debug_logging(False)
+
+    def test_stage_counters(self):
+        events = list(stream_read_file_normalize_timestamp_add_threat_level(self.test_file_path))
+        metrics = PIPELINE_METRICS.as_dict()
+
+        # 3 valid events, a line with 2 fields and a line with an invalid priority
+        self.assertEqual(len(events), 3)
+        self.assertEqual(metrics['rejected'], {'invalid_field_count': 1, 'invalid_port_priority': 1})
+        for stage in ('read', 'validate', 'normalize', 'enrich'):
+            self.assertEqual(metrics['stages'][stage]['events'], 3)
+            self.assertEqual(sum(metrics['stages'][stage]['histogram']), metrics['stages'][stage]['blocks'])
+
+    def test_rejected_lines_of_a_thread(self):
+        rejected = PIPELINE_METRICS.thread_rejected()
+        other_thread = threading.Thread(target=PIPELINE_METRICS.count_rejected, args=('empty_fields', 7))
+        other_thread.start()
+        other_thread.join()
+        list(stream_read_file_normalize_timestamp_add_threat_level(self.test_file_path))
+
+        # The lines rejected by another thread are only in the totals
+        self.assertEqual(PIPELINE_METRICS.thread_rejected() - rejected, 2)
+        self.assertEqual(sum(PIPELINE_METRICS.as_dict()['rejected'].values()), 9)
+
+    def test_parallel_workers_report_metrics(self):
+        events = combine_read_file_normalize_timestamp_add_threat_level_parallel(self.test_file_path, workers=2, min_shard_bytes=1)
+        metrics = PIPELINE_METRICS.as_dict()
+
+        self.assertEqual(len(events), 3)
+        self.assertEqual(metrics['stages']['enrich']['events'], 3)
+        self.assertEqual(metrics['rejected'], {'invalid_field_count': 1, 'invalid_port_priority': 1})
+
+    def test_exceptional_cases_are_counted(self):
+        normalize_event_datetime({'datetime': 'not a date'})
+        normalize_event_datetime({'datetime': 'Sep 1 2024 10:00'})
+        for index in range(MAX_UNKNOWN_EVENT_TYPES + 5):
+            assign_priority_by_event_type(f"CUSTOM_{index}")
+        metrics = PIPELINE_METRICS.as_dict()
+
+        self.assertEqual(metrics['counters'], {'dates_unparseable': 1, 'dates_parsed_with_fallback': 1})
+        # The distinct unknown event types are bounded
+        self.assertEqual(len(metrics['unknown_event_types']), MAX_UNKNOWN_EVENT_TYPES + 1)
+        self.assertEqual(metrics['unknown_event_types'][OTHER_EVENT_TYPES], 5)
+
+    def test_per_event_logging_needs_the_flag(self):
+        # Only the per-file log line is emitted
+        with self.assertLogs(level=logging.DEBUG) as logs:
+            combine_read_file_normalize_timestamp_add_threat_level(self.test_file_path)
+            assign_priority_by_event_type('CUSTOM')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Processing 3 events", logs.output[0])
+
+        pipeline_metrics.set_debug_logging(True)
+        with self.assertLogs(level=logging.WARNING) as logs:
+            assign_priority_by_event_type('CUSTOM')
+        self.assertIn("Unknown event type 'CUSTOM'", logs.output[0])
+
+    def test_metrics_endpoint(self):
+        list(stream_read_file_normalize_timestamp_add_threat_level(self.test_file_path))
+        client = create_app().test_client()
+
+        response = client.get('/api/metrics?reset=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['metrics']['stages']['read']['events'], 3)
+
+        response = client.get('/api/metrics')
+        self.assertEqual(response.get_json()['metrics']['stages']['read']['events'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,92 @@
+# Test to validate the background processing jobs (ProcessingJobManager) and the /api/process endpoints.
+
+import os
+import threading
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from ui.app import create_app
+from ui.models.event_model import EventModel
+from ui.models.processing_jobs import ProcessingJobManager
+from ui.routes import event_routes
+
+
+class TestProcessingJobs(TestEventSiemLogProcessor):
+    def test_job_progress_and_failure(self):
+        def runner(job):
+            job.add_progress(10, 8, events_rejected=1)
+            job.add_progress(5, 5)
+            if job.file_path == 'broken.txt':
+                raise ValueError('broken file')
+
+        manager = ProcessingJobManager(runner, max_concurrent_jobs=1)
+        job = manager.wait(manager.submit('events.txt').job_id)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.to_dict()['lines_read'], 15)
+        self.assertEqual(job.to_dict()['events_processed'], 13)
+        self.assertEqual(job.to_dict()['events_rejected'], 1)
+
+        failed = manager.wait(manager.submit('broken.txt').job_id)
+        self.assertEqual(failed.status, 'failed')
+        self.assertEqual(failed.error, 'broken file')
+
+    def test_cancel_and_queue_limit(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def runner(job):
+            started.set()
+            while True:
+                release.wait(0.01)
+                job.add_progress(1, 1)
+
+        manager = ProcessingJobManager(runner, max_concurrent_jobs=1, max_queued_jobs=1)
+        running = manager.submit('first.txt')
+        queued = manager.submit('second.txt')
+        started.wait(1)
+
+        # One running and one queued job fill the manager
+        with self.assertRaises(RuntimeError):
+            manager.submit('third.txt')
+
+        # A queued job never starts, a running job stops at the next progress report
+        self.assertEqual(manager.cancel(queued.job_id).status, 'cancelled')
+        manager.cancel(running.job_id)
+        self.assertEqual(manager.wait(running.job_id, timeout=1).status, 'cancelled')
+        self.assertIsNone(manager.cancel('unknown'))
+
+    def test_process_endpoints(self):
+        previous_model, previous_manager = event_routes.event_model, event_routes.job_manager
+        event_routes.event_model = EventModel(os.path.join(self.test_dir, "processed_events.json"))
+        event_routes.job_manager = None
+        try:
+            client = create_app().test_client()
+
+            response = client.post('/api/process', json={'file_path': self.test_file_path})
+            self.assertEqual(response.status_code, 202)
+            job_id = response.get_json()['job_id']
+            event_routes.get_job_manager().wait(job_id)
+
+            job = client.get(f'/api/process/{job_id}').get_json()['job']
+            self.assertEqual(job['status'], 'completed')
+            self.assertEqual(job['events_processed'], 3)
+            self.assertEqual(job['events_rejected'], 2)
+            self.assertEqual(client.get('/api/events/stats').get_json()['statistics']['total_events'], 3)
+
+            # The blank lines are read but they are not rejected events
+            with open(self.test_file_path, 'a') as f:
+                f.write('\n\n\n')
+            job_id = client.post('/api/process', json={'file_path': self.test_file_path}).get_json()['job_id']
+            event_routes.get_job_manager().wait(job_id)
+            job = client.get(f'/api/process/{job_id}').get_json()['job']
+            self.assertEqual((job['events_processed'], job['events_rejected']), (3, 2))
+            self.assertGreater(job['lines_read'], 5)
+
+            self.assertEqual(client.post('/api/process', json={'file_path': 'missing.txt'}).status_code, 400)
+            self.assertEqual(client.get('/api/process/unknown').status_code, 404)
+            self.assertEqual(client.delete('/api/process/unknown').status_code, 404)
+        finally:
+            event_routes.event_model, event_routes.job_manager = previous_model, previous_manager
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,47 @@
+# Test to validate the "read_events_from_file_mmap" function that reads the events scanning the bytes of a memory-mapped file
+
+import os
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.basic_functions.read_events_from_file import read_events_from_file
+from src.basic_functions.read_events_from_file_mmap import iter_events_from_file_mmap, read_events_from_file_mmap
+
+
+class TestReadEventsFromFileMmap(TestEventSiemLogProcessor):
+    def test_read_events_from_file_mmap(self):
+        events = read_events_from_file_mmap(self.test_file_path)
+
+        # Same 3 valid events as the csv reader (edge cases are filtered out)
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events, read_events_from_file(self.test_file_path))
+
+        # Small chunks split the file in several blocks without changing the result
+        self.assertEqual(list(iter_events_from_file_mmap(self.test_file_path, chunk_size=16)), events)
+
+    def test_malformed_rows(self):
+        file_path = os.path.join(self.test_dir, "malformed_events.txt")
+        with open(file_path, "w", newline='') as f:
+            f.write('2024-09-01T14:25:37Z,10.0.0.1,10.0.0.2,443,LOGIN_FAILED,2\r\n'
+                    '\r\n'
+                    '2024-09-01T14:25:37Z,,10.0.0.2,443,LOGIN_FAILED,2\n'
+                    '2024-09-01T14:25:37Z,10.0.0.1,10.0.0.2,https,LOGIN_FAILED,2\n'
+                    'linea,invalida\n'
+                    '"2024-09-01 14:25:37",10.0.0.1,10.0.0.2,22,SSH_BRUTE_FORCE,4')
+
+        events = read_events_from_file_mmap(file_path)
+
+        # Windows line endings and quoted fields are supported, empty fields are kept as the csv reader does
+        self.assertEqual(events, read_events_from_file(file_path))
+        self.assertEqual([event['port'] for event in events], [443, 443, 22])
+        self.assertEqual(events[2]['datetime'], '2024-09-01 14:25:37')
+
+    def test_empty_and_missing_file(self):
+        empty_file_path = os.path.join(self.test_dir, "empty_events.txt")
+        open(empty_file_path, "w").close()
+
+        self.assertEqual(read_events_from_file_mmap(empty_file_path), [])
+        self.assertEqual(read_events_from_file_mmap('missing_file.txt'), [])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
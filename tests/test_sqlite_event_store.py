@@ -0,0 +1,186 @@
+# Test to validate the "SqliteEventStore" storage backend: the indexed queries of the model answered by SQLite match the
+# in-memory snapshot, the history accumulates across runs and the pipeline inserts the events in batched transactions.
+
+import os
+import random
+import sqlite3
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.compact_events.event_file_formats import iter_processed_events, write_processed_events
+from src.event_store.sqlite_event_store import SqliteEventStore
+from ui.models.event_model import EventModel
+from ui.models.processing_jobs import ProcessingJob
+
+
+def random_events(rng, count):
+    return [{'datetime': rng.choice(['Unknown Format', f'2024-09-01 {rng.randint(0, 3):02d}:{rng.randint(0, 59):02d}:00']),
+             'source_ip': rng.choice([f'10.0.{rng.randint(0, 1)}.{rng.randint(0, 9)}', '2001:db8::1', 'not an ip']),
+             'destination_ip': f'172.16.0.{rng.randint(0, 3)}', 'port': rng.choice([22, 443, 3389]),
+             'event_type': rng.choice(['SSH_BRUTE_FORCE', 'PORT_SCAN', 'DATA_EXFILTRATION']),
+             'priority': rng.randint(1, 5), 'threat_level': rng.choice(['Low', 'Medium', 'High'])}
+            for _ in range(count)]
+
+
+class TestSqliteEventStore(TestEventSiemLogProcessor):
+    def open_model(self, name='events.sqlite'):
+        model = EventModel(os.path.join(self.test_dir, name))
+        self.addCleanup(model.store.close)
+        return model
+
+    def test_queries_match_the_snapshot(self):
+        rng = random.Random(3)
+        events = random_events(rng, 500)
+        memory_model = EventModel(os.path.join(self.test_dir, 'processed_events.json'))
+        # Both models replace the empty data they loaded, the versions continue after the same gap
+        memory_model.get_snapshot()
+        memory_model.replace_events(events)
+        model = self.open_model()
+        self.assertIsNotNone(model.store)
+        model.replace_events(events)
+
+        self.assertEqual(model.get_data_version(), memory_model.get_data_version())
+        self.assertEqual(model.get_recent_events(20), memory_model.get_recent_events(20))
+        for criteria in ({}, {'threat_level': 'High'}, {'event_type': 'PORT_SCAN'}, {'source_ip': '10.0.1.0/24'},
+                         {'source_ip': '2001:db8::/32'}, {'destination_ip': '172.16.0.2', 'threat_level': 'Low'},
+                         {'since': '2024-09-01 01:00:00', 'until': '2024-09-01 02:30:00'}, {'until': '2024-09-01 01:00:00'}):
+            with self.subTest(criteria=criteria):
+                self.assertEqual(model.filter_events(limit=50, **criteria), memory_model.filter_events(limit=50, **criteria))
+                # The pages follow the same (epoch, version) order, the cursors are opaque to the client
+                cursor = memory_cursor = None
+                while True:
+                    page, cursor = model.get_events_page(limit=40, cursor=cursor, **criteria)
+                    memory_page, memory_cursor = memory_model.get_events_page(limit=40, cursor=memory_cursor, **criteria)
+                    self.assertEqual((page, cursor is None), (memory_page, memory_cursor is None))
+                    if cursor is None:
+                        break
+
+        for since, until in ((None, None), ('2024-09-01 02:00:00', None), (1725148800, 1725152400)):
+            self.assertEqual(model.get_event_statistics(since=since, until=until),
+                             memory_model.get_event_statistics(since=since, until=until))
+        with self.assertRaises(ValueError):
+            model.filter_events(source_ip='abc')
+
+    def test_history_accumulates_across_runs(self):
+        rng = random.Random(9)
+        first_run, second_run = random_events(rng, 30), random_events(rng, 20)
+        model = self.open_model()
+        self.assertEqual(model.append_events(first_run), 30)
+        model.store.close()
+
+        # A new model (a restart) appends after the stored history, nothing is loaded in memory
+        model = self.open_model()
+        self.assertEqual(model.get_data_version(), 30)
+        self.assertEqual(model.append_events(second_run), 20)
+        self.assertEqual(model.get_event_statistics()['total_events'], 50)
+        self.assertEqual(list(iter_processed_events(model.data_file)),
+                         [model.store.newest_events(1, after_version=version - 1, until_version=version)[0][1]
+                          for version in range(1, 51)])
+        self.assertIsNone(model._snapshot)
+
+        delta = model.get_events_since(45)
+        self.assertEqual(sorted(event['version'] for event in delta['events']), [46, 47, 48, 49, 50])
+        self.assertEqual((delta['reset'], model.get_events_since(60)['reset']), (False, True))
+
+        # Replaced events continue the versions after a gap, the cleared ones (the latest one too) are not known anymore
+        model.replace_events(first_run[:2])
+        self.assertEqual((model.get_data_version(), len(model.store)), (53, 2))
+        self.assertTrue(model.get_events_since(49)['reset'])
+        self.assertTrue(model.get_events_since(50)['reset'])
+        self.assertEqual(sorted(event['version'] for event in model.get_events_since(51)['events']), [52, 53])
+
+        # Clearing without new events is a new version too
+        model.replace_events([])
+        self.assertEqual((model.get_data_version(), model.store.base_version), (54, 54))
+        self.assertTrue(model.get_events_since(53)['reset'])
+        self.assertFalse(model.get_events_since(54)['reset'])
+
+    def test_alerts_keep_their_evidence(self):
+        events = random_events(random.Random(5), 40)
+        alert = dict(events[-1], event_type='PORT_SCAN_ALERT', priority=5, threat_level='High',
+                     correlation_rule='port_scan', correlated_events=10)
+        memory_model = EventModel(os.path.join(self.test_dir, 'processed_events.json'))
+        memory_model.replace_events(events + [alert])
+        model = self.open_model()
+        model.replace_events(events + [alert])
+
+        for current in (model, memory_model):
+            with self.subTest(store=current.store is not None):
+                # The alert is returned with the rule and the number of events it correlated
+                found = current.filter_events(event_type='PORT_SCAN_ALERT')
+                self.assertEqual([(event['correlation_rule'], event['correlated_events']) for event in found],
+                                 [('port_scan', 10)])
+                self.assertNotIn('correlation_rule', current.get_events_page(event_type='PORT_SCAN')[0][0])
+                # It summarises stored events, it is counted apart from them
+                statistics = current.get_event_statistics()
+                self.assertEqual((statistics['total_events'], statistics['alerts'], statistics['alert_types']),
+                                 (40, 1, {'PORT_SCAN_ALERT': 1}))
+                self.assertNotIn('PORT_SCAN_ALERT', statistics['event_types'])
+                timeseries = current.get_event_timeseries('1d')
+                self.assertEqual(sum(timeseries['total']), sum(event['datetime'] != 'Unknown Format' for event in events))
+                self.assertNotIn('PORT_SCAN_ALERT', timeseries['event_types'])
+        self.assertEqual(model.get_event_statistics(since='2024-09-01 00:00:00')['alerts'],
+                         memory_model.get_event_statistics(since='2024-09-01 00:00:00')['alerts'])
+
+    def test_database_before_the_alert_fields(self):
+        database = os.path.join(self.test_dir, 'old.sqlite')
+        with sqlite3.connect(database) as connection:
+            connection.execute('CREATE TABLE events (id INTEGER PRIMARY KEY AUTOINCREMENT, datetime, datetime_epoch INTEGER '
+                               'NOT NULL, source_ip, source_ip_key, destination_ip, destination_ip_key, port, event_type, '
+                               'priority, threat_level)')
+        connection.close()
+        model = self.open_model('old.sqlite')
+        alert = dict(random_events(random.Random(6), 1)[0], event_type='BRUTE_FORCE_ALERT', correlation_rule='brute_force',
+                     correlated_events=5)
+        model.append_events([alert])
+        self.assertEqual(model.get_recent_events(1)[0]['correlated_events'], 5)
+
+    def test_batched_transactions_and_wal(self):
+        store = SqliteEventStore(os.path.join(self.test_dir, 'events.db'), insert_batch_rows=7)
+        self.addCleanup(store.close)
+        events = random_events(random.Random(1), 30)
+        self.assertEqual(store.append_events(iter(events)), range(1, 31))
+        self.assertEqual(store.append_events([]), range(0))
+        self.assertEqual(len(store), 30)
+        with store._connection() as connection:
+            self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            plan = ' '.join(row[-1] for row in connection.execute(
+                'EXPLAIN QUERY PLAN SELECT id FROM events WHERE threat_level = ? ORDER BY datetime_epoch DESC, id LIMIT 5',
+                ('High',)))
+        self.assertIn('events_by_threat_level', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+        # A failed block is rolled back, the previous blocks stay
+        with self.assertRaises(Exception):
+            store.append_events(events[:7] + [{'port': object()}])
+        self.assertEqual(len(store), 37)
+        self.assertEqual(sum(group[2] for group in store.count_groups()), 37)
+
+    def test_writer_appends_to_the_database(self):
+        file_path = os.path.join(self.test_dir, 'processed_events.sqlite3')
+        events = random_events(random.Random(2), 12)
+        self.assertEqual(write_processed_events(events[:5], file_path), 5)
+        self.assertEqual(write_processed_events(events[5:], file_path), 7)
+        stored = list(iter_processed_events(file_path))
+        self.assertEqual(len(stored), 12)
+        # The values keep their type, datetime_epoch is added for the normalized datetimes
+        self.assertEqual([{key: value for key, value in event.items() if key != 'datetime_epoch'} for event in stored], events)
+        self.assertEqual([event['datetime'] != 'Unknown Format' for event in events],
+                         ['datetime_epoch' in event for event in stored])
+
+    def test_processing_job_appends_to_the_store(self):
+        from ui.routes import event_routes
+        model = self.open_model()
+        self.addCleanup(setattr, event_routes, 'event_model', event_routes.event_model)
+        event_routes.event_model = model
+        subscription = model.broadcaster.subscribe()
+
+        # Every run adds its events to the ones of the previous runs
+        event_routes.run_processing_job(ProcessingJob(self.test_file_path))
+        event_routes.run_processing_job(ProcessingJob(self.test_file_path))
+        self.assertEqual(model.get_event_statistics()['total_events'], 6)
+        self.assertEqual(model.get_data_version(), 6)
+        self.assertEqual([message.split('\n')[1] for message in subscription.next_messages(0)], ['event: events'] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
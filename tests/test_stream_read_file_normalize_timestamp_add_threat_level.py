@@ -0,0 +1,52 @@
+# Test to validate the streaming functions of the complex processor (stream_read_file_normalize_timestamp_add_threat_level, batch_events, consume_read_file_normalize_timestamp_add_threat_level).
+
+import types
+import unittest
+from helpers.test import TestEventSiemLogProcessor
+from src.complex_processor_functions.combined_processor_functions import (
+    batch_events,
+    combine_read_file_normalize_timestamp_add_threat_level,
+    consume_read_file_normalize_timestamp_add_threat_level,
+    stream_read_file_normalize_timestamp_add_threat_level
+)
+
+
+class TestStreamReadFileNormalizeTimestampAddThreatLevel(TestEventSiemLogProcessor):
+    def test_stream_matches_combine(self):
+        stream = stream_read_file_normalize_timestamp_add_threat_level(self.test_file_path)
+
+        # The stream is lazy, nothing is read until it is consumed
+        self.assertIsInstance(stream, types.GeneratorType)
+        self.assertEqual(list(stream), combine_read_file_normalize_timestamp_add_threat_level(self.test_file_path))
+
+    def test_stream_missing_file(self):
+        self.assertEqual(list(stream_read_file_normalize_timestamp_add_threat_level('missing_file.txt')), [])
+
+    def test_batch_events(self):
+        batches = list(batch_events(iter(range(5)), 2))
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+
+        with self.assertRaises(ValueError):
+            list(batch_events([], 0))
+
+    def test_consume_read_file_normalize_timestamp_add_threat_level(self):
+        batches = []
+        count = consume_read_file_normalize_timestamp_add_threat_level(self.test_file_path, batches.append, batch_size=2)
+
+        # 3 valid events delivered in batches of 2
+        self.assertEqual(count, 3)
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        for batch in batches:
+            for event in batch:
+                self.assertIn('threat_level', event)
+                self.assertRegex(event['datetime'], r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+    def test_combine_without_limit(self):
+        # The limit can be disabled, and it is still enforced by default
+        self.assertEqual(len(combine_read_file_normalize_timestamp_add_threat_level(self.test_file_path, max_events=None)), 3)
+        with self.assertRaises(ValueError):
+            combine_read_file_normalize_timestamp_add_threat_level(self.test_file_path, max_events=1)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
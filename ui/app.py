@@ -9,6 +9,8 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from ui.routes.event_routes import event_bp
+from src.instrumentation.pipeline_metrics import set_debug_logging
+from src.rule_engine.classification_rules import load_rule_set, set_active_rule_set
 
 
 def create_app():
@@ -20,6 +22,22 @@ def create_app():
     app.config['SECRET_KEY'] = 'siem-event-dashboard-secret-key'
     app.config['JSON_SORT_KEYS'] = False
     
+    # Background processing jobs (POST /api/process)
+    app.config['PROCESS_MAX_CONCURRENT_JOBS'] = int(os.environ.get('PROCESS_MAX_CONCURRENT_JOBS', 2))
+    app.config['PROCESS_MAX_QUEUED_JOBS'] = int(os.environ.get('PROCESS_MAX_QUEUED_JOBS', 10))
+    
+    # Seconds without messages between two keep-alive comments of the live feed (/api/events/stream)
+    app.config['EVENT_STREAM_HEARTBEAT_SECONDS'] = float(os.environ.get('EVENT_STREAM_HEARTBEAT_SECONDS', 15))
+    
+    # Per-event log lines of the pipeline (the metrics in /api/metrics are always collected)
+    app.config['PIPELINE_DEBUG_LOGGING'] = os.environ.get('PIPELINE_DEBUG_LOGGING', '').lower() in ('1', 'true', 'yes', 'on')
+    set_debug_logging(app.config['PIPELINE_DEBUG_LOGGING'])
+    
+    # Classification rules of the enrichment (JSON file), by default the rules of EVENT_PRIORITY_MAP
+    app.config['CLASSIFICATION_RULES_FILE'] = os.environ.get('CLASSIFICATION_RULES_FILE')
+    if app.config['CLASSIFICATION_RULES_FILE']:
+        set_active_rule_set(load_rule_set(app.config['CLASSIFICATION_RULES_FILE']))
+    
     # Register blueprints
     app.register_blueprint(event_bp)
     return app
@@ -0,0 +1,157 @@
+# Live feed of the dashboard: a shared buffer of Server-Sent Events messages read by every connected client
+
+from collections import deque
+from itertools import islice
+import json
+import threading
+from typing import Any, Deque, List, Optional, Tuple
+
+
+def format_sse_message(message_id: int, event: str, data: Any) -> str:
+    """
+    Format a message in the text/event-stream format.
+    
+    Args:
+        message_id: Id of the message, sent back by the browser as Last-Event-ID when it reconnects
+        event: Name of the event listened by the client
+        data: Payload, serialized as JSON in a single data line
+    
+    Returns:
+        Text of the message
+    """
+    return _format_serialized(message_id, event, json.dumps(data, separators=(',', ':')))
+
+
+def _format_serialized(message_id: int, event: str, payload: str) -> str:
+    return f'id: {message_id}\nevent: {event}\ndata: {payload}\n\n'
+
+
+class FeedSubscription:
+    """Position of one client in the shared buffer of an EventBroadcaster"""
+
+    def __init__(self, broadcaster: 'EventBroadcaster', position: int):
+        """
+        Initialize the subscription.
+        
+        Args:
+            broadcaster: Broadcaster of the messages
+            position: Id of the next message to send
+        """
+        self.broadcaster = broadcaster
+        self.position = position
+        self.dropped_messages = 0
+        self.closed = False
+
+    def next_messages(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        Get the messages published since the previous call.
+        
+        Blocks until there is a message or the timeout expires. When the
+        client is behind by more than max_client_backlog messages (or its
+        position already left the buffer) the pending messages are dropped
+        and a single "resync" message is returned, the client has to load
+        the events and statistics again.
+        
+        Args:
+            timeout: Maximum seconds to wait, None to wait without limit
+        
+        Returns:
+            Formatted messages, empty when the timeout expired
+        """
+        broadcaster = self.broadcaster
+        with broadcaster._condition:
+            if self.position >= broadcaster._next_id and not self.closed:
+                broadcaster._condition.wait(timeout)
+            next_id = broadcaster._next_id
+            pending = next_id - self.position
+            if pending <= 0 or self.closed:
+                return []
+            messages = broadcaster._messages
+            first_id = messages[0][0] if messages else next_id
+            if self.position < first_id or pending > broadcaster.max_client_backlog:
+                self.dropped_messages += pending
+                self.position = next_id
+                return [format_sse_message(next_id - 1, 'resync', {'reason': 'behind', 'dropped_messages': pending})]
+            start = self.position - first_id
+            self.position = next_id
+            return [text for _, text in islice(messages, start, None)]
+
+    def close(self) -> None:
+        """Stop the subscription, a blocked next_messages returns."""
+        self.broadcaster.unsubscribe(self)
+
+
+class EventBroadcaster:
+    """Shared ring buffer of live feed messages, every message is serialized once for all the clients"""
+
+    def __init__(self, buffer_size: int = 1024, max_client_backlog: int = 256):
+        """
+        Initialize an empty broadcaster.
+        
+        Args:
+            buffer_size: Number of recent messages kept, a reconnecting client
+                resumes from its Last-Event-ID while it is still in the buffer
+            max_client_backlog: Maximum number of messages a client can be
+                behind, a slower client skips them and gets a "resync" message
+        """
+        self.buffer_size = buffer_size
+        self.max_client_backlog = min(max_client_backlog, buffer_size)
+        self._messages: Deque[Tuple[int, str]] = deque(maxlen=buffer_size)
+        self._next_id = 1
+        self._condition = threading.Condition()
+        self._subscriptions: List[FeedSubscription] = []
+
+    @property
+    def last_message_id(self) -> int:
+        """Id of the last published message, 0 when there are none."""
+        return self._next_id - 1
+
+    @property
+    def client_count(self) -> int:
+        """Number of connected clients."""
+        return len(self._subscriptions)
+
+    def publish(self, event: str, data: Any) -> int:
+        """
+        Publish a message to every connected client.
+        
+        Args:
+            event: Name of the event ("events", "resync")
+            data: JSON serializable payload
+        
+        Returns:
+            Id of the message
+        """
+        # The payload is serialized before taking the lock, the readers only wait for the append
+        payload = json.dumps(data, separators=(',', ':'))
+        with self._condition:
+            message_id = self._next_id
+            self._messages.append((message_id, _format_serialized(message_id, event, payload)))
+            self._next_id += 1
+            self._condition.notify_all()
+        return message_id
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> FeedSubscription:
+        """
+        Connect a client.
+        
+        Args:
+            last_event_id: Id of the last message received by a reconnecting
+                client, None for a new client (only the next messages are sent)
+        
+        Returns:
+            Subscription of the client
+        """
+        with self._condition:
+            position = self._next_id if last_event_id is None else min(last_event_id + 1, self._next_id)
+            subscription = FeedSubscription(self, position)
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: FeedSubscription) -> None:
+        """Disconnect a client."""
+        with self._condition:
+            subscription.closed = True
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+            self._condition.notify_all()
@@ -1,27 +1,282 @@
 # Model layer for SIEM event data handling
 
-import json
+import heapq
 import os
-from typing import List, Dict, Any, Optional
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
 from datetime import datetime
-from collections import Counter
+
+# Add parent directory to path to import from src
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from src.compact_events.event_batch import UNKNOWN_EPOCH, EventBatch
+from src.compact_events.event_file_formats import (FORMATS_BY_EXTENSION, SQLITE_FORMAT, iter_processed_events,
+                                                   read_processed_events)
+from src.compact_events.event_rollups import bucket_range, build_timeseries, rollup_level_for, timeseries_from_counts
+from src.event_store.sqlite_event_store import SqliteEventStore
+from ui.models.event_broadcaster import EventBroadcaster
+from ui.models.event_snapshot import (EventSnapshot, FileSignature, TimeBound, encode_cursor, parse_bucket_width, parse_cursor,
+                                      parse_ip_range, parse_time_bound)
+from ui.models.event_statistics import EventStatistics
+
+# Maximum number of events sent in one message of the live feed, the newest ones of an append
+FEED_MAX_EVENTS = 100
 
 
 class EventModel:
     """Model for handling SIEM event data"""
     
-    def __init__(self, data_file: str = "../processed_events.json"):
+    def __init__(self, data_file: Optional[str] = None, background_reload: bool = True,
+                 store: Optional[SqliteEventStore] = None):
         """
         Initialize the event model.
         
+        The events are kept in memory as a snapshot that is reused while the
+        modification time and size of the data file do not change. With a
+        storage backend the queries are answered by the store instead and
+        nothing is loaded in memory.
+        
+        Args:
+            data_file: Path to the file containing processed events, the format is
+                chosen by its extension (.json, .jsonl/.ndjson, .siemcol or a
+                .sqlite/.sqlite3/.db database). Defaults to the PROCESSED_EVENTS_FILE
+                environment variable or ../processed_events.jsonl
+            background_reload: Reload a changed file in a background thread and
+                keep serving the previous snapshot until the new one is ready
+            store: Storage backend of the events, an object with the methods of
+                SqliteEventStore. By default a SqliteEventStore of data_file when
+                it is a database, None (in-memory snapshot) otherwise
+        
+        The changes are published in the broadcaster of the live feed: an
+        "events" message with the appended events and the new statistics, or
+        a "resync" message when the snapshot is replaced.
+        """
+        self.data_file = data_file or os.environ.get('PROCESSED_EVENTS_FILE', '../processed_events.jsonl')
+        self.background_reload = background_reload
+        self._snapshot: Optional[EventSnapshot] = None
+        self._invalidated = False
+        self._lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+        self.broadcaster = EventBroadcaster()
+        if store is None and FORMATS_BY_EXTENSION.get(os.path.splitext(self.data_file)[1].lower()) == SQLITE_FORMAT:
+            store = SqliteEventStore(self.data_file)
+        self.store = store
+        # Version of the store the clients of the live feed know, a newer one was written by another process
+        self._store_version = 0 if store is None else store.version
+    
+    def _file_signature(self) -> FileSignature:
+        """Return the (mtime, size) signature of the data file, None if it does not exist."""
+        try:
+            stat = os.stat(self.data_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def get_snapshot(self) -> EventSnapshot:
+        """
+        Get the current snapshot of the events.
+        
+        The file is only read again when its signature changed or the model
+        was invalidated. With background_reload the previous snapshot is
+        returned while the new one is loaded.
+        
+        Returns:
+            The current EventSnapshot
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and not self._invalidated and snapshot.signature == self._file_signature():
+            return snapshot
+        
+        if snapshot is None or not self.background_reload:
+            return self._reload()
+        
+        with self._lock:
+            if self._reload_thread is None or not self._reload_thread.is_alive():
+                self._reload_thread = threading.Thread(target=self._reload, daemon=True)
+                self._reload_thread.start()
+        return snapshot
+    
+    def _reload(self) -> EventSnapshot:
+        """Read the data file and swap the current snapshot."""
+        # The signature is taken before reading, a write during the load triggers another reload
+        self._invalidated = False
+        signature = self._file_signature()
+        snapshot = EventSnapshot(self.load_event_batch(), signature)
+        previous = self._snapshot
+        if previous is not None:
+            # The data versions continue after a gap, the versions of the replaced snapshot are not known anymore
+            snapshot.base_version = previous.version + 1
+        self._snapshot = snapshot
+        if previous is not None:
+            self._publish_resync('reload')
+        return snapshot
+    
+    def _publish_resync(self, reason: str) -> None:
+        """Tell the clients of the live feed to load the events again."""
+        if self.store is not None:
+            version, statistics = self.store.version, self._store_statistics()
+        else:
+            version, statistics = self._snapshot.version, self._snapshot.statistics
+        self.broadcaster.publish('resync', {'reason': reason, 'version': version, 'statistics': statistics.as_dict()})
+    
+    def refresh(self) -> None:
+        """
+        Pick up the events written by another process.
+        
+        A changed data file is reloaded as by get_snapshot. A store that got
+        events from another writer is published as a resync.
+        """
+        if self.store is None:
+            self.get_snapshot()
+            return
+        version = self.store.version
+        if version != self._store_version:
+            self._store_version = version
+            self._publish_resync('reload')
+    
+    def _store_statistics(self, since: Optional[int] = None, until: Optional[int] = None) -> EventStatistics:
+        """Build the statistics from the counts aggregated by the store."""
+        statistics = EventStatistics()
+        statistics.add_groups(self.store.count_groups(since, until))
+        return statistics
+    
+    @staticmethod
+    def _store_filters(
+        threat_level: Optional[str],
+        source_ip: Optional[str],
+        event_type: Optional[str],
+        destination_ip: Optional[str],
+        since: TimeBound,
+        until: TimeBound
+    ) -> Dict[str, Any]:
+        """
+        Parse the filters into the arguments of the store queries.
+        
+        Raises:
+            ValueError: If an IP filter or a time bound is not valid
+        """
+        return {
+            'threat_level': threat_level,
+            'event_type': event_type,
+            'source_range': parse_ip_range(source_ip) if source_ip else None,
+            'destination_range': parse_ip_range(destination_ip) if destination_ip else None,
+            'since': parse_time_bound(since),
+            'until': parse_time_bound(until)
+        }
+    
+    @staticmethod
+    def _versioned_events(rows: Iterable[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Export (version, event) rows of the store as event dictionaries with their data version in 'version'."""
+        return [dict(event, version=version) for version, event in rows]
+    
+    def get_data_version(self) -> int:
+        """
+        Get the current data version.
+        
+        Every stored event gets the next version when it is loaded or
+        appended, and a replaced snapshot continues after a gap in the
+        versions of the previous one, so the version grows whenever the
+        data changes, even when it is replaced with no events.
+        
+        Returns:
+            Version of the newest stored event
+        """
+        if self.store is not None:
+            return self.store.version
+        return self.get_snapshot().version
+    
+    def replace_events(self, events: Iterable[Mapping[str, Any]]) -> None:
+        """
+        Replace the snapshot with freshly processed events.
+        
+        The events are expected to be already written to the data file, its
+        current signature is recorded so the file is not read again. A store
+        is cleared and gets the events instead.
+        
         Args:
-            data_file: Path to the JSON file containing processed events
+            events: Processed event dictionaries or an EventBatch
+        """
+        if self.store is not None:
+            with self._lock:
+                self.store.clear()
+                self.store.append_events(events)
+                self._store_version = self.store.version
+                self._publish_resync('replace')
+            return
+        signature = self._file_signature()
+        batch = events if isinstance(events, EventBatch) else EventBatch(events)
+        previous = self._snapshot
+        snapshot = EventSnapshot(batch, signature, base_version=0 if previous is None else previous.version + 1)
+        self._snapshot = snapshot
+        self._invalidated = False
+        self._publish_resync('replace')
+    
+    def append_events(self, events: Iterable[Mapping[str, Any]]) -> int:
         """
-        self.data_file = data_file
+        Append processed events to the current snapshot.
+        
+        Indexes and statistics are updated with the delta of the new events.
+        The caller is responsible for persisting them in the data file, a
+        store inserts them in its own transactions. The newest FEED_MAX_EVENTS
+        of them and the new statistics are published in the live feed.
+        
+        Args:
+            events: Processed event dictionaries
+            
+        Returns:
+            Number of appended events
+        """
+        if self.store is not None:
+            return self._append_to_store(events)
+        snapshot = self.get_snapshot()
+        with self._lock:
+            count = snapshot.append(events)
+            if not count:
+                return 0
+            total = len(snapshot.events)
+            epochs = snapshot.events.epochs
+            newest = heapq.nsmallest(FEED_MAX_EVENTS, range(total - count, total), key=lambda row: (-epochs[row], row))
+            self.broadcaster.publish('events', {
+                'count': count,
+                'from_version': snapshot.version - count,
+                'version': snapshot.version,
+                'events': snapshot.versioned_dicts(newest),
+                'statistics': snapshot.statistics.as_dict()
+            })
+        return count
+    
+    def _append_to_store(self, events: Iterable[Mapping[str, Any]]) -> int:
+        """Insert events in the store and publish them, the statistics come from its counters table."""
+        with self._lock:
+            versions = self.store.append_events(events)
+            if not versions:
+                return 0
+            from_version, version = versions.start - 1, versions.stop - 1
+            self._store_version = version
+            newest = self.store.newest_events(FEED_MAX_EVENTS, after_version=from_version, until_version=version)
+            self.broadcaster.publish('events', {
+                'count': len(versions),
+                'from_version': from_version,
+                'version': version,
+                'events': self._versioned_events(newest),
+                'statistics': self._store_statistics().as_dict()
+            })
+        return len(versions)
+    
+    def invalidate(self) -> None:
+        """Mark the current snapshot as stale, e.g. after a new result was written."""
+        self._invalidated = True
+    
+    def wait_for_reload(self, timeout: Optional[float] = None) -> None:
+        """Block until the background reload in progress (if any) finishes."""
+        reload_thread = self._reload_thread
+        if reload_thread is not None:
+            reload_thread.join(timeout)
     
     def load_processed_events(self) -> List[Dict[str, Any]]:
         """
-        Load processed events from JSON file.
+        Load processed events from the data file.
         
         Returns:
             List of event dictionaries
@@ -30,88 +285,244 @@ class EventModel:
             return []
         
         try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                events = json.load(f)
-                return events if isinstance(events, list) else []
-        except (json.JSONDecodeError, IOError):
+            return list(iter_processed_events(self.data_file))
+        except (ValueError, IOError):
             return []
     
-    def get_event_statistics(self) -> Dict[str, Any]:
+    def load_event_batch(self) -> EventBatch:
         """
-        Calculate statistics from processed events.
+        Load processed events in the compact columnar form.
+        
+        The events are only exported as dictionaries for the rows returned
+        by the queries. A .siemcol file is loaded column by column from a
+        memory map, without building the dictionaries.
         
         Returns:
-            Dictionary containing event statistics
+            EventBatch with the stored events
         """
-        events = self.load_processed_events()
+        if not os.path.exists(self.data_file):
+            return EventBatch()
         
-        if not events:
-            return {
-                'total_events': 0,
-                'high_threat': 0,
-                'medium_threat': 0,
-                'low_threat': 0,
-                'unknown_threat': 0,
-                'last_updated': None,
-                'event_types': {}
-            }
+        try:
+            return read_processed_events(self.data_file)
+        except (ValueError, IOError):
+            return EventBatch()
+    
+    def get_event_statistics(self, since: TimeBound = None, until: TimeBound = None) -> Dict[str, Any]:
+        """
+        Get the statistics of the processed events.
         
-        # Count threat levels
-        threat_counts = Counter(event.get('threat_level', 'Unknown') for event in events)
+        The aggregates are maintained by the snapshot when it is loaded and
+        when events are appended, so this is a constant time lookup. With a
+        time window they are counted on the rows of the window, found by
+        bisection on the time index. A store reads its counters table, or
+        groups the rows of the window found on its time index.
         
-        # Count event types
-        event_types = Counter(event.get('event_type', 'Unknown') for event in events)
+        Args:
+            since: Only count events at or after this time (an epoch, a
+                duration before now such as 15m, 2h or 7d, or a datetime)
+            until: Only count events at or before this time, same forms
+            
+        Returns:
+            Dictionary containing event statistics
+            
+        Raises:
+            ValueError: If a time bound is not valid
+        """
+        if self.store is not None:
+            return self._store_statistics(parse_time_bound(since), parse_time_bound(until)).as_dict()
+        return self.get_snapshot().statistics_between(since, until).as_dict()
+    
+    def get_event_timeseries(self, bucket: str = '1h', since: TimeBound = None, until: TimeBound = None) -> Dict[str, Any]:
+        """
+        Get the number of events per time bucket, by threat level and by event type.
         
-        # Get most recent datetime
-        datetimes = [event.get('datetime') for event in events if event.get('datetime')]
-        last_updated = max(datetimes) if datetimes else None
+        The counts come from the rollups maintained as the events are added
+        (minute, hour and day buckets aligned on the Unix epoch), the events
+        are not scanned: the cost is the number of buckets returned. A width
+        that is a multiple of a level (15m, 6h, 1w) adds up its buckets. The
+        older minute and hour buckets are dropped as the time advances (2 and
+        90 days are kept), their events are still counted by the coarser
+        buckets, so the buckets are clipped to the history of their level.
         
-        return {
-            'total_events': len(events),
-            'high_threat': threat_counts.get('High', 0),
-            'medium_threat': threat_counts.get('Medium', 0),
-            'low_threat': threat_counts.get('Low', 0),
-            'unknown_threat': threat_counts.get('Unknown', 0),
-            'last_updated': last_updated,
-            'event_types': dict(event_types.most_common(5))
-        }
+        Args:
+            bucket: Width of the buckets, a duration such as 1m, 15m, 1h or 1d
+            since: Only buckets that end at or after this time (an epoch, a
+                duration before now such as 15m, 2h or 7d, or a datetime)
+            until: Only buckets that start at or before this time, same forms
+            
+        Returns:
+            Dictionary with the width of the buckets in seconds ('bucket_seconds'),
+            the start epoch of every bucket ('epochs'), its number of events
+            ('total') and the counts of every threat level and event type with
+            events ('threat_levels', 'event_types': value -> count per bucket)
+            
+        Raises:
+            ValueError: If the bucket width or a time bound is not valid
+        """
+        width = parse_bucket_width(bucket)
+        level = rollup_level_for(width)
+        since, until = parse_time_bound(since), parse_time_bound(until)
+        if self.store is None:
+            return self.get_snapshot().rollups.timeseries(width, since, until)
+        bounds = self.store.rollup_bounds(level[0])
+        if bounds is None:
+            return build_timeseries(width, range(0), {})
+        buckets = bucket_range(width, level, bounds[0], bounds[1], since, until)
+        factor = width // level[0]
+        rows = self.store.rollup_rows(level[0], buckets.start * factor, buckets.stop * factor - 1)
+        return timeseries_from_counts(width, level, buckets, rows)
     
     def filter_events(
         self,
         threat_level: Optional[str] = None,
         source_ip: Optional[str] = None,
         event_type: Optional[str] = None,
-        limit: int = 100
+        limit: int = 100,
+        destination_ip: Optional[str] = None,
+        since: TimeBound = None,
+        until: TimeBound = None
     ) -> List[Dict[str, Any]]:
         """
         Filter events based on criteria.
         
+        The IP filters are answered by bisection on the integer address
+        indexes of the snapshot and the time window by bisection on its
+        time index.
+        
         Args:
             threat_level: Filter by threat level (High, Medium, Low)
-            source_ip: Filter by source IP address (partial match)
+            source_ip: Filter by source IP address: an address, a CIDR block
+                (10.0.0.0/8), a range (10.0.0.1-10.0.0.99) or leading octets (10.0.)
             event_type: Filter by event type
             limit: Maximum number of events to return
+            destination_ip: Filter by destination IP address, same forms as source_ip
+            since: Only events at or after this time: an epoch, a duration before
+                now (30s, 15m, 2h, 7d, 1w) or a datetime (UTC without timezone)
+            until: Only events at or before this time, same forms as since
             
         Returns:
             Filtered list of events
+            
+        Raises:
+            ValueError: If an IP filter or a time bound is not valid
         """
-        events = self.load_processed_events()
-        filtered = events
-        
-        # Apply filters
-        if threat_level:
-            filtered = [e for e in filtered if e.get('threat_level') == threat_level]
+        if self.store is not None:
+            filters = self._store_filters(threat_level, source_ip, event_type, destination_ip, since, until)
+            return [event for _, event in self.store.newest_events(limit, **filters)]
+        snapshot = self.get_snapshot()
+        newest = snapshot.newest_rows(limit, threat_level=threat_level, source_ip=source_ip, event_type=event_type,
+                                      destination_ip=destination_ip, since=since, until=until)
+        return snapshot.events.to_dicts(newest)
+    
+    def get_events_page(
+        self,
+        threat_level: Optional[str] = None,
+        source_ip: Optional[str] = None,
+        event_type: Optional[str] = None,
+        limit: int = 100,
+        destination_ip: Optional[str] = None,
+        since: TimeBound = None,
+        until: TimeBound = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get a page of the filtered events, from the newest to the oldest.
         
-        if source_ip:
-            filtered = [e for e in filtered if source_ip in e.get('source_ip', '')]
+        The events are ordered by (epoch, row), the row being the stable id
+        of an event in the snapshot (appended events keep the ids of the
+        previous ones). The cursor resumes the order after the last event of
+        the previous page by bisection on the time index, so every page costs
+        the same as the first one and the earlier rows are not sent again.
+        A store orders by (epoch, id) and resumes with the same cursor on its
+        time index.
         
-        if event_type:
-            filtered = [e for e in filtered if e.get('event_type') == event_type]
+        Args:
+            threat_level, source_ip, event_type, destination_ip, since, until:
+                Filters, same forms as filter_events (keep them between pages)
+            limit: Maximum number of events of the page
+            cursor: next_cursor of the previous page, None for the first page
+            
+        Returns:
+            (events of the page with their data version in 'version', opaque
+            cursor of the next page or None when there are no more events)
+            
+        Raises:
+            ValueError: If a filter or the cursor is not valid
+        """
+        if limit <= 0:
+            return [], None
+        if self.store is not None:
+            filters = self._store_filters(threat_level, source_ip, event_type, destination_ip, since, until)
+            rows = self.store.newest_events(limit + 1, after=parse_cursor(cursor) if cursor else None, **filters)
+            next_cursor = None
+            if len(rows) > limit:
+                version, event = rows[limit - 1]
+                next_cursor = encode_cursor((event.get('datetime_epoch', UNKNOWN_EPOCH), version))
+            return self._versioned_events(rows[:limit]), next_cursor
+        snapshot = self.get_snapshot()
+        # One more row tells whether there is a next page
+        newest = snapshot.newest_rows(limit + 1, threat_level=threat_level, source_ip=source_ip, event_type=event_type,
+                                      destination_ip=destination_ip, since=since, until=until, after=cursor)
+        next_cursor = snapshot.cursor_of(newest[limit - 1]) if len(newest) > limit else None
+        return snapshot.versioned_dicts(newest[:limit]), next_cursor
+    
+    def get_events_since(
+        self,
+        version: int,
+        threat_level: Optional[str] = None,
+        source_ip: Optional[str] = None,
+        event_type: Optional[str] = None,
+        limit: int = 500,
+        destination_ip: Optional[str] = None,
+        since: TimeBound = None,
+        until: TimeBound = None
+    ) -> Dict[str, Any]:
+        """
+        Get the filtered events stored after a data version (delta sync).
         
-        # Sort by datetime (most recent first) and limit
-        filtered.sort(key=lambda x: x.get('datetime', ''), reverse=True)
+        Only the events added after the version are checked, so an unchanged
+        dataset costs nothing and a small delta costs little (a store reads
+        them by id range).
         
-        return filtered[:limit]
+        Args:
+            version: Data version the client already has
+            threat_level, source_ip, event_type, destination_ip, since, until:
+                Filters, same forms as filter_events
+            limit: Maximum number of events
+            
+        Returns:
+            Dictionary with the current 'version', the newer 'events' (newest
+            first, with their version), 'truncated' when more events match than
+            limit and 'reset' when the version is not known anymore (the events
+            were replaced) and the client has to load them again
+            
+        Raises:
+            ValueError: If a filter is not valid
+        """
+        if self.store is not None:
+            filters = self._store_filters(threat_level, source_ip, event_type, destination_ip, since, until)
+            current_version = self.store.version
+            if not self.store.base_version <= version <= current_version:
+                return {'version': current_version, 'reset': True, 'truncated': False, 'events': []}
+            rows = self.store.newest_events(limit + 1, after_version=version, until_version=current_version, **filters)
+            return {
+                'version': current_version,
+                'reset': False,
+                'truncated': len(rows) > limit,
+                'events': self._versioned_events(rows[:limit])
+            }
+        snapshot = self.get_snapshot()
+        current_version = snapshot.version
+        rows, truncated = snapshot.newest_rows_since_version(
+            version, limit, threat_level=threat_level, source_ip=source_ip, event_type=event_type,
+            destination_ip=destination_ip, since=since, until=until)
+        return {
+            'version': current_version,
+            'reset': rows is None,
+            'truncated': truncated,
+            'events': [] if rows is None else snapshot.versioned_dicts(rows)
+        }
     
     def get_recent_events(self, limit: int = 10) -> List[Dict[str, Any]]:
         """
@@ -123,6 +534,7 @@ class EventModel:
         Returns:
             List of recent events
         """
-        events = self.load_processed_events()
-        events.sort(key=lambda x: x.get('datetime', ''), reverse=True)
-        return events[:limit]
+        if self.store is not None:
+            return [event for _, event in self.store.newest_events(limit)]
+        snapshot = self.get_snapshot()
+        return snapshot.events.to_dicts(snapshot.newest_rows(limit))
@@ -0,0 +1,633 @@
+# View of the processed events loaded by the model, with the indexes and statistics used by the queries
+
+from array import array
+import base64
+from bisect import bisect_left, bisect_right, insort
+import heapq
+import ipaddress
+from itertools import islice
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from src.basic_functions.normalize_event_datetime import datetime_text_to_epoch
+from src.compact_events.event_batch import UNKNOWN_EPOCH, CategoricalColumn, EventBatch, ip_to_key
+from src.compact_events.event_rollups import EventRollups
+from ui.models.event_statistics import EventStatistics
+
+
+# (modification time in nanoseconds, size in bytes) of the data file, None when the file does not exist
+FileSignature = Optional[Tuple[int, int]]
+
+# (IP version, first address, last address) of an IP filter, as integers
+IpRange = Tuple[int, int, int]
+
+# Bound of a time filter: seconds since the Unix epoch or a text accepted by parse_time_bound
+TimeBound = Union[int, str, None]
+
+# Position of an event in the time order: (epoch, row), the row is the stable id of the event in the snapshot
+Cursor = Tuple[int, int]
+
+# Up to this number of appended rows the sorted indexes are updated by insertion, above it they are sorted again
+_MAX_SORTED_INSERTIONS = 64
+
+# The IP indexes keep (address << _ROW_BITS | row) values, sorted by address and then by row
+_ROW_BITS = 32
+_ROW_MASK = (1 << _ROW_BITS) - 1
+
+# Relative time bounds ("15m" is 15 minutes before now)
+_DURATION_PATTERN = re.compile(r'(\d+)\s*([smhdw])')
+_DURATION_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_ip_range(text: str) -> IpRange:
+    """
+    Parse an IP filter into the range of addresses it matches.
+    
+    Accepted forms: an address ("10.0.0.1"), a CIDR block ("10.0.0.0/8"),
+    a range ("10.0.0.1-10.0.0.99") or the leading octets of an IPv4
+    address ("10.1" or "10.1." is 10.1.0.0/16, so it does not match 110.1.x.x).
+    
+    Args:
+        text: IP filter
+        
+    Returns:
+        (IP version, first address, last address)
+        
+    Raises:
+        ValueError: If the text is not an IP filter
+    """
+    text = text.strip()
+    try:
+        if '-' in text:
+            first, _, last = text.partition('-')
+            first, last = ipaddress.ip_address(first.strip()), ipaddress.ip_address(last.strip())
+            if first.version != last.version or first > last:
+                raise ValueError(f"'{first}' is not before '{last}'")
+            return first.version, int(first), int(last)
+        if '/' not in text and ':' not in text:
+            octets = text[:-1].split('.') if text.endswith('.') else text.split('.')
+            if len(octets) < 4:
+                text = '.'.join(octets + ['0'] * (4 - len(octets))) + f'/{8 * len(octets)}'
+        network = ipaddress.ip_network(text, strict=False)
+    except ValueError as e:
+        raise ValueError(f"Invalid IP filter '{text}': {e}") from e
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+def parse_time_bound(value: TimeBound, now: Optional[int] = None) -> Optional[int]:
+    """
+    Parse the bound of a time filter into seconds since the Unix epoch.
+    
+    Accepted forms: an integer epoch ("1725184800"), a duration before now
+    ("30s", "15m", "2h", "7d", "1w") or a datetime in any shape accepted by
+    normalize_event_datetime ("2024-09-01 10:00:00", "2024-09-01T10:00:00Z";
+    without timezone it is UTC).
+    
+    Args:
+        value: Time bound, None or an empty text for no bound
+        now: Epoch the durations are relative to (default: the current time)
+        
+    Returns:
+        Seconds since the Unix epoch, None when there is no bound
+        
+    Raises:
+        ValueError: If the value is not a time bound
+    """
+    if value is None or isinstance(value, int) and not isinstance(value, bool):
+        return value
+    text = str(value).strip()
+    if not text:
+        return None
+    if text.lstrip('-').isdigit():
+        return int(text)
+    duration = _DURATION_PATTERN.fullmatch(text)
+    if duration:
+        seconds = int(duration.group(1)) * _DURATION_SECONDS[duration.group(2)]
+        return (int(time.time()) if now is None else now) - seconds
+    epoch = datetime_text_to_epoch(text)
+    if epoch is None:
+        raise ValueError(f"Invalid time bound '{text}': expected an epoch, a duration (15m, 2h, 7d) or a datetime")
+    return epoch
+
+
+def parse_bucket_width(value: str) -> int:
+    """
+    Parse the width of the time buckets of a time series.
+    
+    Accepted forms: a duration ("1m", "15m", "1h", "6h", "1d", "1w"), whole
+    minutes as the finest rollups count minutes.
+    
+    Args:
+        value: Bucket width
+    
+    Returns:
+        Width in seconds
+    
+    Raises:
+        ValueError: If the value is not a duration
+    """
+    duration = _DURATION_PATTERN.fullmatch(value.strip())
+    if not duration or int(duration.group(1)) <= 0:
+        raise ValueError(f"Invalid bucket '{value}': expected a duration (1m, 15m, 1h, 1d)")
+    return int(duration.group(1)) * _DURATION_SECONDS[duration.group(2)]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """Encode the position of an event as an opaque URL-safe text."""
+    return base64.urlsafe_b64encode(f'{cursor[0]}:{cursor[1]}'.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def parse_cursor(text: str) -> Cursor:
+    """
+    Decode a text of encode_cursor.
+    
+    Args:
+        text: Opaque cursor
+        
+    Returns:
+        (epoch, row) of the event the cursor points to
+        
+    Raises:
+        ValueError: If the text is not a cursor
+    """
+    try:
+        epoch, row = base64.urlsafe_b64decode(text + '=' * (-len(text) % 4)).decode('ascii').split(':')
+        cursor = int(epoch), int(row)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor '{text}'") from e
+    if cursor[1] < 0:
+        raise ValueError(f"Invalid cursor '{text}'")
+    return cursor
+
+
+def _epoch_range(since: Optional[int], until: Optional[int]) -> Tuple[int, int]:
+    """First and last epoch of a time window, UNKNOWN_EPOCH (no valid datetime) is never included."""
+    first = UNKNOWN_EPOCH + 1 if since is None else max(since, UNKNOWN_EPOCH + 1)
+    last = -UNKNOWN_EPOCH if until is None else until
+    return first, last
+
+
+class _PackedRows(Sequence):
+    """Rows of a slice of an IP index, the rows are only unpacked when they are read"""
+    
+    def __init__(self, packed: Sequence[int], start: int, end: int):
+        self._packed = packed
+        self._start = start
+        self._end = end
+    
+    def __len__(self) -> int:
+        return self._end - self._start
+    
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('row index out of range')
+        return self._packed[self._start + index] & _ROW_MASK
+    
+    def __iter__(self) -> Iterator[int]:
+        return (value & _ROW_MASK for value in self._packed[self._start:self._end])
+
+
+class _RowSlice(Sequence):
+    """Rows of a slice of the time index, read in place so that a page or a window does not copy the index"""
+    
+    def __init__(self, rows: array, start: int, end: int):
+        self._rows = rows
+        self._start = start
+        self._end = max(start, end)
+    
+    def __len__(self) -> int:
+        return self._end - self._start
+    
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('row index out of range')
+        return self._rows[self._start + index]
+    
+    def __iter__(self) -> Iterator[int]:
+        return map(self._rows.__getitem__, range(self._start, self._end))
+
+
+class _IpIndex:
+    """Rows sorted by the integer address of an IP field: IPv4 in an array('Q'), IPv6 in a sorted list"""
+    
+    def __init__(self, events: EventBatch, field: str):
+        self.events = events
+        self.field = field
+        self.packed: Dict[int, Any] = {4: array('Q'), 6: []}
+        self.add_rows(0)
+    
+    def add_rows(self, start: int) -> None:
+        """Add the rows from start, they are greater than the rows already indexed."""
+        column = self.events.source_ips if self.field == 'source_ip' else self.events.destination_ips
+        overflow = self.events.overflow(self.field)
+        if overflow:
+            new_values: Dict[int, List[int]] = {4: [], 6: []}
+            for row in range(start, len(column)):
+                key = ip_to_key(overflow[row]) if row in overflow else (4, column[row])
+                if key is not None:
+                    new_values[key[0]].append(key[1] << _ROW_BITS | row)
+        else:
+            new_values = {4: [address << _ROW_BITS | row for row, address in enumerate(column[start:], start)], 6: []}
+        
+        for version, values in new_values.items():
+            packed = self.packed[version]
+            if len(values) > _MAX_SORTED_INSERTIONS or not packed:
+                values = sorted([*packed, *values]) if packed else sorted(values)
+                self.packed[version] = array('Q', values) if version == 4 else values
+            else:
+                for value in values:
+                    insort(packed, value)
+    
+    def rows_in_range(self, ip_range: IpRange) -> Sequence[int]:
+        """Rows whose address is in the range, found by bisection."""
+        version, first, last = ip_range
+        packed = self.packed[version]
+        start = bisect_left(packed, first << _ROW_BITS)
+        end = bisect_right(packed, last << _ROW_BITS | _ROW_MASK, lo=start)
+        return _PackedRows(packed, start, end)
+
+
+def _add_to_posting_lists(posting_lists: Dict[int, array], column: CategoricalColumn, start: int = 0) -> None:
+    """Add the rows of a categorical column from start to the lists of rows of their codes."""
+    codes = column.codes
+    for row in range(start, len(codes)):
+        code = codes[row]
+        posting = posting_lists.get(code)
+        if posting is None:
+            posting = posting_lists[code] = array('I')
+        posting.append(row)
+
+
+def _insert_sorted(rows: array, new_rows: Sequence[int], key: Callable[[int], Any]) -> array:
+    """Insert new rows (greater than the existing ones) in an array of rows sorted by key."""
+    if len(new_rows) > _MAX_SORTED_INSERTIONS:
+        return array(rows.typecode, sorted([*rows, *new_rows], key=key))
+    for row in new_rows:
+        rows.insert(bisect_right(rows, key(row), key=key), row)
+    return rows
+
+
+class EventSnapshot:
+    """Events loaded from the data file together with the file signature they were loaded from"""
+
+    def __init__(self, events: EventBatch, signature: FileSignature = None, base_version: int = 0):
+        """
+        Initialize the snapshot and build its indexes.
+        
+        Every event has a data version, base_version + row + 1, so the
+        versions grow with the appended events and the version of the
+        snapshot is the one of its newest stored event.
+        
+        Indexes:
+            - hash indexes (code -> rows) on threat_level and event_type
+            - rows sorted by the integer address of source_ip and of
+              destination_ip, for address, CIDR and range searches by
+              bisection (built on the first query of each field)
+            - rows sorted from the newest to the oldest epoch (ties keep the
+              file order), for the recent and filtered queries and for the
+              time windows, found by bisection
+        
+        The statistics and the time bucket rollups (EventRollups) are
+        maintained with the indexes.
+        
+        Args:
+            events: Columnar batch with the loaded events
+            signature: Signature of the data file when it was read
+            base_version: Version of the data before the events of this
+                snapshot. A snapshot that replaces another one starts after a
+                gap (its version + 1), so the versions of the replaced events
+                are older than base_version and the snapshot gets a new
+                version even without events
+        """
+        self.events = events
+        self.signature = signature
+        self.base_version = base_version
+        self.statistics = EventStatistics()
+        self.statistics.add_batch_rows(events)
+        self.rollups = EventRollups()
+        self.rollups.add_batch_rows(events)
+        self._threat_level_rows: Dict[int, array] = {}
+        self._event_type_rows: Dict[int, array] = {}
+        _add_to_posting_lists(self._threat_level_rows, events.threat_levels)
+        _add_to_posting_lists(self._event_type_rows, events.event_types)
+        self._ip_indexes: Dict[str, _IpIndex] = {}
+        self._rows_by_time = array('I', sorted(range(len(events)), key=events.epochs.__getitem__, reverse=True))
+
+    def _time_key(self, row: int) -> int:
+        return -self.events.epochs[row]
+
+    @property
+    def version(self) -> int:
+        """Data version: the version of the last stored event, base_version when there are none."""
+        return self.base_version + len(self.events)
+
+    def versioned_dicts(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        """Export rows as event dictionaries with their data version in 'version'."""
+        rows = list(rows)
+        events = self.events.to_dicts(rows)
+        for event, row in zip(events, rows):
+            event['version'] = self.base_version + row + 1
+        return events
+
+    def rows_since_version(self, version: int) -> Optional[range]:
+        """
+        Rows stored after a data version, in the order they were stored.
+        
+        Returns:
+            The rows, None when the version is not one of this snapshot
+            (one of the replaced events, before base_version, or newer than
+            the data)
+        """
+        if not self.base_version <= version <= self.version:
+            return None
+        return range(version - self.base_version, len(self.events))
+
+    def append(self, events: Iterable[Mapping[str, Any]]) -> int:
+        """
+        Append new events and update the indexes, statistics and rollups with their delta.
+        
+        Args:
+            events: Processed event dictionaries
+            
+        Returns:
+            Number of appended events
+        """
+        start = len(self.events)
+        self.events.extend(events)
+        new_rows = range(start, len(self.events))
+        if not new_rows:
+            return 0
+        
+        _add_to_posting_lists(self._threat_level_rows, self.events.threat_levels, start)
+        _add_to_posting_lists(self._event_type_rows, self.events.event_types, start)
+        for ip_index in list(self._ip_indexes.values()):
+            ip_index.add_rows(start)
+        self._rows_by_time = _insert_sorted(self._rows_by_time, new_rows, self._time_key)
+        self.statistics.add_batch_rows(self.events, start)
+        self.rollups.add_batch_rows(self.events, start)
+        return len(new_rows)
+
+    def rows_with_threat_level(self, threat_level: str) -> Sequence[int]:
+        """Rows with the given threat level, in ascending order."""
+        code = self.events.threat_levels.code_of(threat_level)
+        return self._threat_level_rows.get(code, ())
+
+    def rows_with_event_type(self, event_type: str) -> Sequence[int]:
+        """Rows with the given event type, in ascending order."""
+        code = self.events.event_types.code_of(event_type)
+        return self._event_type_rows.get(code, ())
+
+    def rows_in_ip_range(self, field: str, ip_range: IpRange) -> Sequence[int]:
+        """Rows whose source_ip or destination_ip is in the range, found by bisection on the sorted index."""
+        ip_index = self._ip_indexes.get(field)
+        if ip_index is None:
+            ip_index = self._ip_indexes[field] = _IpIndex(self.events, field)
+        return ip_index.rows_in_range(ip_range)
+
+    def rows_between(self, since: Optional[int] = None, until: Optional[int] = None) -> Sequence[int]:
+        """
+        Rows whose epoch is in [since, until], from the newest to the oldest event.
+        
+        The bounds of the window are found by bisection on the time index, so
+        the cost depends on the size of the window and not on the number of
+        events. Events without a valid datetime are never in a window.
+        """
+        start, end = self._window_bounds(*_epoch_range(since, until))
+        return _RowSlice(self._rows_by_time, start, end)
+
+    def _window_bounds(self, first: int, last: int) -> Tuple[int, int]:
+        """Positions in the time index of the first and after the last row with an epoch in [first, last]."""
+        rows = self._rows_by_time
+        start = bisect_left(rows, -last, key=self._time_key)
+        return start, bisect_right(rows, -first, lo=start, key=self._time_key)
+
+    def _position_after(self, cursor: Cursor) -> int:
+        """Position in the time index of the first row after the cursor, by bisection on (-epoch, row)."""
+        epochs = self.events.epochs
+        return bisect_right(self._rows_by_time, (-cursor[0], cursor[1]), key=lambda row: (-epochs[row], row))
+
+    def cursor_of(self, row: int) -> str:
+        """Opaque cursor of a row, a query with after=cursor resumes after it."""
+        return encode_cursor((self.events.epochs[row], row))
+
+    def statistics_between(self, since: TimeBound = None, until: TimeBound = None) -> EventStatistics:
+        """
+        Statistics of the events in a time window.
+        
+        Without bounds these are the statistics maintained by the snapshot.
+        Otherwise they are counted on the rows of the window or, when the
+        window has most of the events, the rows outside of it are removed
+        from the maintained statistics, so the cost is bounded by the
+        smaller of both sets.
+        
+        Raises:
+            ValueError: If a bound is not a time bound
+        """
+        since, until = parse_time_bound(since), parse_time_bound(until)
+        if since is None and until is None:
+            return self.statistics
+        start, end = self._window_bounds(*_epoch_range(since, until))
+        rows = self._rows_by_time
+        if 2 * (end - start) <= len(rows):
+            statistics = EventStatistics()
+            statistics.add_rows(self.events, rows[start:end])
+        else:
+            statistics = self.statistics.copy()
+            statistics.remove_rows(self.events, rows[:start] + rows[end:], self.events.epochs[rows[start]])
+        return statistics
+
+    def _ip_check(self, field: str, ip_range: IpRange) -> Callable[[int], bool]:
+        """Predicate of an IP range criterion, checked on the integer column."""
+        version, first, last = ip_range
+        column = self.events.source_ips if field == 'source_ip' else self.events.destination_ips
+        overflow = self.events.overflow(field)
+        ip_key = self.events.ip_key
+        if version == 4 and not overflow:
+            return lambda row: first <= column[row] <= last
+        
+        def check(row: int) -> bool:
+            key = ip_key(row, field)
+            return key is not None and key[0] == version and first <= key[1] <= last
+        return check
+
+    def _criteria(
+        self,
+        threat_level: Optional[str],
+        source_ip: Optional[str],
+        event_type: Optional[str],
+        destination_ip: Optional[str] = None,
+        since: TimeBound = None,
+        until: TimeBound = None,
+        after: Optional[str] = None
+    ) -> Tuple[Optional[Sequence[int]], Callable[[int], bool], Callable[[int], bool], Optional[Sequence[int]]]:
+        """
+        Plan a query.
+        
+        The posting lists of the criteria are compared and the smallest one
+        is the candidate set, the other criteria are checked on the columns.
+        The IP criteria accept the forms of parse_ip_range, the time bounds
+        the forms of parse_time_bound and after a cursor of cursor_of.
+        
+        Returns:
+            (candidate rows or None when there are no criteria, predicate of
+            the criteria not covered by the candidates, predicate of every
+            criterion, rows of the time index between the time bounds and
+            after the cursor or None without them)
+            
+        Raises:
+            ValueError: If an IP criterion is not an IP filter, a time
+                bound is not valid or the cursor is not a cursor
+        """
+        candidates: List[Tuple[str, Sequence[int]]] = []
+        checks: Dict[str, Callable[[int], bool]] = {}
+        if threat_level:
+            candidates.append(('threat_level', self.rows_with_threat_level(threat_level)))
+            code = self.events.threat_levels.code_of(threat_level)
+            codes = self.events.threat_levels.codes
+            checks['threat_level'] = lambda row: codes[row] == code
+        if event_type:
+            candidates.append(('event_type', self.rows_with_event_type(event_type)))
+            type_code = self.events.event_types.code_of(event_type)
+            type_codes = self.events.event_types.codes
+            checks['event_type'] = lambda row: type_codes[row] == type_code
+        for field, ip_filter in (('source_ip', source_ip), ('destination_ip', destination_ip)):
+            if ip_filter:
+                ip_range = parse_ip_range(ip_filter)
+                candidates.append((field, self.rows_in_ip_range(field, ip_range)))
+                checks[field] = self._ip_check(field, ip_range)
+        window = None
+        since, until = parse_time_bound(since), parse_time_bound(until)
+        cursor = parse_cursor(after) if after else None
+        bounded = since is not None or until is not None
+        if bounded or cursor is not None:
+            # Without time bounds the events without a valid datetime (the oldest ones) are after the cursor too
+            first, last = _epoch_range(since, until) if bounded else (UNKNOWN_EPOCH, -UNKNOWN_EPOCH)
+            start, end = self._window_bounds(first, last)
+            epochs = self.events.epochs
+            if cursor is None:
+                checks['time'] = lambda row: first <= epochs[row] <= last
+            else:
+                start = max(start, self._position_after(cursor))
+                cursor_key = (-cursor[0], cursor[1])
+                checks['time'] = lambda row: first <= epochs[row] <= last and (-epochs[row], row) > cursor_key
+            window = _RowSlice(self._rows_by_time, start, end)
+            candidates.append(('time', window))
+        if not candidates:
+            return None, lambda row: True, lambda row: True, None
+        
+        selected, rows = min(candidates, key=lambda candidate: len(candidate[1]))
+        remaining = [check for name, check in checks.items() if name != selected]
+        every = list(checks.values())
+        return (rows, lambda row: all(check(row) for check in remaining), lambda row: all(check(row) for check in every),
+                window)
+
+    def query(
+        self,
+        threat_level: Optional[str] = None,
+        source_ip: Optional[str] = None,
+        event_type: Optional[str] = None,
+        destination_ip: Optional[str] = None,
+        since: TimeBound = None,
+        until: TimeBound = None,
+        after: Optional[str] = None
+    ) -> Sequence[int]:
+        """
+        Find the rows that match every given criterion.
+        
+        Only the rows of the most selective criterion are walked, so the cost
+        depends on it and not on the number of events.
+        
+        Returns:
+            Matching rows (all rows when there are no criteria)
+        """
+        rows, matches, _, _ = self._criteria(threat_level, source_ip, event_type, destination_ip, since, until, after)
+        if rows is None:
+            return range(len(self.events))
+        return [row for row in rows if matches(row)]
+
+    def newest_rows(
+        self,
+        limit: int,
+        threat_level: Optional[str] = None,
+        source_ip: Optional[str] = None,
+        event_type: Optional[str] = None,
+        destination_ip: Optional[str] = None,
+        since: TimeBound = None,
+        until: TimeBound = None,
+        after: Optional[str] = None
+    ) -> List[int]:
+        """
+        Find the newest rows that match every given criterion.
+        
+        Without criteria the time index is sliced. With criteria either the
+        time index (or the time window) is walked from the newest event and
+        the walk stops after limit matches, or the candidates are reduced
+        with a heap (top-k), whichever is expected to visit fewer rows.
+        
+        The rows are ordered by (newest epoch, row) and after resumes the
+        order after the row of a cursor (keyset pagination): the position
+        is found by bisection, so a deep page costs the same as the first.
+        
+        Returns:
+            Up to limit rows, from the newest to the oldest event
+        """
+        if limit <= 0:
+            return []
+        rows, matches, matches_every, window = self._criteria(threat_level, source_ip, event_type, destination_ip,
+                                                              since, until, after)
+        if rows is None:
+            return list(self._rows_by_time[:limit])
+        if not rows:
+            return []
+        # The time window is already sorted from the newest event
+        if rows is window:
+            return list(islice((row for row in window if matches(row)), limit))
+        
+        # A walk visits about limit * (events / candidates) rows (at most the walked ones), the heap every candidate
+        walked = self._rows_by_time if window is None else window
+        if min(len(walked) * len(rows), limit * len(self.events)) < len(rows) * len(rows):
+            return list(islice((row for row in walked if matches_every(row)), limit))
+        epochs = self.events.epochs
+        matching = (row for row in rows if matches(row))
+        return heapq.nsmallest(limit, matching, key=lambda row: (-epochs[row], row))
+
+    def newest_rows_since_version(
+        self,
+        version: int,
+        limit: int,
+        threat_level: Optional[str] = None,
+        source_ip: Optional[str] = None,
+        event_type: Optional[str] = None,
+        destination_ip: Optional[str] = None,
+        since: TimeBound = None,
+        until: TimeBound = None
+    ) -> Tuple[Optional[List[int]], bool]:
+        """
+        Find the newest rows stored after a data version that match every given criterion.
+        
+        Only the rows stored after the version are checked, so the cost
+        depends on the size of the delta and not on the number of events.
+        
+        Returns:
+            (up to limit rows from the newest to the oldest event, or None when
+            the version is not one of this snapshot; True when more rows match)
+            
+        Raises:
+            ValueError: If a criterion is not valid
+        """
+        delta = self.rows_since_version(version)
+        if delta is None:
+            return None, False
+        if not delta:
+            return [], False
+        _, _, matches_every, _ = self._criteria(threat_level, source_ip, event_type, destination_ip, since, until)
+        epochs = self.events.epochs
+        # One more row tells whether the delta was truncated
+        newest = heapq.nsmallest(max(limit, 0) + 1, (row for row in delta if matches_every(row)),
+                                 key=lambda row: (-epochs[row], row))
+        return newest[:max(limit, 0)], len(newest) > limit
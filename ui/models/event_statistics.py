@@ -0,0 +1,185 @@
+# Aggregates of the dashboard statistics, maintained incrementally as events are added
+
+from collections import Counter
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+from src.basic_functions.normalize_event_datetime import epoch_to_normalized_datetime, normalized_datetime_to_epoch
+from src.compact_events.event_batch import MISSING, UNKNOWN_EPOCH, CategoricalColumn, EventBatch
+from src.correlation.event_correlation import is_alert_event_type
+
+
+class EventStatistics:
+    """
+    Threat level and event type counters plus the newest datetime of a set of events.
+    
+    The alerts of the correlation stage summarise events that are counted
+    already, they are counted apart by alert type.
+    """
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.total_events = 0
+        self.threat_counts: Counter = Counter()
+        self.event_type_counts: Counter = Counter()
+        self.alert_counts: Counter = Counter()
+        self.last_epoch: Optional[int] = None
+        self._summary: Optional[Dict[str, Any]] = None
+    
+    def _add_epoch(self, epoch: Optional[int]) -> None:
+        if epoch is not None and epoch != UNKNOWN_EPOCH and (self.last_epoch is None or epoch > self.last_epoch):
+            self.last_epoch = epoch
+    
+    def add_event(self, event: Mapping[str, Any]) -> None:
+        """
+        Add the delta of one event.
+        
+        Args:
+            event: Processed event dictionary
+        """
+        if is_alert_event_type(event.get('event_type')):
+            self.alert_counts[event['event_type']] += 1
+            self._summary = None
+            return
+        self.total_events += 1
+        self.threat_counts[event.get('threat_level', 'Unknown')] += 1
+        self.event_type_counts[event.get('event_type', 'Unknown')] += 1
+        self._add_epoch(normalized_datetime_to_epoch(event.get('datetime')))
+        self._summary = None
+    
+    def add_events(self, events: Iterable[Mapping[str, Any]]) -> None:
+        """Add the delta of several events."""
+        for event in events:
+            self.add_event(event)
+    
+    def add_batch_rows(self, batch: EventBatch, start: int = 0) -> None:
+        """
+        Add the delta of the rows of a columnar batch from start to the end.
+        
+        The codes of the categorical columns are counted at once, so only the
+        distinct values are visited in Python.
+        
+        Args:
+            batch: Batch with the events
+            start: First row that was not counted yet
+        """
+        if start >= len(batch):
+            return
+        if self._alert_codes(batch.event_types):
+            self._count_rows(batch, range(start, len(batch)), 1)
+        else:
+            self.total_events += len(batch) - start
+            self._count_categories(batch.threat_levels, start, self.threat_counts)
+            self._count_categories(batch.event_types, start, self.event_type_counts)
+        self._add_epoch(max(batch.epochs[start:]))
+        self._summary = None
+    
+    def add_rows(self, batch: EventBatch, rows: Sequence[int]) -> None:
+        """
+        Add the delta of some rows of a columnar batch, e.g. the rows of a time window.
+        
+        Args:
+            batch: Batch with the events
+            rows: Rows that were not counted yet
+        """
+        if not rows:
+            return
+        self._count_rows(batch, rows, 1)
+        self._add_epoch(max(map(batch.epochs.__getitem__, rows)))
+    
+    def remove_rows(self, batch: EventBatch, rows: Sequence[int], last_epoch: Optional[int]) -> None:
+        """
+        Remove the delta of rows that were counted, e.g. the rows outside a time window.
+        
+        Args:
+            batch: Batch with the events
+            rows: Rows that were counted
+            last_epoch: Newest epoch of the rows that are kept, None when there are none
+        """
+        self._count_rows(batch, rows, -1)
+        for counts in (self.threat_counts, self.event_type_counts, self.alert_counts):
+            for value in [value for value, count in counts.items() if count <= 0]:
+                del counts[value]
+        self.last_epoch = None
+        self._add_epoch(last_epoch)
+    
+    def add_groups(self, groups: Iterable[Tuple[Any, Any, int, Optional[int]]]) -> None:
+        """
+        Add counts aggregated elsewhere, e.g. by the GROUP BY of a database.
+        
+        Args:
+            groups: (threat_level, event_type, number of events, newest epoch)
+                of every group of events
+        """
+        for threat_level, event_type, count, last_epoch in groups:
+            if is_alert_event_type(event_type):
+                self.alert_counts[event_type] += count
+                continue
+            self.total_events += count
+            self.threat_counts[threat_level] += count
+            self.event_type_counts[event_type] += count
+            self._add_epoch(last_epoch)
+        self._summary = None
+    
+    def copy(self) -> 'EventStatistics':
+        """Get independent statistics with the same counters."""
+        statistics = EventStatistics()
+        statistics.total_events = self.total_events
+        statistics.threat_counts = self.threat_counts.copy()
+        statistics.event_type_counts = self.event_type_counts.copy()
+        statistics.alert_counts = self.alert_counts.copy()
+        statistics.last_epoch = self.last_epoch
+        return statistics
+    
+    def _count_rows(self, batch: EventBatch, rows: Sequence[int], sign: int) -> None:
+        """Add (sign 1) or subtract (sign -1) the values of some rows, missing values count as 'Unknown'."""
+        alert_codes = self._alert_codes(batch.event_types)
+        if alert_codes:
+            type_codes, values = batch.event_types.codes, batch.event_types.values
+            alert_rows = [row for row in rows if type_codes[row] in alert_codes]
+            for code, count in Counter(map(type_codes.__getitem__, alert_rows)).items():
+                self.alert_counts[values[code]] += sign * count
+            if alert_rows:
+                rows = [row for row in rows if type_codes[row] not in alert_codes]
+        self.total_events += sign * len(rows)
+        for column, counts in ((batch.threat_levels, self.threat_counts), (batch.event_types, self.event_type_counts)):
+            for code, count in Counter(map(column.codes.__getitem__, rows)).items():
+                value = column.values[code]
+                counts['Unknown' if value is MISSING else value] += sign * count
+        self._summary = None
+    
+    @staticmethod
+    def _alert_codes(column: CategoricalColumn) -> set:
+        """Codes of the alert event types of a categorical column."""
+        return {code for code, value in enumerate(column.values) if is_alert_event_type(value)}
+    
+    @staticmethod
+    def _count_categories(column: CategoricalColumn, start: int, counts: Counter) -> None:
+        """Count the values of a categorical column, missing values count as 'Unknown'."""
+        code_counts = Counter(column.codes[start:])
+        for code, count in code_counts.items():
+            value = column.values[code]
+            counts['Unknown' if value is MISSING else value] += count
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Get the statistics in the format of the stats endpoint.
+        
+        The dictionary is cached until the next delta.
+        
+        Returns:
+            Dictionary containing event statistics
+        """
+        summary = self._summary
+        if summary is None:
+            summary = self._summary = {
+                'total_events': self.total_events,
+                'high_threat': self.threat_counts.get('High', 0),
+                'medium_threat': self.threat_counts.get('Medium', 0),
+                'low_threat': self.threat_counts.get('Low', 0),
+                'unknown_threat': self.threat_counts.get('Unknown', 0),
+                'last_updated': None if self.last_epoch is None else epoch_to_normalized_datetime(self.last_epoch),
+                'event_types': dict(self.event_type_counts.most_common(5)),
+                'alerts': sum(self.alert_counts.values()),
+                'alert_types': dict(self.alert_counts)
+            }
+        return summary
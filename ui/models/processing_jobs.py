@@ -0,0 +1,188 @@
+# Background processing jobs for the event log files, with progress reporting and cancellation
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+
+class JobCancelled(Exception):
+    """Raised by a job runner when the job was cancelled while running"""
+
+
+class ProcessingJob:
+    """State and progress of one processing job"""
+    
+    def __init__(self, file_path: str):
+        """
+        Initialize a queued job.
+        
+        Args:
+            file_path: Path to the event log file to process
+        """
+        self.job_id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.status = 'queued'
+        self.lines_read = 0
+        self.events_processed = 0
+        self.events_rejected = 0
+        self.alerts_raised = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+    
+    def add_progress(self, lines_read: int, events_processed: int, alerts_raised: int = 0,
+                     events_rejected: int = 0) -> None:
+        """
+        Add the progress of one processed block.
+        
+        Args:
+            lines_read: Lines of the block
+            events_processed: Valid events of the block
+            alerts_raised: Alert events derived by the correlation stage, they
+                are not lines of the file
+            events_rejected: Lines of the block rejected by the reader or the
+                validation (the rejected counters of the pipeline metrics),
+                the blank lines are not events
+        
+        Raises:
+            JobCancelled: If the job was cancelled, so the runner stops between blocks
+        """
+        self.lines_read += lines_read
+        self.events_processed += events_processed
+        self.events_rejected += events_rejected
+        self.alerts_raised += alerts_raised
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.job_id)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the job state in the format of the API."""
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            'job_id': self.job_id,
+            'file_path': self.file_path,
+            'status': self.status,
+            'lines_read': self.lines_read,
+            'events_processed': self.events_processed,
+            'events_rejected': self.events_rejected,
+            'alerts_raised': self.alerts_raised,
+            'elapsed_seconds': None if elapsed is None else round(elapsed, 3),
+            'events_per_second': round(self.events_processed / elapsed, 1) if elapsed else None,
+            'error': self.error
+        }
+
+
+class ProcessingJobManager:
+    """Bounded executor of processing jobs"""
+    
+    def __init__(
+        self,
+        runner: Callable[[ProcessingJob], None],
+        max_concurrent_jobs: int = 2,
+        max_queued_jobs: int = 10,
+        max_finished_jobs: int = 100
+    ):
+        """
+        Initialize the manager.
+        
+        Args:
+            runner: Function that processes a job, it reports progress with
+                job.add_progress and lets JobCancelled propagate
+            max_concurrent_jobs: Number of jobs running at the same time
+            max_queued_jobs: Number of jobs waiting for a free worker
+            max_finished_jobs: Number of finished jobs kept for the status endpoint
+        """
+        self.runner = runner
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_queued_jobs = max_queued_jobs
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix='processing-job')
+        self._jobs: 'OrderedDict[str, ProcessingJob]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def submit(self, file_path: str) -> ProcessingJob:
+        """
+        Enqueue a job.
+        
+        Returns:
+            The queued job
+            
+        Raises:
+            RuntimeError: If the queue is full
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status in ('queued', 'running'))
+            if pending >= self.max_concurrent_jobs + self.max_queued_jobs:
+                raise RuntimeError(f"Too many pending jobs ({pending}), try again later")
+            job = ProcessingJob(file_path)
+            self._jobs[job.job_id] = job
+            self._forget_finished_jobs()
+            job.future = self._executor.submit(self._run, job)
+        return job
+    
+    def _run(self, job: ProcessingJob) -> None:
+        """Run a job in a worker thread and record its final status."""
+        if job.cancel_event.is_set():
+            job.status = 'cancelled'
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            self.runner(job)
+            job.status = 'completed'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+    
+    def _forget_finished_jobs(self) -> None:
+        """Drop the oldest finished jobs above max_finished_jobs."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ('queued', 'running')]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+    
+    def get(self, job_id: str) -> Optional[ProcessingJob]:
+        """Get a job by id, None if it is unknown."""
+        return self._jobs.get(job_id)
+    
+    def list_jobs(self) -> List[ProcessingJob]:
+        """Get the known jobs, from the oldest to the newest."""
+        return list(self._jobs.values())
+    
+    def cancel(self, job_id: str) -> Optional[ProcessingJob]:
+        """
+        Cancel a job.
+        
+        A queued job never starts, a running job stops after its current block.
+        
+        Returns:
+            The job, None if it is unknown
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+        return job
+    
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[ProcessingJob]:
+        """Block until a job finishes, mainly for scripts and tests."""
+        job = self._jobs.get(job_id)
+        if job is not None and job.future is not None:
+            try:
+                job.future.result(timeout)
+            except Exception:
+                pass
+        return job
@@ -1,15 +1,24 @@
 # Controller layer - Route handlers for SIEM event dashboard
 
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, Response, current_app, render_template, jsonify, request
 import sys
 import os
+import threading
+from typing import Optional
 
 # Add parent directory to path to import from src
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
+from ui.models.event_broadcaster import format_sse_message
 from ui.models.event_model import EventModel
-from src.complex_processor_functions.combined_processor_functions import combine_read_file_normalize_timestamp_add_threat_level
-import json
+from ui.models.event_snapshot import parse_time_bound
+from ui.models.processing_jobs import ProcessingJob, ProcessingJobManager
+from src.complex_processor_functions.combined_processor_functions import (correlate_processed_events,
+                                                                         stream_read_file_blocks_normalize_timestamp_add_threat_level)
+from src.compact_events.event_batch import EventBatch
+from src.compact_events.event_file_formats import ProcessedEventsWriter
+from src.correlation.event_correlation import EventCorrelator
+from src.instrumentation import pipeline_metrics
 
 
 # Create blueprint
@@ -18,6 +27,86 @@ event_bp = Blueprint('events', __name__)
 # Initialize model
 event_model = EventModel()
 
+# Processing jobs, the manager is created with the app configuration on the first request
+job_manager = None
+_job_manager_lock = threading.Lock()
+_output_lock = threading.Lock()
+
+
+def run_processing_job(job: ProcessingJob):
+    """Process the file of a job block by block and publish the result."""
+    # The correlation windows span the whole file, the alerts of a block follow its events
+    correlator = EventCorrelator()
+    # The rejected lines of a block are the difference of the rejected counters of the
+    # pipeline metrics, the ones of this worker thread as the jobs share the registry
+    metrics = pipeline_metrics.PIPELINE_METRICS
+    rejected = metrics.thread_rejected()
+    if event_model.store is not None:
+        # The history accumulates in the store: every block is inserted in its own
+        # transaction and published in the live feed as soon as it is processed
+        for lines_read, events in stream_read_file_blocks_normalize_timestamp_add_threat_level(job.file_path):
+            correlated_events = correlate_processed_events(events, correlator)
+            event_model.append_events(correlated_events)
+            block_rejected = metrics.thread_rejected() - rejected
+            rejected += block_rejected
+            job.add_progress(lines_read, len(events), len(correlated_events) - len(events), block_rejected)
+        return
+    
+    # The events are written to the data file as they are processed (the format follows
+    # its extension) and kept in a compact batch for the model
+    processed_events = EventBatch()
+    with ProcessedEventsWriter(event_model.data_file) as writer:
+        for lines_read, events in stream_read_file_blocks_normalize_timestamp_add_threat_level(job.file_path):
+            correlated_events = correlate_processed_events(events, correlator)
+            writer.write_events(correlated_events)
+            processed_events.extend(correlated_events)
+            block_rejected = metrics.thread_rejected() - rejected
+            rejected += block_rejected
+            job.add_progress(lines_read, len(events), len(correlated_events) - len(events), block_rejected)
+        
+        # Publish the file and hand the new events to the model together,
+        # so the statistics are built from them instead of reloading the file
+        with _output_lock:
+            writer.close()
+            event_model.replace_events(processed_events)
+
+
+def get_job_manager() -> ProcessingJobManager:
+    """Get the processing job manager, creating it on first use."""
+    global job_manager
+    with _job_manager_lock:
+        if job_manager is None:
+            job_manager = ProcessingJobManager(
+                run_processing_job,
+                max_concurrent_jobs=current_app.config.get('PROCESS_MAX_CONCURRENT_JOBS', 2),
+                max_queued_jobs=current_app.config.get('PROCESS_MAX_QUEUED_JOBS', 10)
+            )
+    return job_manager
+
+
+def data_etag(version: int, since: Optional[int], until: Optional[int]) -> str:
+    """
+    ETag of a response built from the events: the data version and the time bounds.
+    
+    The other parameters are part of the URL. Relative bounds (15m) are
+    resolved first, so the ETag changes as the window moves.
+    """
+    return f'{version}-{since}-{until}'
+
+
+def not_modified(etag: str):
+    """Return a 304 response when the client already has the ETag (If-None-Match), None otherwise."""
+    if not request.if_none_match.contains(etag):
+        return None
+    return revalidated(Response(status=304), etag)
+
+
+def revalidated(response: Response, etag: str) -> Response:
+    """Set the ETag of a response and ask the browsers to revalidate it before using their copy."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 
 @event_bp.route('/')
 def dashboard():
@@ -32,37 +121,218 @@ def get_events():
     
     Query parameters:
         - threat_level: Filter by threat level
-        - source_ip: Filter by source IP
+        - source_ip / source_cidr: Filter by source IP, an address, a CIDR block
+          (10.0.0.0/8), a range (10.0.0.1-10.0.0.99) or leading octets (10.0.)
+        - destination_ip / destination_cidr: Filter by destination IP, same forms
         - event_type: Filter by event type
+        - since / until: Time window, an epoch, a duration before now (15m, 2h, 7d)
+          or a datetime (2024-09-01 10:00:00, UTC without timezone)
         - limit: Maximum number of events (default: 100)
+        - cursor: next_cursor of the previous response, to get the next page
+          (keep the same filters)
+    
+    The response has the data version ("version", and "version" of every event)
+    for /api/events/since, and an ETag: a request with If-None-Match gets 304
+    while the data did not change.
     """
     threat_level = request.args.get('threat_level')
-    source_ip = request.args.get('source_ip')
+    source_ip = request.args.get('source_cidr') or request.args.get('source_ip')
+    destination_ip = request.args.get('destination_cidr') or request.args.get('destination_ip')
     event_type = request.args.get('event_type')
     limit = int(request.args.get('limit', 100))
     
-    events = event_model.filter_events(
-        threat_level=threat_level,
-        source_ip=source_ip,
-        event_type=event_type,
-        limit=limit
-    )
+    try:
+        since = parse_time_bound(request.args.get('since'))
+        until = parse_time_bound(request.args.get('until'))
+        # The version is taken before the query, a concurrent append can only make it older than the events
+        version = event_model.get_data_version()
+        etag = data_etag(version, since, until)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        events, next_cursor = event_model.get_events_page(
+            threat_level=threat_level,
+            source_ip=source_ip,
+            event_type=event_type,
+            limit=limit,
+            destination_ip=destination_ip,
+            since=since,
+            until=until,
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     
-    return jsonify({
+    return revalidated(jsonify({
         'success': True,
+        'version': version,
         'count': len(events),
-        'events': events
+        'events': events,
+        'next_cursor': next_cursor
+    }), etag)
+
+
+@event_bp.route('/api/events/since')
+def get_events_since():
+    """
+    Get the events stored after a data version (delta sync).
+    
+    Query parameters:
+        - version: Data version the client has (required), the "version" of
+          a previous response
+        - threat_level, source_ip / source_cidr, destination_ip / destination_cidr,
+          event_type, since / until: Same filters as /api/events
+        - limit: Maximum number of events (default: 500)
+    
+    Returns the current version and the newer matching events (newest first).
+    "truncated" is true when more events matched than limit, "reset" when the
+    version is not known anymore (the events were replaced): in both cases the
+    client loads /api/events again.
+    """
+    try:
+        version = int(request.args['version'])
+    except (KeyError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': "The 'version' parameter is required and must be an integer"
+        }), 400
+    
+    try:
+        delta = event_model.get_events_since(
+            version,
+            threat_level=request.args.get('threat_level'),
+            source_ip=request.args.get('source_cidr') or request.args.get('source_ip'),
+            event_type=request.args.get('event_type'),
+            limit=int(request.args.get('limit', 500)),
+            destination_ip=request.args.get('destination_cidr') or request.args.get('destination_ip'),
+            since=request.args.get('since'),
+            until=request.args.get('until')
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'count': len(delta['events']),
+        **delta
     })
 
 
 @event_bp.route('/api/events/stats')
 def get_statistics():
-    """Get event statistics"""
-    stats = event_model.get_event_statistics()
-    return jsonify({
+    """
+    Get event statistics.
+    
+    Query parameters:
+        - since / until: Only count the events of a time window, same forms as /api/events
+    
+    The response has an ETag, a request with If-None-Match gets 304 while the
+    data did not change.
+    """
+    try:
+        since = parse_time_bound(request.args.get('since'))
+        until = parse_time_bound(request.args.get('until'))
+        etag = data_etag(event_model.get_data_version(), since, until)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        stats = event_model.get_event_statistics(since=since, until=until)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    return revalidated(jsonify({
         'success': True,
         'statistics': stats
-    })
+    }), etag)
+
+
+@event_bp.route('/api/events/timeseries')
+def get_timeseries():
+    """
+    Get the number of events per time bucket, by threat level and by event type.
+    
+    Query parameters:
+        - bucket: Width of the buckets, 1m, 1h, 1d or a multiple such as 15m or 6h (default: 1h)
+        - since / until: Time window, same forms as /api/events
+    
+    Served from the rollups maintained as the events are processed, the cost is
+    the number of buckets returned. The response has an ETag, a request with
+    If-None-Match gets 304 while the data did not change.
+    """
+    bucket = request.args.get('bucket', '1h')
+    try:
+        since = parse_time_bound(request.args.get('since'))
+        until = parse_time_bound(request.args.get('until'))
+        etag = f"{data_etag(event_model.get_data_version(), since, until)}-{bucket}"
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        timeseries = event_model.get_event_timeseries(bucket=bucket, since=since, until=until)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    return revalidated(jsonify({
+        'success': True,
+        'timeseries': timeseries
+    }), etag)
+
+
+@event_bp.route('/api/events/stream')
+def stream_events():
+    """
+    Live feed of the processed events (Server-Sent Events).
+    
+    Every client reads the shared buffer of the model broadcaster from its own
+    position, a client that falls too far behind skips the pending messages.
+    
+    Messages:
+        - ready: sent on connection, {"resumed": true} when the client reconnected
+          with its Last-Event-ID, the missed messages follow (or a resync when
+          they are no longer buffered); otherwise the client loads the events
+        - events: {"count", "events" (newest first), "statistics"} of appended events
+        - resync: the client missed messages or the events were replaced,
+          it has to load the events and statistics again
+    
+    A comment is sent every EVENT_STREAM_HEARTBEAT_SECONDS without messages,
+    the data file (or store) is checked for changes meanwhile.
+    """
+    heartbeat = current_app.config.get('EVENT_STREAM_HEARTBEAT_SECONDS', 15)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    broadcaster = event_model.broadcaster
+    
+    def generate():
+        # The subscription is taken when the response starts, so it is always closed by the finally
+        subscription = broadcaster.subscribe(last_event_id)
+        try:
+            resumed = last_event_id is not None and subscription.position == last_event_id + 1
+            yield 'retry: 3000\n\n' + format_sse_message(subscription.position - 1, 'ready', {'resumed': resumed})
+            while True:
+                messages = subscription.next_messages(heartbeat)
+                if messages:
+                    yield ''.join(messages)
+                else:
+                    # Events written by another process are published as a resync
+                    event_model.refresh()
+                    yield ': keep-alive\n\n'
+        finally:
+            subscription.close()
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @event_bp.route('/api/events/recent')
@@ -78,33 +348,78 @@ def get_recent():
     })
 
 
+@event_bp.route('/api/metrics')
+def get_metrics():
+    """
+    Get the aggregated metrics of the processing pipeline.
+    
+    Query parameters:
+        - reset: When "true", the counters are reset after they are read
+    """
+    metrics = pipeline_metrics.get_pipeline_metrics()
+    if request.args.get('reset', '').lower() == 'true':
+        pipeline_metrics.reset_pipeline_metrics()
+    return jsonify({
+        'success': True,
+        'metrics': metrics
+    })
+
+
 @event_bp.route('/api/process', methods=['POST'])
 def process_events():
     """
-    Trigger event processing.
+    Enqueue an event processing job.
     
     Expects JSON body with:
         - file_path: Path to the event log file
+    
+    Returns 202 with the job id, the progress is available in /api/process/<job_id>.
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         file_path = data.get('file_path', 'events_siem.txt')
         
-        # Process events using existing function
-        processed_events = combine_read_file_normalize_timestamp_add_threat_level(file_path)
-        
-        # Save to JSON file
-        with open('processed_events.json', 'w', encoding='utf-8') as f:
-            json.dump(processed_events, f, indent=2)
+        if not os.path.isfile(file_path):
+            return jsonify({
+                'success': False,
+                'error': f"The file '{file_path}' was not found"
+            }), 400
         
+        job = get_job_manager().submit(file_path)
         return jsonify({
             'success': True,
-            'message': f'Processed {len(processed_events)} events',
-            'count': len(processed_events)
-        })
+            'message': f'Processing job {job.job_id} queued',
+            'job_id': job.job_id,
+            'status_url': f'/api/process/{job.job_id}',
+            'job': job.to_dict()
+        }), 202
+    
+    except RuntimeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 429
     
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+
+
+@event_bp.route('/api/process/<job_id>')
+def get_process_job(job_id):
+    """Get the status and progress of a processing job"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Unknown job {job_id}'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@event_bp.route('/api/process/<job_id>', methods=['DELETE'])
+def cancel_process_job(job_id):
+    """Cancel a queued or running processing job"""
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Unknown job {job_id}'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
@@ -4,25 +4,219 @@
 const API = {
     events: '/api/events',
     stats: '/api/events/stats',
-    recent: '/api/events/recent'
+    since: '/api/events/since',
+    recent: '/api/events/recent',
+    stream: '/api/events/stream'
 };
 
+// Filters of the events shown, cursor of their next page, the events and the data version they were loaded at
+let currentFilters = {};
+let nextCursor = null;
+let shownEvents = [];
+let currentVersion = null;
+
+// Events kept in the view (the loaded pages), the merged newer events push the oldest ones out. Once rows were pushed
+// out the cursor follows a row that is not shown anymore, the next page is loaded with the whole window again
+let shownLimit = 0;
+let windowTrimmed = false;
+
+// The statistics of a time window are loaded again at most once per this delay while events are pushed
+const STATISTICS_REFRESH_MS = 2000;
+let statisticsTimer = null;
+
+// Relative time bounds of the time filter ("15m" is 15 minutes before now), as on the server
+const DURATION_SECONDS = { s: 1, m: 60, h: 3600, d: 86400, w: 604800 };
+
 // Initialize dashboard on page load
 document.addEventListener('DOMContentLoaded', () => {
-    loadStatistics();
-    loadEvents();
     setupEventListeners();
+    if (window.EventSource) {
+        // The events are loaded when the live feed is ready, so no update is missed
+        connectLiveFeed();
+    } else {
+        loadStatistics();
+        loadEvents();
+    }
 });
 
+// Receive the new events and statistics pushed by the server instead of polling
+function connectLiveFeed() {
+    const source = new EventSource(API.stream);
+
+    // A reconnection that resumed from the last message does not need to load again
+    source.addEventListener('ready', (e) => {
+        if (!JSON.parse(e.data).resumed) applyFilters();
+    });
+
+    // Missed messages or replaced events: load the current view again
+    source.addEventListener('resync', () => applyFilters());
+
+    source.addEventListener('events', (e) => showLiveEvents(JSON.parse(e.data)));
+}
+
+// Add the pushed events to the table and update the statistics. The filters are applied here to the pushed events,
+// the server is only asked for the delta when the message does not have every new event or a filter is not understood
+function showLiveEvents(data) {
+    const complete = data.count === data.events.length;
+    const matches = eventFilter(currentFilters);
+
+    if (!currentFilters.since) {
+        showStatistics(data.statistics);
+    } else if (!complete || !matches || data.events.some(matches)) {
+        // The statistics of the time window only change with the events inside it
+        scheduleStatistics();
+    }
+
+    // The message follows the version shown and has every new event: merge the ones of the filters
+    if (matches && complete && data.from_version === currentVersion) {
+        mergeEvents(data.events.filter(matches), data.version);
+    } else {
+        syncEvents();
+    }
+}
+
+// Load the statistics of the time window after STATISTICS_REFRESH_MS, the pushes in between share the request
+function scheduleStatistics() {
+    if (statisticsTimer !== null) return;
+    statisticsTimer = setTimeout(() => {
+        statisticsTimer = null;
+        loadStatistics(currentFilters.since);
+    }, STATISTICS_REFRESH_MS);
+}
+
+// Predicate of the events of the filters, null when a filter is only understood by the server (e.g. an IPv6 range
+// or a datetime bound)
+function eventFilter(filters) {
+    const checks = [];
+    if (filters.threat_level) {
+        checks.push(event => event.threat_level === filters.threat_level);
+    }
+    if (filters.source_ip) {
+        const range = ipv4Range(filters.source_ip);
+        if (range === null) return null;
+        checks.push(event => {
+            const address = ipv4ToNumber(event.source_ip || '');
+            return address !== null && range[0] <= address && address <= range[1];
+        });
+    }
+    if (filters.since) {
+        const since = timeBound(filters.since);
+        if (since === null) return null;
+        checks.push(event => event.datetime_epoch !== undefined && event.datetime_epoch >= since);
+    }
+    return (event) => checks.every(check => check(event));
+}
+
+// Address of an IPv4 text as a number, null when it is not one
+function ipv4ToNumber(text) {
+    const octets = text.split('.');
+    if (octets.length !== 4 || !octets.every(octet => /^(0|[1-9]\d{0,2})$/.test(octet) && Number(octet) <= 255)) {
+        return null;
+    }
+    return octets.reduce((address, octet) => address * 256 + Number(octet), 0);
+}
+
+// [first, last] address of an IPv4 filter in the forms of the server: an address, a CIDR block, a range or the
+// leading octets ("10.1" is 10.1.0.0/16), null for any other filter
+function ipv4Range(text) {
+    text = text.trim();
+    if (text.includes('-')) {
+        const separator = text.indexOf('-');
+        const first = ipv4ToNumber(text.slice(0, separator).trim());
+        const last = ipv4ToNumber(text.slice(separator + 1).trim());
+        return first === null || last === null || first > last ? null : [first, last];
+    }
+    let [address, bits] = text.split('/');
+    if (bits === undefined) {
+        const octets = (address.endsWith('.') ? address.slice(0, -1) : address).split('.');
+        if (octets.length < 4) {
+            address = octets.concat(Array(4 - octets.length).fill('0')).join('.');
+            bits = String(8 * octets.length);
+        } else {
+            bits = '32';
+        }
+    }
+    const first = ipv4ToNumber(address);
+    if (first === null || !/^\d{1,2}$/.test(bits) || Number(bits) > 32) return null;
+    const size = 2 ** (32 - Number(bits));
+    const network = first - (first % size);
+    return [network, network + size - 1];
+}
+
+// Epoch of a time bound given as an epoch or a duration before now, null for the other forms
+function timeBound(text) {
+    text = String(text).trim();
+    if (/^-?\d+$/.test(text)) return Number(text);
+    const duration = /^(\d+)\s*([smhdw])$/.exec(text);
+    if (!duration) return null;
+    return Math.floor(Date.now() / 1000) - Number(duration[1]) * DURATION_SECONDS[duration[2]];
+}
+
+// Get only the events stored after the version shown, the full view is loaded again when the delta is not enough
+async function syncEvents() {
+    if (currentVersion === null) {
+        applyFilters();
+        return;
+    }
+    try {
+        const params = filterParams(currentFilters);
+        params.append('version', currentVersion);
+        const response = await fetch(`${API.since}?${params.toString()}`);
+        const data = await response.json();
+
+        if (!data.success || data.reset || data.truncated) {
+            applyFilters();
+        } else {
+            mergeEvents(data.events, data.version);
+        }
+    } catch (error) {
+        console.error('Error loading new events:', error);
+    }
+}
+
+// Merge newer events into the events shown, in the order of the server (newest datetime, then version)
+function mergeEvents(events, version) {
+    currentVersion = Math.max(currentVersion, version);
+    const known = new Set(shownEvents.map(event => event.version));
+    const added = events.filter(event => !known.has(event.version));
+    if (added.length === 0) return;
+
+    const epoch = (event) => (event.datetime_epoch === undefined ? -Infinity : event.datetime_epoch);
+    shownEvents = shownEvents.concat(added).sort((a, b) => (epoch(b) - epoch(a)) || (a.version - b.version));
+    if (shownEvents.length > shownLimit) {
+        shownEvents = shownEvents.slice(0, shownLimit);
+        windowTrimmed = true;
+        document.getElementById('loadMore').hidden = false;
+    }
+    displayEvents(shownEvents);
+    document.getElementById('eventCount').textContent = `${shownEvents.length} events`;
+}
+
+// Events per page of the filters
+function pageLimit(filters) {
+    return Number(filters.limit) || 100;
+}
+
+// Load the next page, or the window with one more page when newer events pushed rows out of it
+function loadMoreEvents() {
+    if (windowTrimmed) {
+        loadEvents(currentFilters, null, shownLimit + pageLimit(currentFilters));
+    } else {
+        loadEvents(currentFilters, nextCursor);
+    }
+}
+
 // Setup event listeners
 function setupEventListeners() {
+    // Refresh only downloads what changed: the new events and the statistics when they changed (ETag)
     document.getElementById('refreshBtn').addEventListener('click', () => {
-        loadStatistics();
-        loadEvents();
+        loadStatistics(currentFilters.since);
+        syncEvents();
     });
 
     document.getElementById('applyFilters').addEventListener('click', applyFilters);
     document.getElementById('clearFilters').addEventListener('click', clearFilters);
+    document.getElementById('loadMore').addEventListener('click', loadMoreEvents);
 
     // Apply filters on Enter key
     document.getElementById('ipFilter').addEventListener('keypress', (e) => {
@@ -30,25 +224,15 @@ function setupEventListeners() {
     });
 }
 
-// Load statistics from API
-async function loadStatistics() {
+// Load statistics from API, of the events since a time bound when given
+async function loadStatistics(since = '') {
     try {
-        const response = await fetch(API.stats);
+        const url = since ? `${API.stats}?since=${encodeURIComponent(since)}` : API.stats;
+        const response = await fetch(url);
         const data = await response.json();
 
         if (data.success) {
-            const stats = data.statistics;
-
-            // Update stat cards
-            document.getElementById('totalEvents').textContent = stats.total_events;
-            document.getElementById('highThreat').textContent = stats.high_threat;
-            document.getElementById('mediumThreat').textContent = stats.medium_threat;
-            document.getElementById('lowThreat').textContent = stats.low_threat;
-
-            // Update last updated time
-            if (stats.last_updated) {
-                document.getElementById('lastUpdated').textContent = stats.last_updated;
-            }
+            showStatistics(data.statistics);
         }
     } catch (error) {
         console.error('Error loading statistics:', error);
@@ -56,22 +240,58 @@ async function loadStatistics() {
     }
 }
 
-// Load events from API
-async function loadEvents(filters = {}) {
+// Update stat cards
+function showStatistics(stats) {
+    document.getElementById('totalEvents').textContent = stats.total_events;
+    document.getElementById('highThreat').textContent = stats.high_threat;
+    document.getElementById('mediumThreat').textContent = stats.medium_threat;
+    document.getElementById('lowThreat').textContent = stats.low_threat;
+
+    // Update last updated time
+    if (stats.last_updated) {
+        document.getElementById('lastUpdated').textContent = stats.last_updated;
+    }
+}
+
+// Query string of the filters
+function filterParams(filters) {
+    const params = new URLSearchParams();
+    if (filters.threat_level) params.append('threat_level', filters.threat_level);
+    if (filters.source_ip) params.append('source_ip', filters.source_ip);
+    if (filters.since) params.append('since', filters.since);
+    return params;
+}
+
+// Load events from API, a cursor appends the next page to the events already shown. The first page has the
+// events of the limit filter, or "windowSize" events to load the window shown again
+async function loadEvents(filters = {}, cursor = null, windowSize = null) {
     try {
         // Build query string
-        const params = new URLSearchParams();
-        if (filters.threat_level) params.append('threat_level', filters.threat_level);
-        if (filters.source_ip) params.append('source_ip', filters.source_ip);
-        if (filters.limit) params.append('limit', filters.limit);
+        const limit = windowSize || pageLimit(filters);
+        const params = filterParams(filters);
+        if (cursor) params.append('cursor', cursor);
+        params.append('limit', limit);
 
         const url = `${API.events}?${params.toString()}`;
         const response = await fetch(url);
         const data = await response.json();
 
         if (data.success) {
-            displayEvents(data.events);
-            document.getElementById('eventCount').textContent = `${data.count} events`;
+            currentFilters = filters;
+            nextCursor = data.next_cursor;
+            shownLimit = cursor ? shownLimit + limit : limit;
+            windowTrimmed = false;
+            if (cursor) {
+                shownEvents = shownEvents.concat(data.events);
+            } else {
+                shownEvents = data.events;
+                currentVersion = data.version;
+            }
+            displayEvents(data.events, cursor ? 'append' : 'replace');
+            document.getElementById('eventCount').textContent = `${shownEvents.length} events`;
+            document.getElementById('loadMore').hidden = !nextCursor;
+        } else {
+            showError(data.error || 'Failed to load events');
         }
     } catch (error) {
         console.error('Error loading events:', error);
@@ -79,16 +299,16 @@ async function loadEvents(filters = {}) {
     }
 }
 
-// Display events in table
-function displayEvents(events) {
+// Display events in table: replace the rows shown or append them (next page)
+function displayEvents(events, mode = 'replace') {
     const tbody = document.getElementById('eventsTableBody');
 
     if (events.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="7" class="loading">No events found</td></tr>';
+        if (mode === 'replace') tbody.innerHTML = '<tr><td colspan="7" class="loading">No events found</td></tr>';
         return;
     }
 
-    tbody.innerHTML = events.map(event => `
+    const rows = events.map(event => `
         <tr>
             <td>${event.datetime || 'N/A'}</td>
             <td>${event.source_ip || 'N/A'}</td>
@@ -99,6 +319,11 @@ function displayEvents(events) {
             <td>${getThreatBadge(event.threat_level)}</td>
         </tr>
     `).join('');
+    if (mode === 'append') {
+        tbody.insertAdjacentHTML('beforeend', rows);
+    } else {
+        tbody.innerHTML = rows;
+    }
 }
 
 // Get threat level badge HTML
@@ -121,9 +346,11 @@ function applyFilters() {
     const filters = {
         threat_level: document.getElementById('threatFilter').value,
         source_ip: document.getElementById('ipFilter').value.trim(),
+        since: document.getElementById('timeFilter').value,
         limit: document.getElementById('limitFilter').value
     };
 
+    loadStatistics(filters.since);
     loadEvents(filters);
 }
 
@@ -131,18 +358,15 @@ function applyFilters() {
 function clearFilters() {
     document.getElementById('threatFilter').value = '';
     document.getElementById('ipFilter').value = '';
+    document.getElementById('timeFilter').value = '';
     document.getElementById('limitFilter').value = '100';
+    loadStatistics();
     loadEvents();
 }
 
 // Show error message
 function showError(message) {
+    document.getElementById('loadMore').hidden = true;
     const tbody = document.getElementById('eventsTableBody');
     tbody.innerHTML = `<tr><td colspan="7" class="loading" style="color: #ef4444;">${message}</td></tr>`;
 }
-
-// Auto-refresh every 30 seconds (optional)
-// setInterval(() => {
-//     loadStatistics();
-//     loadEvents();
-// }, 30000);